@@ -0,0 +1,3 @@
+class InvalidQueryException(Exception):
+    def __init__(self, detail: str):
+        self.detail = detail
@@ -0,0 +1,41 @@
+import os
+
+# Folder with the claim PDFs and the locations derived from it
+FOLDER_PATH = r"C:\Users\hitesh.paliwal\Downloads\VCI - claims PDF"
+OUTPUT_JSON_PATH = os.path.join(FOLDER_PATH, "Extracted_Json_Files")
+JOBS_FOLDER = os.path.join(OUTPUT_JSON_PATH, "jobs")
+
+BATCH_SIZE = 5  # Documents per ExtractedData_Batch file
+
+# Extraction concurrency (see app.services.scheduler). Every OCR worker runs one single-threaded
+# Tesseract at a time, so by default the number of Tesseract processes matches the number of cores.
+# OCR_WORKERS sizes the process pool shared by every extraction in this process; it is created on
+# first use and keeps that size until shutdown. 0 picks the default from the core count.
+# Pages are rendered by a single thread: PyMuPDF must not be used from several threads at once.
+CPU_COUNT = os.cpu_count() or 1
+OCR_WORKERS = int(os.environ.get("OCR_WORKERS", "0")) or CPU_COUNT
+PREPROCESS_WORKERS = int(os.environ.get("PREPROCESS_WORKERS", "0")) or max(1, CPU_COUNT // 4)
+RENDER_QUEUE_SIZE = int(os.environ.get("RENDER_QUEUE_SIZE", "0")) or 2 * OCR_WORKERS  # Rendered pages waiting for preprocessing
+OCR_QUEUE_SIZE = int(os.environ.get("OCR_QUEUE_SIZE", "0")) or 2 * OCR_WORKERS  # Binarized pages waiting for a Tesseract slot
+# Tesseract slots the deferred full-text pass may use
+BACKGROUND_OCR_WORKERS = int(os.environ.get("BACKGROUND_OCR_WORKERS", "0")) or max(1, OCR_WORKERS // 4)
+
+# Adaptive resolution (off by default): OCR at the normal DPI, then re-OCR at high DPI only the lines
+# whose Tesseract word confidence (0-100) is below LOW_CONFIDENCE. Adaptive page text is rebuilt from
+# Tesseract's words, so runs of spaces in the layout collapse to one.
+ADAPTIVE_OCR = os.environ.get("ADAPTIVE_OCR", "false").lower() in ("1", "true", "yes")
+LOW_CONFIDENCE = int(os.environ.get("LOW_CONFIDENCE", "60"))
+
+# OCR backend: "tesserocr" keeps a Tesseract handle per worker, "pytesseract" runs the tesseract
+# binary per page, "auto" uses tesserocr when it is installed
+OCR_BACKEND = os.environ.get("OCR_BACKEND", "auto")
+TESSDATA_PATH = os.environ.get("TESSDATA_PREFIX")  # None lets Tesseract find its own model files
+
+# Upper bound of the OCR page cache kept next to the extracted data; least recently used pages are evicted
+PAGE_CACHE_MAX_MB = int(os.environ.get("PAGE_CACHE_MAX_MB", "256"))
+
+# Parallel search: the extracted documents are partitioned across SEARCH_WORKERS processes, each
+# keeping the decoded text of its partition in memory up to SEARCH_SHARD_MAX_MB. 0 answers searches
+# from the SQLite index instead.
+SEARCH_WORKERS = int(os.environ.get("SEARCH_WORKERS", "0"))
+SEARCH_SHARD_MAX_MB = int(os.environ.get("SEARCH_SHARD_MAX_MB", "512"))
@@ -3,7 +3,7 @@ from fastapi import FastAPI
 from starlette.responses import JSONResponse
 
 from app.Exception.NoMatchFoundException import NoMatchFoundException
-from app.resources import claim
+from app.resources import claim, jobs
 
 app = FastAPI(
     title="Claims Document Extraction API",
@@ -12,6 +12,11 @@ app = FastAPI(
 )
 
 app.include_router(claim.router)
+app.include_router(jobs.router)
+
+@app.on_event("startup")
+def resume_extraction_jobs():
+    jobs.job_manager.resume()
 
 @app.exception_handler(NoMatchFoundException)
 async def no_match_found_exception_handler(request: Request, exc: NoMatchFoundException):
@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import Dict, Optional
 from pydantic import BaseModel, Field
 
 class SearchRequest(BaseModel):
@@ -7,3 +7,11 @@ class SearchRequest(BaseModel):
     Contract: Optional[str] = Field(None, alias="Contract #")
     Claim: Optional[str] = Field(None, alias="Claim #")
     searchbyany: Optional[str] = Field(None, alias="Search by Word")
+    # How the fields combine: "or" (a document matching any field) or "and" (every field)
+    Operator: Optional[str] = None
+    # Match mode per field, keyed like the fields above, e.g. {"VIN": "exact", "Search by Word": "word"}
+    MatchModes: Optional[Dict[str, str]] = None
+
+    def criteria(self) -> Dict[str, str]:
+        """The search fields that were given."""
+        return {k: v for k, v in self.dict(exclude={"Operator", "MatchModes"}).items() if v}
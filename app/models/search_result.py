@@ -1,8 +1,26 @@
 from pydantic import BaseModel
-from typing import List
+from typing import Dict, List, Optional
+
+class PageHit(BaseModel):
+    Field: str
+    Page: int  # 1-based
+    Start: int  # Character offsets within the page text
+    End: int
+    Snippet: str  # The hit with some surrounding page text, whitespace collapsed
+
+class FileMatch(BaseModel):
+    File: str
+    Reasons: List[str]  # The search fields this file satisfied, with their match mode and value
+    Hits: List[PageHit]  # At most MAX_HITS_PER_FILE
+    HitCount: int
 
 class SearchResult(BaseModel):
     ExtractionStatus: str
     Message: str
     Summary: str
+    ResultSetId: Optional[str] = None
+    Timings: Optional[Dict[str, float]] = None  # Milliseconds per search step, when requested
     files: List[str]
+    Matches: Optional[List[FileMatch]] = None
+    MatchCount: Optional[int] = None  # Files matched in total, across all pages
+    NextCursor: Optional[str] = None  # Pass to /results/{ResultSetId}/matches for the next page
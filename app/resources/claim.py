@@ -1,98 +1,286 @@
-import os
-import tempfile
-import zipfile
+import json
+import time
+import itertools
 
 from fastapi import APIRouter, Query, HTTPException, Body
-from typing import List
+from typing import List, Optional
 
-from starlette.responses import FileResponse
+from starlette.responses import Response, StreamingResponse
 
+from app.config import BATCH_SIZE, FOLDER_PATH, OUTPUT_JSON_PATH
 from app.models.search_request import SearchRequest
+from app.Exception.InvalidQueryException import InvalidQueryException
 from app.Exception.NoMatchFoundException import NoMatchFoundException
-from app.services.process_all_pdfs import process_all_pdfs
-from app.services.search import search_claim_documents
+from app.resources.jobs import job_manager
+from app.services import metrics
+from app.services.page_cache import all_page_cache_stats
+from app.services.query_cache import query_cache
+from app.services.result_sets import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, ResultSet, page_size, result_sets
+from app.services.search import (
+    check_documents, iter_claim_matches, locate_matches, plan_search, search_claim_matches
+)
+from app.services.storage import has_documents
+from app.utils.zip_stream import stream_zip
 
 router = APIRouter()
 
-def has_json_files(folder: str) -> bool:
-    return os.path.exists(folder) and any(
-        f.lower().endswith('.json') for f in os.listdir(folder)
-    )
+MAX_HITS_PER_FILE = 20  # Hits listed per file in a response; HitCount has the total
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+def timed_search(search_params: SearchRequest, folder_path, output_json, timings):
+    """search_claim_matches' plan, matches and number of documents searched, with the total time in `timings`."""
+    start = time.perf_counter()
+    try:
+        # Hits are located only for the page returned, see describe_page
+        return search_claim_matches(
+            search_params.criteria(), folder_path, output_json, timings,
+            operator=search_params.Operator, match_modes=search_params.MatchModes, locate=False
+        )
+    finally:
+        if timings is not None:
+            timings["total"] = time.perf_counter() - start
+
+
+def search_criteria(search_params: SearchRequest) -> dict:
+    criteria = search_params.criteria()
+    if search_params.Operator:
+        criteria["Operator"] = search_params.Operator
+    if search_params.MatchModes:
+        criteria["MatchModes"] = search_params.MatchModes
+    return criteria
+
+
+def describe_match(filename, reasons, hits) -> dict:
+    return {
+        "File": filename,
+        "Reasons": list(reasons),
+        "Hits": [
+            {"Field": field, "Page": page_no + 1, "Start": start, "End": end, "Snippet": snippet}
+            for field, page_no, start, end, snippet in hits[:MAX_HITS_PER_FILE]
+        ],
+        "HitCount": len(hits),
+    }
+
+
+def describe_matches(matches) -> List[dict]:
+    return [describe_match(*match) for match in matches]
+
+
+def describe_page(result_set: ResultSet, cursor: Optional[str] = None, limit: Optional[int] = None, timings=None) -> dict:
+    """One page of a result set, with the page-level hits of its files located now."""
+    files, next_cursor = result_set.page(cursor, limit)
+    reasons = {filename: result_set.reasons.get(filename, ()) for filename in files}
+    if result_set.plan is not None:
+        matches = locate_matches(result_set.plan, result_set.output_json_folder, reasons, timings)
+    else:
+        matches = ((filename, found, []) for filename, found in reasons.items())
+    return {
+        "files": files,
+        "Matches": describe_matches(matches),
+        "MatchCount": len(result_set.files),
+        "NextCursor": next_cursor,
+    }
+
+
+def with_timings(response: dict, timings):
+    if timings is not None:
+        response["Timings"] = {step: round(seconds * 1000, 3) for step, seconds in timings.items()}
+    return response
+
+
+def ndjson_line(item: dict) -> bytes:
+    return (json.dumps(item, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+def stream_search(search_params: SearchRequest, folder_path, output_json, timings, status: dict) -> StreamingResponse:
+    """
+    NDJSON: one line per matching file (as in Matches) as soon as it is found, then a last line with
+    the result set and summary, or with an Error if the search failed after the first line was sent.
+    Query errors and "no match" are raised before anything is sent, so they keep their status codes.
+    """
+    start = time.perf_counter()
+    plan = plan_search(search_params.criteria(), search_params.Operator, search_params.MatchModes)
+    check_documents(output_json)
+    counts = {}
+    matches = iter_claim_matches(plan, output_json, timings, counts=counts)
+    first = next(matches, None)
+    if first is None:
+        provided = {k: v for k, v in search_params.criteria().items() if v}
+        raise NoMatchFoundException(f"No value matching with the keyword: {provided}")
+
+    def lines():
+        reasons = {}
+        try:
+            for filename, found, hits in itertools.chain([first], matches):
+                reasons[filename] = found
+                yield ndjson_line(describe_match(filename, found, hits))
+        except Exception as e:
+            yield ndjson_line({"Error": str(e)})
+            return
+        if timings is not None:
+            timings["total"] = time.perf_counter() - start
+        result_set = result_sets.create(
+            folder_path, reasons, search_criteria(search_params), reasons, plan, output_json
+        )
+        yield ndjson_line(with_timings({
+            **status,
+            "Summary": f"{len(reasons)} of {counts['documents']} documents matched the search criteria",
+            "ResultSetId": result_set.result_set_id,
+            "MatchCount": len(reasons),
+        }, timings))
+
+    return StreamingResponse(lines(), media_type=NDJSON_MEDIA_TYPE)
+
+
+def search_response(search_params: SearchRequest, folder_path, output_json, timings, limit, stream, status: dict):
+    """The search part of /searchPdfDocuments; `status` holds the extraction fields of the response."""
+    if stream:
+        return stream_search(search_params, folder_path, output_json, timings, status)
+    plan, matches, documents = timed_search(search_params, folder_path, output_json, timings)
+    reasons = {filename: found for filename, found, _ in matches}
+    result_set = result_sets.create(folder_path, reasons, search_criteria(search_params), reasons, plan, output_json)
+    return with_timings({
+        **status,
+        "Summary": f"{len(matches)} of {documents} documents matched the search criteria",
+        "ResultSetId": result_set.result_set_id,
+        **describe_page(result_set, limit=limit, timings=timings),
+    }, timings)
+
 
 @router.post("/searchPdfDocuments")
 def search_pdf_documents(
     search_params: SearchRequest = Body(default={}),
-    extractDocuments: bool = Query(False, description="Set to true to trigger extraction")
+    extractDocuments: bool = Query(False, description="Set to true to trigger extraction"),
+    includeTimings: bool = Query(False, description="Set to true to add a per-step timing breakdown in ms"),
+    limit: Optional[int] = Query(None, description=f"Files per page, {DEFAULT_PAGE_SIZE} by default, at most {MAX_PAGE_SIZE}"),
+    stream: bool = Query(False, description="Set to true to stream matches as NDJSON lines while they are found")
 ):
-    folder_path = r"C:\Users\hitesh.paliwal\Downloads\VCI - claims PDF"
-    output_json = r"C:\Users\hitesh.paliwal\Downloads\VCI - claims PDF\Extracted_Json_Files"
-    output_destination_folder = r"C:\Users\hitesh.paliwal\Downloads\VCI - claims PDF\destination"
-    batch_size = 5
-    total_input_files = len([f for f in os.listdir(folder_path) if f.lower().endswith('.pdf')])
-    # total_output_files = len([f for f in os.listdir(output_destination_folder) if f.lower().endswith('.pdf')])
-
-    extraction_needed = extractDocuments or not has_json_files(output_json)
+    folder_path = FOLDER_PATH
+    output_json = OUTPUT_JSON_PATH
+    batch_size = BATCH_SIZE
+
+    extraction_needed = extractDocuments or not has_documents(output_json)
     # extraction_status = "Applied" if extraction_needed else "Not Applied"
+    running_job = job_manager.active_job()
+    timings = {} if includeTimings else None
 
     try:
-        search_dict = {k: v for k, v in search_params.dict().items() if v}
+        page_size(limit)  # Reject a bad limit before any extraction work
+        search_dict = search_params.criteria()
+        # While a background job is extracting, search whatever is already indexed instead
+        if running_job is not None and extraction_needed:
+            if not search_dict:
+                raise HTTPException(
+                    status_code=409,
+                    detail=f"Extraction job {running_job.job_id} is already running, check /jobs/{running_job.job_id}"
+                )
+            extraction_needed = False
         # If extraction is needed, perform extraction first
         if extraction_needed:
-            success, json_file, message, extracted_count, total_files = process_all_pdfs(
-                folder_path, output_json, batch_size
-            )
+            # Registered with the job manager, so a background job cannot start on the same folder meanwhile
+            job, result = job_manager.run_inline(folder_path, output_json, batch_size)
+            if result is None:
+                raise HTTPException(
+                    status_code=409,
+                    detail=f"Extraction job {job.job_id} is already running, check /jobs/{job.job_id}"
+                )
+            success, json_file, message, extracted_count, total_files, stats = result
             # If search params provided, perform search after extraction
             if search_dict:
-                matching_files = search_claim_documents(search_dict, folder_path, output_json)
-                total_output_files = len([f for f in os.listdir(output_destination_folder) if f.lower().endswith('.pdf')])
-                return {
+                return search_response(search_params, folder_path, output_json, timings, limit, stream, {
                     "ExtractionStatus": "Applied",
                     "Extraction_Completed":f"{success}",
                     "Message": "Extraction completed with search",
-                    "Summary": f"{total_output_files} of {total_input_files} documents moved to destination based on the search criteria",
-                    "files": matching_files
-                }
+                })
             # If no search params, just return extraction summary
             return {
                 "Extraction_Completed": f"{success}",
                 "Message": message if message else "Extraction Completed, proceed with search",
-                "Summary": f"{extracted_count} of {total_files} documents extracted",
+                "Summary": f"{extracted_count} of {total_files} documents extracted "
+                           f"(new: {stats['new']}, changed: {stats['changed']}, unchanged: {stats['unchanged']}, "
+                           f"skipped: {stats['skipped']}, failed: {stats['failed']}, "
+                           f"escalated to high DPI: {stats['escalated_pages']} pages, {stats['escalated_regions']} by region, "
+                           f"from page cache: {stats['cached_pages']}, blank: {stats['blank_pages']})",
             }
         # If only search is needed (no extraction)
         if not search_dict:
             raise HTTPException(status_code=400, detail="No search parameters provided.")
 
-        matching_files = search_claim_documents(search_dict, folder_path, output_json)
-        total_output_files = len([f for f in os.listdir(output_destination_folder) if f.lower().endswith('.pdf')])
-        return {
-            "ExtractionStatus": "Not Applied",
-            "Message": "Extraction completed with search",
-            "Summary": f"{total_output_files} of {total_input_files} documents moved to destination based on the search criteria",
-            "files": matching_files
-        }
+        return search_response(search_params, folder_path, output_json, timings, limit, stream, {
+            "ExtractionStatus": "In Progress" if running_job is not None else "Not Applied",
+            "Message": f"Extraction job {running_job.job_id} in progress, searched documents indexed so far"
+                       if running_job is not None else "Extraction completed with search",
+        })
+    except HTTPException:
+        raise
+    except InvalidQueryException as e:
+        raise HTTPException(status_code=400, detail=e.detail)
     except NoMatchFoundException as e:
         raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _zip_response(result_set: ResultSet, filename: str) -> StreamingResponse:
+    entries = result_set.entries()
+    if not entries:
+        raise HTTPException(status_code=404, detail="No files to download.")
+    return StreamingResponse(
+        stream_zip(entries),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
+@router.get("/results/{result_set_id}")
+def get_result_set(result_set_id: str):
+    result_set = result_sets.get(result_set_id)
+    if result_set is None:
+        raise HTTPException(status_code=404, detail=f"Result set {result_set_id} not found or expired")
+    return result_set.describe()
+
+
+@router.get("/results/{result_set_id}/matches")
+def get_result_set_matches(
+    result_set_id: str,
+    cursor: Optional[str] = Query(None, description="NextCursor of the previous page"),
+    limit: Optional[int] = Query(None, description=f"Files per page, {DEFAULT_PAGE_SIZE} by default, at most {MAX_PAGE_SIZE}")
+):
+    result_set = result_sets.get(result_set_id)
+    if result_set is None:
+        raise HTTPException(status_code=404, detail=f"Result set {result_set_id} not found or expired")
+    try:
+        return {"ResultSetId": result_set.result_set_id, **describe_page(result_set, cursor, limit)}
+    except InvalidQueryException as e:
+        raise HTTPException(status_code=400, detail=e.detail)
+
+
 @router.get("/download/all")
 def download_all_files():
-    DESTINATION_FOLDER = r"C:\Users\hitesh.paliwal\Downloads\VCI - claims PDF\destination"
-    try:
-        files = [f for f in os.listdir(DESTINATION_FOLDER) if os.path.isfile(os.path.join(DESTINATION_FOLDER, f))]
-        if not files:
-            raise HTTPException(status_code=404, detail="No files to download.")
-        # Create a temporary zip file
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".zip") as tmp:
-            with zipfile.ZipFile(tmp.name, 'w') as zipf:
-                for f in files:
-                    zipf.write(os.path.join(DESTINATION_FOLDER, f), arcname=f)
-            tmp_path = tmp.name
-        return FileResponse(path=tmp_path, filename="destination_files.zip", media_type='application/zip')
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    """Download the documents matched by the most recent search."""
+    result_set = result_sets.latest()
+    if result_set is None:
+        raise HTTPException(status_code=404, detail="No files to download.")
+    return _zip_response(result_set, "destination_files.zip")
+
+
+@router.get("/download/{result_set_id}")
+def download_result_set(result_set_id: str):
+    result_set = result_sets.get(result_set_id)
+    if result_set is None:
+        raise HTTPException(status_code=404, detail=f"Result set {result_set_id} not found or expired")
+    return _zip_response(result_set, f"results_{result_set_id}.zip")
+
+
+@router.get("/cache/stats")
+def cache_stats():
+    # Page caches are per output folder; only those opened by an extraction in this process are listed
+    return {"QueryCache": query_cache.stats(), "PageCaches": all_page_cache_stats()}
 
+@router.get("/metrics")
+def prometheus_metrics():
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
 
 @router.get("/healthcheck")
 def healthcheck():
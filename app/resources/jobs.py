@@ -0,0 +1,43 @@
+from fastapi import APIRouter, HTTPException, Query
+
+from app.config import BATCH_SIZE, FOLDER_PATH, JOBS_FOLDER, OUTPUT_JSON_PATH
+from app.services.extractor import EXTRACTION_MODES, MODE_FULL
+from app.services.jobs import JobManager
+
+router = APIRouter()
+
+job_manager = JobManager(JOBS_FOLDER)
+
+
+@router.post("/jobs/extraction", status_code=202)
+def start_extraction_job(
+    mode: str = Query(MODE_FULL, description="'full', or 'fields' to OCR field regions first and the full text after")
+):
+    if mode not in EXTRACTION_MODES:
+        raise HTTPException(status_code=400, detail=f"Unknown extraction mode '{mode}', expected one of {EXTRACTION_MODES}")
+    running = job_manager.active_job()
+    if running is not None:
+        raise HTTPException(status_code=409, detail=f"Extraction job {running.job_id} is already running")
+    job = job_manager.start(FOLDER_PATH, OUTPUT_JSON_PATH, BATCH_SIZE, mode)
+    return {"JobId": job.job_id, "Status": job.state["Status"], "Message": f"Track progress at /jobs/{job.job_id}"}
+
+
+@router.get("/jobs/{job_id}")
+def get_job_status(
+    job_id: str,
+    includeFiles: bool = Query(True, description="Include per-file progress")
+):
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"No extraction job with id '{job_id}'")
+    return job.snapshot(include_files=includeFiles)
+
+
+@router.delete("/jobs/{job_id}", status_code=202)
+def cancel_job(job_id: str):
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"No extraction job with id '{job_id}'")
+    if not job.cancel():
+        raise HTTPException(status_code=409, detail=f"Extraction job {job_id} already {job.state['Status']}")
+    return {"JobId": job_id, "Status": job.state["Status"], "Message": "Cancellation requested"}
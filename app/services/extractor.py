@@ -1,12 +1,21 @@
 import os
-import json
 import logging
-import pytesseract
 import fitz  # PyMuPDF
-from concurrent.futures import ThreadPoolExecutor, as_completed
 import cv2
 import numpy as np
-from pathlib import Path
+
+from app.config import BACKGROUND_OCR_WORKERS, LOW_CONFIDENCE
+from app.services.manifest import (
+    NEW, CHANGED, UNCHANGED, SKIPPED, RETRY, STATUS_OK, STATUS_CORRUPT, STATUS_INCOMPLETE,
+    load_manifest, save_manifest, classify, quick_pdf_check
+)
+from app.services.metrics import EXTRACTION_DOCUMENTS, EXTRACTION_STAGE_SECONDS
+from app.services.ocr_engine import get_engine
+from app.services.search_index import (
+    add_document as add_to_index, connect as connect_index, ensure_index,
+    remove_documents as remove_from_index
+)
+from app.services.storage import open_store
 
 # Configure logging
 logging.basicConfig(
@@ -17,120 +26,349 @@ logger = logging.getLogger(__name__)
 
 # Configuration
 DPI = 100  # Reduced DPI for faster processing
-THREADS = 16 # Adjusted for optimal CPU usage
 TESSERACT_CONFIG = '--oem 1 --psm 6 -c preserve_interword_spaces=1'
-MIN_TEXT_LENGTH = 50  # Minimum characters to consider as digital PDF
+MIN_PAGE_TEXT_LENGTH = 50  # Pages with less embedded text than this are sent to OCR
 
+# Adaptive resolution: OCR at DPI first, then re-OCR only what Tesseract was unsure about at HIGH_DPI
+# (ADAPTIVE_OCR and LOW_CONFIDENCE are set in app.config)
+HIGH_DPI = 300
+TESSERACT_LINE_CONFIG = '--oem 1 --psm 7'  # A re-rendered region holds a single text line
+PAGE_ESCALATION_RATIO = 0.5  # Re-OCR the whole page once more than this share of its lines is low-confidence
+REGION_PADDING = 3  # Points added around a line's box before re-rendering it
 
-def is_digital_pdf(pdf_path):
-    """Check if PDF contains selectable text (digital PDF)"""
-    try:
-        with fitz.open(pdf_path) as doc:
-            text = ""
-            for page in doc:
-                text += page.get_text()
-                if len(text) > MIN_TEXT_LENGTH:
-                    return True
-            return False
-    except Exception as e:
-        logger.error(f"Error checking PDF type for {pdf_path}: {str(e)}")
-        return False
+# How a page was escalated to HIGH_DPI
+ESCALATE_PAGE = "page"
+ESCALATE_REGION = "region"
+
+# How the text of each page was obtained
+ROUTE_TEXT = "text"
+ROUTE_OCR = "ocr"
+ROUTE_ROI = "roi"  # Only the field regions were OCR'd; the full text is still to come
+
+# Extraction modes: full-page OCR, or field regions first with the full text deferred
+MODE_FULL = "full"
+MODE_FIELDS = "fields"
+EXTRACTION_MODES = (MODE_FULL, MODE_FIELDS)
+ROI_DPI = 200  # Field regions are a fraction of the page, so they can be rendered sharper
+ROI_TEMPLATES_FILENAME = "roi_templates.json"  # Optional {name: [left, top, right, bottom]} page fractions
+
+
+def route_pages(doc):
+    """
+    Read the embedded text of every page once and decide per page whether it needs OCR.
+    Returns the page texts ("" for OCR pages) and the route of each page.
+    """
+    texts, routes = [], []
+    for page in doc:
+        text = page.get_text()
+        if len(text.strip()) >= MIN_PAGE_TEXT_LENGTH:
+            texts.append(text)
+            routes.append(ROUTE_TEXT)
+        else:
+            texts.append("")
+            routes.append(ROUTE_OCR)
+    return texts, routes
 
 
 def fast_preprocess(img_array):
     """Preprocess image for OCR"""
-    gray = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)
+    if img_array.ndim == 3 and img_array.shape[2] == 1:
+        gray = img_array[:, :, 0]
+    elif img_array.ndim == 3:
+        gray = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)
+    else:
+        gray = img_array
     return cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)[1]
 
 
-def pdf_to_images(pdf_path):
-    """Convert PDF pages to images (for scanned PDFs only)"""
-    try:
-        doc = fitz.open(pdf_path)
-        return [doc.load_page(i).get_pixmap(dpi=DPI) for i in range(len(doc))]
-    except Exception as e:
-        logger.error("Rendering failed for %s: %s", pdf_path, e)
-        return []
+def iter_page_pixmaps(doc, dpi=DPI, page_numbers=None):
+    """Render pages lazily, one at a time, so only the pages currently in flight are held in memory"""
+    for page_no in (range(len(doc)) if page_numbers is None else page_numbers):
+        yield page_no, doc.load_page(page_no).get_pixmap(dpi=dpi, colorspace=fitz.csGRAY)
 
 
-def process_page(pix):
-    """OCR for a single page"""
-    try:
-        img = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.h, pix.w, pix.n)
-        img = fast_preprocess(img)
-        return pytesseract.image_to_string(img, config=TESSERACT_CONFIG)
-    except Exception as e:
-        logger.error("OCR failed: %s", e)
-        return ""
+def pixmap_to_array(pix):
+    """View the pixmap samples as a numpy array without copying; keep the pixmap alive while it is used"""
+    return np.frombuffer(pix.samples_mv, dtype=np.uint8).reshape(pix.h, pix.w, pix.n)
 
 
-def extract_text_from_pdf(pdf_path):
-    """Extract text from PDF using appropriate method based on PDF type"""
-    try:
-        if is_digital_pdf(pdf_path):
-            logger.info(f"Processing digital PDF: {pdf_path}")
-            with fitz.open(pdf_path) as doc:
-                return [page.get_text() for page in doc]
+def ocr_image(img, config=TESSERACT_CONFIG):
+    """OCR an already preprocessed page image"""
+    return get_engine().image_to_string(img, config)
+
+
+def ocr_image_data(img, config=TESSERACT_CONFIG):
+    """
+    OCR an already preprocessed page image with per-word confidence.
+    Returns one dict per text line: its text, the lowest word confidence, its block and its pixel box.
+    """
+    data = get_engine().image_to_data(img, config)
+    lines = {}
+    for i, word in enumerate(data["text"]):
+        confidence = float(data["conf"][i])
+        if confidence < 0 or not word.strip():
+            continue
+        key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+        left, top = data["left"][i], data["top"][i]
+        right, bottom = left + data["width"][i], top + data["height"][i]
+        line = lines.get(key)
+        if line is None:
+            lines[key] = {"text": word, "confidence": confidence, "block": key[0], "box": [left, top, right, bottom]}
         else:
-            logger.info(f"Processing scanned PDF with OCR: {pdf_path}")
-            pixmaps = pdf_to_images(pdf_path)
-            with ThreadPoolExecutor(max_workers=THREADS) as executor:
-                texts = list(executor.map(process_page, pixmaps))
-            return texts
-    except Exception as e:
-        logger.error("Failed to extract text from %s: %s", pdf_path, e)
-        return []
-
-
-def process_single_pdf(args):
-    filename, folder_path = args
-    pdf_path = os.path.join(folder_path, filename)
-    try:
-        logger.info("Processing: %s", filename)
-        text = extract_text_from_pdf(pdf_path)
-        return filename, text
-    except Exception as e:
-        logger.error("Failed to process %s: %s", filename, e)
-        return filename, None
+            line["text"] += " " + word
+            line["confidence"] = min(line["confidence"], confidence)
+            box = line["box"]
+            line["box"] = [min(box[0], left), min(box[1], top), max(box[2], right), max(box[3], bottom)]
+    return [lines[key] for key in sorted(lines)]
+
+
+def lines_to_text(lines):
+    """Page text from OCR lines, with a blank line between text blocks"""
+    parts, block = [], None
+    for line in lines:
+        if block is not None and line["block"] != block:
+            parts.append("")
+        parts.append(line["text"])
+        block = line["block"]
+    return "\n".join(parts)
+
+
+def needs_escalation(lines):
+    return any(line["confidence"] < LOW_CONFIDENCE for line in lines)
+
+
+def mean_confidence(lines):
+    return sum(line["confidence"] for line in lines) / len(lines) if lines else 0.0
 
 
-def process_folder_fast(folder_path, output_json_base, batch_size):
+def escalate_page(page, lines, dpi=DPI, high_dpi=HIGH_DPI, ocr=ocr_image_data):
+    """
+    Re-OCR the low-confidence parts of a page OCR'd at dpi, rendering them again at high_dpi.
+    When most lines are unsure the whole page is redone, otherwise only the boxes of those lines.
+    `ocr(img, config)` returns lines like ocr_image_data. Returns (lines, how it was escalated or None).
+    """
+    low = [i for i, line in enumerate(lines) if line["confidence"] < LOW_CONFIDENCE]
+    if not low:
+        return lines, None
+    if len(low) > PAGE_ESCALATION_RATIO * len(lines):
+        pix = page.get_pixmap(dpi=high_dpi, colorspace=fitz.csGRAY)
+        redone = ocr(fast_preprocess(pixmap_to_array(pix)), TESSERACT_CONFIG)
+        # Keep whichever pass Tesseract is more confident about
+        return (redone if mean_confidence(redone) >= mean_confidence(lines) else lines), ESCALATE_PAGE
+    lines = list(lines)
+    scale = 72.0 / dpi
+    for i in low:
+        left, top, right, bottom = lines[i]["box"]
+        clip = fitz.Rect(
+            left * scale - REGION_PADDING, top * scale - REGION_PADDING,
+            right * scale + REGION_PADDING, bottom * scale + REGION_PADDING
+        ) & page.rect
+        if clip.is_empty:
+            continue
+        pix = page.get_pixmap(dpi=high_dpi, colorspace=fitz.csGRAY, clip=clip)
+        redone = ocr(fast_preprocess(pixmap_to_array(pix)), TESSERACT_LINE_CONFIG)
+        if redone:
+            confidence = min(line["confidence"] for line in redone)
+            if confidence > lines[i]["confidence"]:
+                text = " ".join(line["text"] for line in redone)
+                lines[i] = dict(lines[i], text=text, confidence=confidence)
+    return lines, ESCALATE_REGION
+
+
+def route_counts(routes):
+    """Manifest counts of how the pages of a document were extracted"""
+    return {
+        "text_pages": routes.count(ROUTE_TEXT),
+        "ocr_pages": routes.count(ROUTE_OCR),
+        "roi_pages": routes.count(ROUTE_ROI),
+    }
+
+
+def process_folder_fast(folder_path, output_json_base, batch_size, progress=None, cancel_event=None, mode=MODE_FULL):
+    """
+    Incrementally extract the PDFs in folder_path into the document store.
+    Only new or changed files are extracted; files recorded as corrupt are skipped until they change.
+    The manifest is checkpointed every batch_size completed documents.
+    Returns the number of files extracted in this run, the total PDF count and per-state counts.
+
+    In MODE_FIELDS scanned pages are only OCR'd in their field regions (templates from
+    ROI_TEMPLATES_FILENAME in folder_path, if present), so new documents are searchable by their
+    structured fields sooner; complete_deferred_documents fills in their full text later.
+
+    `progress`, if given, is told about files_pending(filenames), document_started(filename, page_count),
+    pages_done(filename, count) and document_done(filename, ok). Setting `cancel_event` stops the run
+    after the documents already in flight; everything completed so far is saved.
+    """
     pdf_files = [f for f in os.listdir(folder_path) if f.lower().endswith('.pdf')]
     total_files = len(pdf_files)
-    processed_count = 0
-    batch_number = 1
     logger.info("Detected PDF files: %d", total_files)
 
-    for i in range(0, total_files, batch_size):
-        batch = pdf_files[i:i + batch_size]
-        args_list = [(filename, folder_path) for filename in batch]
-        batch_result = {}
-        logger.info("Starting Batch %d: Files %d to %d", batch_number, i + 1, min(i + batch_size, total_files))
-
-        with ThreadPoolExecutor(max_workers=THREADS) as executor:
-            futures = {executor.submit(process_single_pdf, args): args[0] for args in args_list}
-            for future in as_completed(futures):
-                filename, text = future.result()
-                if text is not None:
-                    batch_result[filename] = text
-                    processed_count += 1
-
-        # Save after each batch to a unique file
-        os.makedirs(output_json_base, exist_ok=True)
-        batch_json_path = os.path.join(output_json_base, f"ExtractedData_Batch{batch_number}.json")
-        with open(batch_json_path, 'w', encoding='utf-8') as f:
-            json.dump(batch_result, f, indent=2, ensure_ascii=False)
-
-        logger.info("Batch %d processed and saved to %s", batch_number, batch_json_path)
-        batch_number += 1
-
-    logger.info("Extraction complete. %d files processed in %d batches.", processed_count, batch_number - 1)
-    return processed_count, total_files
-
-
-def process_all_pdfs(folder_path: str, output_json_base: str, batch_size):
-    processed_count, total_files = process_folder_fast(folder_path, output_json_base, batch_size=batch_size)
-    if total_files == 0:
-        return False, output_json_base, ""
-    percent = processed_count / total_files
-    return percent >= 0.9, output_json_base, ""
\ No newline at end of file
+    manifest = load_manifest(output_json_base)
+    entries = {}
+    stale = []
+    pending = []
+    stats = {
+        NEW: 0, CHANGED: 0, UNCHANGED: 0, SKIPPED: 0, RETRY: 0, "failed": 0,
+        "escalated_pages": 0, "escalated_regions": 0, "deferred": 0, "cached_pages": 0, "blank_pages": 0
+    }
+
+    for filename in pdf_files:
+        pdf_path = os.path.join(folder_path, filename)
+        previous = manifest.get(filename)
+        try:
+            state, entry = classify(pdf_path, previous)
+        except OSError as e:
+            logger.error("Could not read %s: %s", filename, e)
+            stats["failed"] += 1
+            continue
+        stats[state] += 1
+        if state in (UNCHANGED, SKIPPED):
+            entries[filename] = entry
+            continue
+        if previous:
+            stale.append(filename)
+        error = quick_pdf_check(pdf_path)
+        if error:
+            logger.warning("Skipping corrupt PDF %s: %s", filename, error)
+            entries[filename] = dict(entry, status=STATUS_CORRUPT, error=error)
+            stats["failed"] += 1
+            continue
+        pending.append((filename, entry))
+
+    # Drop documents whose PDF was deleted from the folder
+    present = set(pdf_files)
+    stale.extend(filename for filename in manifest if filename not in present)
+
+    os.makedirs(output_json_base, exist_ok=True)
+    store = open_store(output_json_base)
+    ensure_index(output_json_base)
+    index = connect_index(output_json_base)
+    store.remove(stale)
+    remove_from_index(index, stale)
+    index.commit()
+    save_manifest(output_json_base, entries)
+    logger.info(
+        "New: %d, changed: %d, retried after failed pages: %d, unchanged: %d, skipped as corrupt: %d",
+        stats[NEW], stats[CHANGED], stats[RETRY], stats[UNCHANGED], stats[SKIPPED]
+    )
+
+    from app.services.page_cache import open_page_cache
+    from app.services.roi import load_templates
+    from app.services.scheduler import OcrScheduler
+
+    processed_count = 0
+    pending_entries = dict(pending)
+    jobs = [(filename, os.path.join(folder_path, filename)) for filename, _ in pending]
+    if progress:
+        progress.files_pending([filename for filename, _ in pending])
+
+    # Documents complete in whatever order the pipeline finishes them. Each one is appended to the
+    # store and indexed as soon as it completes, so it is searchable immediately.
+    templates = load_templates(os.path.join(folder_path, ROI_TEMPLATES_FILENAME)) if mode == MODE_FIELDS else None
+    scheduler = OcrScheduler(
+        progress=progress, cancel_event=cancel_event, mode=mode, templates=templates,
+        page_cache=open_page_cache(output_json_base)
+    )
+    for done, (filename, text, routes) in enumerate(scheduler.run(jobs), 1):
+        failed_pages = scheduler.failed_pages.get(filename)
+        if text:
+            with EXTRACTION_STAGE_SECONDS.time(stage="store_write"):
+                store.put(filename, text, routes)
+            with EXTRACTION_STAGE_SECONDS.time(stage="index_write"):
+                add_to_index(index, filename, text, routes)
+                index.commit()
+            stats["deferred"] += ROUTE_ROI in routes
+        if text and not failed_pages:
+            entries[filename] = dict(pending_entries[filename], status=STATUS_OK, **route_counts(routes))
+            processed_count += 1
+        elif text:
+            # Searchable by the pages that worked, and extracted again on the next run
+            logger.warning("%s: %d pages failed to extract, keeping it for a retry", filename, len(failed_pages))
+            entries[filename] = dict(
+                pending_entries[filename], status=STATUS_INCOMPLETE, failed_pages=sorted(failed_pages),
+                **route_counts(routes)
+            )
+            stats["failed"] += 1
+        else:
+            entries[filename] = dict(pending_entries[filename], status=STATUS_CORRUPT, error="Extraction failed")
+            stats["failed"] += 1
+        ok = bool(text) and not failed_pages
+        EXTRACTION_DOCUMENTS.inc(result="ok" if ok else "failed")
+        if progress:
+            progress.document_done(filename, ok)
+        if done % batch_size == 0:
+            save_manifest(output_json_base, entries)
+    save_manifest(output_json_base, entries)
+    stats["escalated_pages"] = scheduler.escalations[ESCALATE_PAGE]
+    stats["escalated_regions"] = scheduler.escalations[ESCALATE_REGION]
+    stats["cached_pages"] = scheduler.skipped["cached"]
+    stats["blank_pages"] = scheduler.skipped["blank"]
+
+    index.close()
+    logger.info(
+        "Extraction complete. %d files processed, %d OCR pages escalated to %d DPI (%d whole pages, %d by region).",
+        processed_count, stats["escalated_pages"] + stats["escalated_regions"], HIGH_DPI,
+        stats["escalated_pages"], stats["escalated_regions"]
+    )
+    logger.info(
+        "%d OCR pages taken from the page cache, %d blank pages skipped", stats["cached_pages"], stats["blank_pages"]
+    )
+    return processed_count, total_files, stats
+
+
+def complete_deferred_documents(folder_path, output_json_base, progress=None, cancel_event=None, ocr_workers=None):
+    """
+    Full-text pass over documents extracted in MODE_FIELDS: their field-only pages are OCR'd in full
+    and the documents replaced in the store and index. It runs with BACKGROUND_OCR_WORKERS Tesseract
+    slots so it never takes the whole OCR budget. Documents whose PDF changed since are left to the
+    next extraction. Returns the number of documents completed.
+    """
+    from app.services.page_cache import open_page_cache
+    from app.services.scheduler import OcrScheduler
+
+    store = open_store(output_json_base)
+    manifest = load_manifest(output_json_base)
+    jobs = []
+    for filename in store.filenames():
+        if ROUTE_ROI not in (store.routes(filename) or []):
+            continue
+        pdf_path = os.path.join(folder_path, filename)
+        if filename not in manifest or not os.path.exists(pdf_path):
+            continue
+        try:
+            state, _ = classify(pdf_path, manifest[filename])
+        except OSError as e:
+            logger.error("Could not read %s: %s", filename, e)
+            continue
+        if state == UNCHANGED:
+            jobs.append((filename, pdf_path))
+    logger.info("Full-text pass over %d documents extracted by field regions", len(jobs))
+    if not jobs:
+        return 0
+    if progress:
+        progress.files_pending([filename for filename, _ in jobs])
+
+    completed = 0
+    index = connect_index(output_json_base)
+    scheduler = OcrScheduler(
+        ocr_workers=ocr_workers or BACKGROUND_OCR_WORKERS, progress=progress, cancel_event=cancel_event,
+        page_cache=open_page_cache(output_json_base)
+    )
+    try:
+        for filename, text, routes in scheduler.run(jobs):
+            if scheduler.failed_pages.get(filename):
+                text = None  # Keep the field-region text rather than lose pages; retried by the next pass
+            if text:
+                store.put(filename, text, routes)
+                add_to_index(index, filename, text, routes)
+                index.commit()
+                manifest[filename] = dict(manifest[filename], **route_counts(routes))
+                completed += 1
+            else:
+                logger.error("Full-text pass failed for %s, keeping its field-region text", filename)
+            if progress:
+                progress.document_done(filename, bool(text))
+    finally:
+        index.close()
+        save_manifest(output_json_base, manifest)
+    return completed
@@ -0,0 +1,84 @@
+import re
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+# Bump whenever the extraction rules below change so stored field records are regenerated
+FIELDS_VERSION = 1
+
+VIN_MIN_LENGTH = 13
+
+FIELD_PATTERNS = {
+    "Dealer": r"dealer[:;\s#]*([^\n\r]+)",
+}
+
+DEALER_PATTERN = re.compile(FIELD_PATTERNS["Dealer"], re.IGNORECASE)
+VIN_LABEL_PATTERN = re.compile(r'VIN[:\s]*([A-Z0-9\W]{13,25})')
+VIN_RUN_PATTERN = re.compile(r'([A-HJ-NPR-Z0-9][A-HJ-NPR-Z0-9\W]{12,})')
+
+STRUCTURED_FIELDS = ("VIN", "Contract", "Claim", "Dealer")
+
+
+def ocr_vin_normalize(s: str) -> str:
+    return (
+        s.upper()
+        .replace('O', '0')
+        .replace('Q', '0')
+        .replace('I', '1')
+    )
+
+
+def normalize_vin_query(value: str) -> str:
+    return ocr_vin_normalize(re.sub(r'[^A-HJ-NPR-Z0-9]', '', value.upper()))
+
+
+def iter_vin_candidates(text: str) -> Iterator[Tuple[int, int, str]]:
+    """(start, end, normalized VIN) of every VIN-like run in text: labelled ones first, then bare runs."""
+    upper = text.upper()
+    for pattern in (VIN_LABEL_PATTERN, VIN_RUN_PATTERN):
+        for match in pattern.finditer(upper):
+            normalized = re.sub(r'[^A-HJ-NPR-Z0-9]', '', match.group(1))
+            if len(normalized) >= VIN_MIN_LENGTH:
+                yield match.start(1), match.end(1), normalized
+
+
+def find_vin_candidates(text: str) -> List[str]:
+    return _unique(vin for _, _, vin in iter_vin_candidates(text))
+
+
+def extract_numeric_after_keyword(text: str, keyword: str, min_digits: int = 6) -> List[str]:
+    results = []
+    lines = text.splitlines()
+    keyword_lower = keyword.lower()
+    for line in lines:
+        if keyword_lower in line.lower():
+            idx = line.lower().find(keyword_lower)
+            after = line[idx + len(keyword):]
+            numbers = re.findall(r'\d+', after)
+            long_numbers = [num for num in numbers if len(num) >= min_digits]
+            results.extend(long_numbers)
+    return results
+
+
+def clean_dealer_name(raw: str) -> str:
+    extracted_value = raw.strip().rstrip(':;\\').strip()
+    return re.sub(r'\s*\d+\s*$', '', extracted_value)
+
+
+def extract_dealer_names(text: str) -> List[str]:
+    return [clean_dealer_name(match.group(1)) for match in DEALER_PATTERN.finditer(text)]
+
+
+def _unique(values: Iterable[str]) -> List[str]:
+    return list(dict.fromkeys(v for v in values if v))
+
+
+def extract_fields(text: str) -> Dict[str, List[str]]:
+    """
+    Normalized structured fields of one document, in the form search compares against:
+    OCR-normalized VINs, contract/claim numbers and lower-cased dealer names.
+    """
+    return {
+        "VIN": _unique(ocr_vin_normalize(v) for v in find_vin_candidates(text)),
+        "Contract": _unique(n.strip() for n in extract_numeric_after_keyword(text, "Contract", min_digits=6)),
+        "Claim": _unique(n.strip() for n in extract_numeric_after_keyword(text, "Claim", min_digits=6)),
+        "Dealer": _unique(name.lower() for name in extract_dealer_names(text)),
+    }
@@ -0,0 +1,306 @@
+import os
+import copy
+import json
+import time
+import uuid
+import logging
+import threading
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from app.services.extractor import MODE_FULL, complete_deferred_documents
+from app.services.process_all_pdfs import process_all_pdfs
+
+logger = logging.getLogger(__name__)
+
+STATE_SAVE_INTERVAL = 2.0  # Seconds between progress snapshots written to disk
+
+QUEUED = "queued"
+RUNNING = "running"
+CANCELLING = "cancelling"
+COMPLETED = "completed"
+CANCELLED = "cancelled"
+FAILED = "failed"
+ACTIVE_STATES = (QUEUED, RUNNING, CANCELLING)
+
+# A job extracts new documents first, then fills in the full text of documents extracted in fields mode
+PHASE_EXTRACT = "extract"
+PHASE_FULL_TEXT = "full_text"
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class ExtractionJob:
+    """
+    One background extraction run. Its state is persisted as JSON so an interrupted job can be resumed.
+    Also acts as the progress listener for process_folder_fast.
+    """
+
+    def __init__(self, state: dict, state_path: str):
+        self.state = state
+        self.state_path = state_path
+        self.cancel_event = threading.Event()
+        self.lock = threading.Lock()
+        self._save_lock = threading.Lock()  # Progress arrives from many scheduler threads at once
+        self._last_saved = 0.0
+        self._run_started = None
+        self._run_pages = 0
+
+    @classmethod
+    def create(cls, jobs_folder: str, folder_path: str, output_json_path: str, batch_size: int, mode: str = MODE_FULL):
+        job_id = uuid.uuid4().hex
+        state = {
+            "JobId": job_id,
+            "Status": QUEUED,
+            "FolderPath": folder_path,
+            "OutputJsonPath": output_json_path,
+            "BatchSize": batch_size,
+            "Mode": mode,
+            "Phase": PHASE_EXTRACT,
+            "CreatedAt": _now(),
+            "StartedAt": None,
+            "FinishedAt": None,
+            "Resumes": 0,
+            "Message": "",
+            "Summary": "",
+            "Progress": {"FilesTotal": 0, "FilesDone": 0, "FilesFailed": 0, "PagesTotal": 0, "PagesDone": 0},
+            "Files": {},
+        }
+        return cls(state, os.path.join(jobs_folder, f"{job_id}.json"))
+
+    @classmethod
+    def load(cls, state_path: str):
+        with open(state_path, "r", encoding="utf-8") as f:
+            return cls(json.load(f), state_path)
+
+    @property
+    def job_id(self) -> str:
+        return self.state["JobId"]
+
+    @property
+    def is_active(self) -> bool:
+        return self.state["Status"] in ACTIVE_STATES
+
+    def snapshot(self, include_files: bool = True) -> dict:
+        with self.lock:
+            state = copy.deepcopy(self.state)
+            elapsed = time.monotonic() - self._run_started if self._run_started else 0.0
+            run_pages = self._run_pages
+        state["Progress"]["PagesPerSecond"] = round(run_pages / elapsed, 2) if elapsed else 0.0
+        if not include_files:
+            state.pop("Files")
+        return state
+
+    def save(self, force: bool = False):
+        with self._save_lock:
+            now = time.monotonic()
+            if not force and now - self._last_saved < STATE_SAVE_INTERVAL:
+                return
+            self._last_saved = now
+            state = self.snapshot()
+            tmp_path = f"{self.state_path}.{uuid.uuid4().hex}.tmp"
+            try:
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(state, f, indent=2, ensure_ascii=False)
+                os.replace(tmp_path, self.state_path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+    def _set(self, **fields):
+        with self.lock:
+            self.state.update(fields)
+        self.save(force=True)
+
+    def cancel(self) -> bool:
+        """Ask the job to stop; False if it had already finished."""
+        with self.lock:
+            # Checked and switched under the lock the run writes its final status with
+            if self.state["Status"] not in ACTIVE_STATES:
+                return False
+            self.cancel_event.set()
+            self.state["Status"] = CANCELLING
+        self.save(force=True)
+        return True
+
+    def _finish(self, **fields):
+        with self.lock:
+            status = CANCELLED if self.cancel_event.is_set() else COMPLETED
+            self.state.update(Status=status, FinishedAt=_now(), **fields)
+        self.save(force=True)
+
+    def _recount(self):
+        files = self.state["Files"].values()
+        progress = self.state["Progress"]
+        progress["FilesTotal"] = len(self.state["Files"])
+        progress["FilesDone"] = sum(1 for f in files if f["Status"] == "done")
+        progress["FilesFailed"] = sum(1 for f in files if f["Status"] == "failed")
+        progress["PagesTotal"] = sum(f["Pages"] or 0 for f in files)
+        progress["PagesDone"] = sum(f["PagesDone"] for f in files)
+
+    # Progress listener used by process_folder_fast and the OCR scheduler
+
+    def files_pending(self, filenames: List[str]):
+        with self.lock:
+            for filename in filenames:
+                # Files finished before a restart are unchanged in the manifest and never show up here again
+                self.state["Files"][filename] = {"Status": "pending", "Pages": None, "PagesDone": 0}
+            self._recount()
+        self.save(force=True)
+
+    def document_started(self, filename: str, page_count: int):
+        with self.lock:
+            entry = self.state["Files"].setdefault(filename, {"Status": "pending", "Pages": None, "PagesDone": 0})
+            entry.update(Status="running", Pages=page_count, PagesDone=0)
+            self._recount()
+        self.save()
+
+    def pages_done(self, filename: str, count: int = 1):
+        with self.lock:
+            entry = self.state["Files"].get(filename)
+            if entry is not None:
+                entry["PagesDone"] += count
+            self.state["Progress"]["PagesDone"] += count
+            self._run_pages += count
+        self.save()
+
+    def document_done(self, filename: str, ok: bool):
+        with self.lock:
+            entry = self.state["Files"].setdefault(filename, {"Status": "pending", "Pages": None, "PagesDone": 0})
+            entry["Status"] = "done" if ok else "failed"
+            self._recount()
+        self.save()
+
+    def _begin(self):
+        with self.lock:
+            self._run_started = time.monotonic()
+            self._run_pages = 0
+        self._set(Status=RUNNING, StartedAt=self.state["StartedAt"] or _now(), Phase=PHASE_EXTRACT)
+
+    def _extract(self):
+        """The extraction phase; returns process_all_pdfs' result and its summary line."""
+        result = process_all_pdfs(
+            self.state["FolderPath"], self.state["OutputJsonPath"], self.state["BatchSize"],
+            progress=self, cancel_event=self.cancel_event, mode=self.state.get("Mode", MODE_FULL)
+        )
+        success, _, message, extracted_count, total_files, stats = result
+        summary = (
+            f"{extracted_count} of {total_files} documents extracted "
+            f"(new: {stats['new']}, changed: {stats['changed']}, unchanged: {stats['unchanged']}, "
+            f"skipped: {stats['skipped']}, failed: {stats['failed']}, "
+            f"escalated to high DPI: {stats['escalated_pages']} pages, {stats['escalated_regions']} by region, "
+            f"from page cache: {stats['cached_pages']}, blank: {stats['blank_pages']})"
+        )
+        return result, summary
+
+    def run(self):
+        self._begin()
+        try:
+            (success, _, message, _, _, _), summary = self._extract()
+            if not self.cancel_event.is_set():
+                # Everything is searchable by its fields now; documents extracted in fields mode, by this
+                # job or an earlier one, get their full text at lower priority
+                self._set(Phase=PHASE_FULL_TEXT, Summary=summary, Message=message)
+                completed = complete_deferred_documents(
+                    self.state["FolderPath"], self.state["OutputJsonPath"], progress=self, cancel_event=self.cancel_event
+                )
+                if completed:
+                    summary += f"; full text completed for {completed} documents"
+            self._finish(Message=message, Summary=summary, Success=success)
+        except Exception as e:
+            logger.exception("Extraction job %s failed", self.job_id)
+            self._set(Status=FAILED, FinishedAt=_now(), Message=str(e))
+
+    def run_inline(self):
+        """Only the extraction phase, in the calling thread; returns process_all_pdfs' result."""
+        self._begin()
+        try:
+            result, summary = self._extract()
+        except Exception as e:
+            logger.exception("Extraction job %s failed", self.job_id)
+            self._set(Status=FAILED, FinishedAt=_now(), Message=str(e))
+            raise
+        self._finish(Message=result[2], Summary=summary, Success=result[0])
+        return result
+
+
+class JobManager:
+    """Runs at most one extraction job at a time and keeps every job's state under jobs_folder."""
+
+    def __init__(self, jobs_folder: str):
+        self.jobs_folder = jobs_folder
+        self.jobs: Dict[str, ExtractionJob] = {}
+        self.lock = threading.Lock()
+
+    def active_job(self) -> Optional[ExtractionJob]:
+        with self.lock:
+            return next((job for job in self.jobs.values() if job.is_active), None)
+
+    def get(self, job_id: str) -> Optional[ExtractionJob]:
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def _register(
+        self, folder_path: str, output_json_path: str, batch_size: int, mode: str
+    ) -> Tuple[ExtractionJob, bool]:
+        """A new job, or the job that is already running and False."""
+        with self.lock:
+            running = next((job for job in self.jobs.values() if job.is_active), None)
+            if running is not None:
+                return running, False
+            os.makedirs(self.jobs_folder, exist_ok=True)
+            job = ExtractionJob.create(self.jobs_folder, folder_path, output_json_path, batch_size, mode)
+            self.jobs[job.job_id] = job
+        job.save(force=True)
+        return job, True
+
+    def start(self, folder_path: str, output_json_path: str, batch_size: int, mode: str = MODE_FULL) -> ExtractionJob:
+        """Start a new job, or return the job that is already running."""
+        job, created = self._register(folder_path, output_json_path, batch_size, mode)
+        if created:
+            self._launch(job)
+        return job
+
+    def run_inline(self, folder_path: str, output_json_path: str, batch_size: int) -> Tuple[ExtractionJob, Optional[tuple]]:
+        """
+        Extract in the calling thread, registered as a job so its progress shows under /jobs and no other
+        extraction starts on the same manifest and store meanwhile. Returns the job and process_all_pdfs'
+        result, or the job that is already running and None.
+        """
+        job, created = self._register(folder_path, output_json_path, batch_size, MODE_FULL)
+        return job, job.run_inline() if created else None
+
+    def resume(self):
+        """Load persisted jobs and restart the one that was interrupted by a shutdown."""
+        if not os.path.isdir(self.jobs_folder):
+            return
+        interrupted = []
+        for name in os.listdir(self.jobs_folder):
+            if not name.endswith(".json"):
+                continue
+            try:
+                job = ExtractionJob.load(os.path.join(self.jobs_folder, name))
+            except Exception as e:
+                logger.error("Could not load job state %s: %s", name, e)
+                continue
+            with self.lock:
+                self.jobs[job.job_id] = job
+            if job.state["Status"] == CANCELLING:
+                job._set(Status=CANCELLED, FinishedAt=_now())
+            elif job.is_active:
+                interrupted.append(job)
+        # Only one job can run at a time; older interrupted jobs are superseded by the newest
+        interrupted.sort(key=lambda j: j.state["CreatedAt"])
+        for job in interrupted[:-1]:
+            job._set(Status=CANCELLED, FinishedAt=_now(), Message="Superseded by a newer job on restart")
+        if interrupted:
+            job = interrupted[-1]
+            logger.info("Resuming extraction job %s", job.job_id)
+            job._set(Resumes=job.state.get("Resumes", 0) + 1)
+            self._launch(job)
+
+    @staticmethod
+    def _launch(job: ExtractionJob):
+        threading.Thread(target=job.run, name=f"extraction-{job.job_id}", daemon=True).start()
@@ -0,0 +1,112 @@
+import os
+import json
+import hashlib
+import logging
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILENAME = "extraction_manifest.json"
+MANIFEST_VERSION = 1
+HASH_CHUNK_SIZE = 1024 * 1024
+HEADER_SCAN_BYTES = 1024
+TRAILER_SCAN_BYTES = 2048
+
+STATUS_OK = "ok"
+STATUS_CORRUPT = "corrupt"
+STATUS_INCOMPLETE = "incomplete"  # Stored, but some pages failed to extract; redone on the next run
+
+# Classification of a PDF against the manifest
+NEW = "new"
+CHANGED = "changed"
+UNCHANGED = "unchanged"
+SKIPPED = "skipped"
+RETRY = "retry"
+
+
+def manifest_path(output_json_base: str) -> str:
+    return os.path.join(output_json_base, MANIFEST_FILENAME)
+
+
+def load_manifest(output_json_base: str) -> Dict[str, dict]:
+    path = manifest_path(output_json_base)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except Exception as e:
+        logger.error("Could not load manifest %s, starting fresh: %s", path, e)
+        return {}
+    if data.get("version") != MANIFEST_VERSION:
+        logger.info("Manifest version changed, re-extracting all files")
+        return {}
+    return data.get("files", {})
+
+
+def save_manifest(output_json_base: str, entries: Dict[str, dict]):
+    """Write the manifest atomically so an interrupted run never leaves it half written."""
+    os.makedirs(output_json_base, exist_ok=True)
+    path = manifest_path(output_json_base)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"version": MANIFEST_VERSION, "files": entries}, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def quick_pdf_check(path: str) -> Optional[str]:
+    """Cheap structural check: returns an error message if the file cannot be a valid PDF."""
+    try:
+        size = os.path.getsize(path)
+        with open(path, "rb") as f:
+            header = f.read(HEADER_SCAN_BYTES)
+            f.seek(max(0, size - TRAILER_SCAN_BYTES))
+            trailer = f.read()
+    except OSError as e:
+        return f"Unreadable file: {e}"
+    if b"%PDF-" not in header:
+        return "Missing %PDF header"
+    if b"startxref" not in trailer and b"%%EOF" not in trailer:
+        return "Missing xref trailer"
+    return None
+
+
+def fingerprint(path: str) -> Tuple[int, int]:
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def _unchanged_state(entry: dict) -> str:
+    status = entry.get("status")
+    if status == STATUS_CORRUPT:
+        return SKIPPED
+    if status == STATUS_INCOMPLETE:
+        return RETRY
+    return UNCHANGED
+
+
+def classify(path: str, entry: Optional[dict]) -> Tuple[str, dict]:
+    """
+    Compare a PDF against its manifest entry.
+    Size and mtime are checked first; the content hash is only computed when they differ,
+    so unchanged files cost a single stat call. Unchanged files whose last extraction was
+    incomplete are classified RETRY.
+    """
+    size, mtime = fingerprint(path)
+    if entry and entry.get("size") == size and entry.get("mtime") == mtime:
+        return _unchanged_state(entry), entry
+
+    digest = file_hash(path)
+    if entry and entry.get("sha256") == digest:
+        entry = dict(entry, size=size, mtime=mtime)
+        return _unchanged_state(entry), entry
+
+    return (CHANGED if entry else NEW), {"size": size, "mtime": mtime, "sha256": digest}
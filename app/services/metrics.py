@@ -0,0 +1,202 @@
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Default histogram buckets in seconds, from sub-millisecond index lookups to multi-second OCR pages
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Iterable[Tuple[str, str]]) -> str:
+    labels = list(labels)
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> List[Tuple[str, List[Tuple[str, str]], float]]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for name, labels, value in self.samples():
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return [(self.name, list(zip(self.labelnames, key)), value) for key, value in values]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # Per-bucket counts (the last slot is +Inf), then sum and count
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, timings: Optional[Dict[str, float]] = None, timing_key: Optional[str] = None, **labels):
+        """Observe the duration of the block; also add it to timings[timing_key] when a dict is given."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.observe(elapsed, **labels)
+            if timings is not None and timing_key:
+                timings[timing_key] = timings.get(timing_key, 0.0) + elapsed
+
+    def totals(self) -> Dict[Tuple[str, ...], Tuple[int, float]]:
+        """(count, sum) of every label combination observed so far."""
+        with self._lock:
+            return {key: (count, total) for key, (_, total, count) in self._series.items()}
+
+    def samples(self):
+        with self._lock:
+            series = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self._series.items())
+        samples = []
+        for key, (counts, total, count) in series:
+            labels = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                samples.append((f"{self.name}_bucket", labels + [("le", _format_value(float(bound)))], cumulative))
+            samples.append((f"{self.name}_sum", labels, total))
+            samples.append((f"{self.name}_count", labels, count))
+        return samples
+
+
+class Gauge(_Metric):
+    """A gauge read from a callback at scrape time; the callback returns {label values tuple: value}."""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, read: Callable[[], Dict[Tuple[str, ...], float]],
+                 labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.read = read
+
+    def samples(self):
+        return [(self.name, list(zip(self.labelnames, key)), value) for key, value in sorted(self.read().items())]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics)
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+registry = Registry()
+
+
+def counter(name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+    return registry.register(Counter(name, documentation, labelnames))
+
+
+def histogram(name: str, documentation: str, labelnames: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+    return registry.register(Histogram(name, documentation, labelnames, buckets))
+
+
+def gauge(name: str, documentation: str, read, labelnames: Tuple[str, ...] = ()) -> Gauge:
+    return registry.register(Gauge(name, documentation, read, labelnames))
+
+
+# Extraction pipeline
+EXTRACTION_STAGE_SECONDS = histogram(
+    "claims_extraction_stage_seconds",
+    "Time spent in each extraction stage, per page (route per document, store/index writes per document).",
+    ("stage",)
+)
+EXTRACTION_QUEUE_WAIT_SECONDS = histogram(
+    "claims_extraction_queue_wait_seconds",
+    "Time a page waited in a bounded pipeline queue or for a free OCR worker.",
+    ("queue",)
+)
+EXTRACTION_PAGES = counter("claims_extraction_pages_total", "Pages extracted, by route.", ("route",))
+EXTRACTION_STAGE_FAILURES = counter("claims_extraction_failures_total", "Pages or documents that failed, by stage.", ("stage",))
+EXTRACTION_ESCALATIONS = counter(
+    "claims_extraction_escalations_total", "OCR pages re-OCR'd at high DPI, whole page or by region.", ("mode",)
+)
+EXTRACTION_DOCUMENTS = counter("claims_extraction_documents_total", "Documents finished by the pipeline, by result.", ("result",))
+
+# Document store
+STORE_BYTES_READ = counter("claims_store_bytes_read_total", "Bytes read from document store shards.")
+STORE_BYTES_WRITTEN = counter("claims_store_bytes_written_total", "Bytes appended to document store shards.")
+
+# Search
+SEARCH_SECONDS = histogram("claims_search_seconds", "Time to answer a search request, by path.", ("path",))
+SEARCH_FIELD_SECONDS = histogram("claims_search_field_seconds", "Time to evaluate one search field.", ("field",))
+SEARCH_REQUESTS = counter("claims_search_requests_total", "Search requests, by outcome.", ("outcome",))
+
+
+def render() -> str:
+    return registry.render()
@@ -0,0 +1,164 @@
+import shlex
+import logging
+import threading
+from typing import Dict, Tuple
+
+import numpy as np
+import pytesseract
+
+from app.config import OCR_BACKEND, TESSDATA_PATH
+
+logger = logging.getLogger(__name__)
+
+BACKEND_AUTO = "auto"
+BACKEND_TESSEROCR = "tesserocr"
+BACKEND_PYTESSERACT = "pytesseract"
+OCR_BACKENDS = (BACKEND_AUTO, BACKEND_TESSEROCR, BACKEND_PYTESSERACT)
+
+DATA_KEYS = (
+    "level", "page_num", "block_num", "par_num", "line_num", "word_num",
+    "left", "top", "width", "height", "conf", "text",
+)
+
+
+def parse_config(config: str) -> Tuple[int, int, Tuple[Tuple[str, str], ...]]:
+    """Split a tesseract command-line config ('--oem 1 --psm 6 -c name=value') into (oem, psm, variables)."""
+    oem, psm, variables = 1, 3, []
+    args = shlex.split(config or "")
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        if arg == "--oem" and i + 1 < len(args):
+            oem = int(args[i + 1])
+            i += 1
+        elif arg == "--psm" and i + 1 < len(args):
+            psm = int(args[i + 1])
+            i += 1
+        elif arg == "-c" and i + 1 < len(args):
+            name, _, value = args[i + 1].partition("=")
+            variables.append((name, value))
+            i += 1
+        i += 1
+    return oem, psm, tuple(variables)
+
+
+class PytesseractEngine:
+    """Runs the tesseract binary once per image: a temp file, a process spawn and a model load each time."""
+    name = BACKEND_PYTESSERACT
+
+    def image_to_string(self, img, config: str) -> str:
+        return pytesseract.image_to_string(img, config=config)
+
+    def image_to_data(self, img, config: str) -> Dict[str, list]:
+        return pytesseract.image_to_data(img, config=config, output_type=pytesseract.Output.DICT)
+
+
+class TesserocrEngine:
+    """
+    Keeps a Tesseract API handle alive for each config, per thread (a handle is not thread-safe),
+    so the model is loaded once per worker and pages are passed in memory.
+    """
+    name = BACKEND_TESSEROCR
+
+    def __init__(self, tessdata_path=None):
+        import tesserocr
+
+        self.tesserocr = tesserocr
+        self.tessdata_path = tessdata_path
+        self._local = threading.local()
+
+    def _api(self, config: str):
+        apis = getattr(self._local, "apis", None)
+        if apis is None:
+            apis = self._local.apis = {}
+        api = apis.get(config)
+        if api is None:
+            oem, psm, variables = parse_config(config)
+            options = {"psm": psm, "oem": oem}  # tesserocr.PSM / OEM only name these ints
+            if self.tessdata_path:
+                options["path"] = self.tessdata_path
+            api = self.tesserocr.PyTessBaseAPI(**options)
+            for name, value in variables:
+                api.SetVariable(name, value)
+            apis[config] = api
+        return api
+
+    def _set_image(self, img, config: str):
+        img = np.ascontiguousarray(img, dtype=np.uint8)
+        if img.ndim == 3 and img.shape[2] == 1:
+            img = img[:, :, 0]
+        height, width = img.shape[:2]
+        channels = 1 if img.ndim == 2 else img.shape[2]
+        api = self._api(config)
+        api.SetImageBytes(img.tobytes(), width, height, channels, width * channels)
+        return api
+
+    def image_to_string(self, img, config: str) -> str:
+        api = self._set_image(img, config)
+        try:
+            return api.GetUTF8Text()
+        finally:
+            api.Clear()
+
+    def image_to_data(self, img, config: str) -> Dict[str, list]:
+        """Word-level results in the same layout as pytesseract's image_to_data(output_type=DICT)."""
+        RIL = self.tesserocr.RIL
+        api = self._set_image(img, config)
+        data = {key: [] for key in DATA_KEYS}
+        try:
+            api.Recognize()
+            iterator = api.GetIterator()
+            block = par = line = word = 0
+            for item in (self.tesserocr.iterate_level(iterator, RIL.WORD) if iterator else ()):
+                if item.IsAtBeginningOf(RIL.BLOCK):
+                    block, par, line = block + 1, 0, 0
+                if item.IsAtBeginningOf(RIL.PARA):
+                    par, line = par + 1, 0
+                if item.IsAtBeginningOf(RIL.TEXTLINE):
+                    line, word = line + 1, 0
+                word += 1
+                box = item.BoundingBox(RIL.WORD)
+                if box is None:
+                    continue
+                left, top, right, bottom = box
+                values = (
+                    5, 1, block, par, line, word, left, top, right - left, bottom - top,
+                    item.Confidence(RIL.WORD), item.GetUTF8Text(RIL.WORD) or "",
+                )
+                for key, value in zip(DATA_KEYS, values):
+                    data[key].append(value)
+        finally:
+            api.Clear()
+        return data
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def create_engine(backend: str = OCR_BACKEND):
+    """The requested backend, falling back to pytesseract when tesserocr is not installed or cannot start."""
+    if backend not in OCR_BACKENDS:
+        logger.error(f"Unknown OCR backend '{backend}', using {BACKEND_PYTESSERACT}")
+        backend = BACKEND_PYTESSERACT
+    if backend in (BACKEND_AUTO, BACKEND_TESSEROCR):
+        try:
+            engine = TesserocrEngine(TESSDATA_PATH)
+            engine._api("")  # Fail here, not on the first page, if the model cannot be loaded
+            return engine
+        except Exception as e:  # Not installed, no model, or a binding that does not start
+            if backend == BACKEND_TESSEROCR:
+                logger.warning(f"tesserocr is not usable ({e}), falling back to {BACKEND_PYTESSERACT}")
+            elif not isinstance(e, ImportError):
+                logger.warning(f"tesserocr is installed but could not start ({e}), using {BACKEND_PYTESSERACT}")
+    return PytesseractEngine()
+
+
+def get_engine():
+    """The OCR engine of this process, created on first use (so each pool worker builds its own)."""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = create_engine()
+            logger.info(f"OCR backend: {_engine.name}")
+        return _engine
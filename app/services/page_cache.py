@@ -0,0 +1,194 @@
+"""
+Content-addressed cache of OCR results per page image.
+
+Pages are keyed on an exact hash (BLAKE2b) of the binarized image that would be sent to Tesseract,
+which catches pages rendered from identical content: repeated cover sheets, terms and conditions,
+the same PDF filed twice. The key includes the extraction variant (mode, resolution, engine), so
+text is never reused across settings that would OCR the page differently. Pages that merely look
+alike are not reused: a same-layout form holding another customer's name or amounts differs from
+its neighbours by too few pixels for any thumbnail comparison to tell them apart.
+
+The store is a SQLite file next to the search index, evicted least-recently-used past a byte budget.
+"""
+import os
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from typing import Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from app.config import PAGE_CACHE_MAX_MB
+from app.services.metrics import counter, gauge
+
+logger = logging.getLogger(__name__)
+
+PAGE_CACHE_FILENAME = "page_cache.sqlite3"
+PAGE_CACHE_MAX_BYTES = PAGE_CACHE_MAX_MB * 1024 * 1024
+PAGE_CACHE_ENTRY_OVERHEAD = 256  # Bytes of keys and bookkeeping per entry, on top of the text
+EVICT_TO_RATIO = 0.9  # Evict down to this share of the budget, so eviction does not run on every put
+SCHEMA_VERSION = 2  # 1 also matched pages by perceptual hash
+
+BLANK_DARK_LEVEL = 128  # Gray level below which a pixel counts as ink
+BLANK_MAX_INK_PIXELS = 50  # At 100 DPI, about one printed character
+
+HIT_EXACT = "exact"
+MISS = "miss"
+BLANK = "blank"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    exact TEXT PRIMARY KEY,
+    variant TEXT NOT NULL,
+    text TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS pages_last_used ON pages (last_used);
+"""
+
+PAGE_CACHE_LOOKUPS = counter("claims_page_cache_lookups_total", "OCR page cache lookups, by result.", ("result",))
+
+
+def page_variant(mode: str, dpi: int, adaptive: bool, engine: str, templates=None) -> str:
+    """
+    Everything besides the pixels that decides what text a page OCRs to.
+    `engine` is the name of the engine the OCR workers run, not the OCR_BACKEND setting ("auto").
+    """
+    regions = ";".join(f"{name}={box}" for name, box in sorted((templates or {}).items()))
+    return f"{mode}:{dpi}:{int(adaptive)}:{engine}:{regions}"
+
+
+def is_blank_page(gray, dpi: int = 100) -> bool:
+    """True if a grayscale page has no more ink than scanner speckle; checked before binarization."""
+    if gray.ndim == 3:
+        gray = gray[:, :, 0]
+    ink = cv2.medianBlur(np.where(gray < BLANK_DARK_LEVEL, 255, 0).astype(np.uint8), 3)
+    return cv2.countNonZero(ink) <= BLANK_MAX_INK_PIXELS * (dpi / 100.0) ** 2
+
+
+def exact_hash(binary, variant: str) -> str:
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(variant.encode("utf-8"))
+    digest.update(str(binary.shape).encode("ascii"))
+    digest.update(np.ascontiguousarray(binary).data)
+    return digest.hexdigest()
+
+
+class PageCache:
+    """Persistent page-image to text cache. Safe to share between threads."""
+
+    def __init__(self, path: str, max_bytes: int = PAGE_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        if self._conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+            self._conn.executescript("DROP TABLE IF EXISTS page_bands; DROP TABLE IF EXISTS pages;")
+            self._conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self._conn.executescript(SCHEMA)
+        self._bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+        self.counts = {HIT_EXACT: 0, MISS: 0, BLANK: 0}
+        self.evictions = 0
+
+    def record_blank(self):
+        with self._lock:
+            self.counts[BLANK] += 1
+        PAGE_CACHE_LOOKUPS.inc(result=BLANK)
+
+    def lookup(self, exact: str) -> Tuple[Optional[str], str]:
+        """Cached text for a page, and whether it was a hit or a miss."""
+        with self._lock:
+            row = self._conn.execute("SELECT text FROM pages WHERE exact = ?", (exact,)).fetchone()
+            if row is not None:
+                self._conn.execute("UPDATE pages SET last_used = ? WHERE exact = ?", (time.time(), exact))
+                self._conn.commit()
+            result = HIT_EXACT if row is not None else MISS
+            self.counts[result] += 1
+        PAGE_CACHE_LOOKUPS.inc(result=result)
+        return (row[0] if row is not None else None), result
+
+    def put(self, exact: str, variant: str, text: str):
+        size = len(text.encode("utf-8")) + PAGE_CACHE_ENTRY_OVERHEAD
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._conn.execute("SELECT size FROM pages WHERE exact = ?", (exact,)).fetchone()
+            if previous is not None:
+                self._bytes -= previous[0]
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pages (exact, variant, text, size, last_used) VALUES (?, ?, ?, ?, ?)",
+                (exact, variant, text, size, time.time())
+            )
+            self._bytes += size
+            if self._bytes > self.max_bytes:
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        target = self.max_bytes * EVICT_TO_RATIO
+        evicted = 0
+        for exact, size in self._conn.execute("SELECT exact, size FROM pages ORDER BY last_used").fetchall():
+            if self._bytes <= target:
+                break
+            self._conn.execute("DELETE FROM pages WHERE exact = ?", (exact,))
+            self._bytes -= size
+            evicted += 1
+        self.evictions += evicted
+        logger.info(f"Page cache evicted {evicted} entries, {self._bytes} bytes kept")
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = dict(self.counts)
+            evictions = self.evictions
+            entries = self._conn.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+            size = self._bytes
+        lookups = counts[HIT_EXACT] + counts[MISS]
+        hits = counts[HIT_EXACT]
+        return {
+            "Entries": entries,
+            "Bytes": size,
+            "MaxBytes": self.max_bytes,
+            "Hits": counts[HIT_EXACT],
+            "Misses": counts[MISS],
+            "BlankPages": counts[BLANK],
+            "HitRate": round(hits / lookups, 4) if lookups else 0.0,
+            "Evictions": evictions,
+        }
+
+
+_caches: Dict[str, PageCache] = {}
+_caches_lock = threading.Lock()
+
+
+def page_cache_path(output_json_folder: str) -> str:
+    return os.path.join(output_json_folder, PAGE_CACHE_FILENAME)
+
+
+def open_page_cache(output_json_folder: str) -> PageCache:
+    """Process-wide page cache for an output folder."""
+    path = page_cache_path(output_json_folder)
+    with _caches_lock:
+        cache = _caches.get(path)
+        if cache is None:
+            os.makedirs(output_json_folder, exist_ok=True)
+            cache = _caches[path] = PageCache(path)
+        return cache
+
+
+def all_page_cache_stats() -> Dict[str, dict]:
+    with _caches_lock:
+        caches = dict(_caches)
+    return {path: cache.stats() for path, cache in caches.items()}
+
+
+gauge(
+    "claims_page_cache_bytes",
+    "Size of each open OCR page cache.",
+    lambda: {(path,): stats["Bytes"] for path, stats in all_page_cache_stats().items()},
+    ("path",)
+)
@@ -0,0 +1,169 @@
+"""
+Parallel search over the document store.
+
+Documents are partitioned into one search shard per worker by a stable hash of their filename.
+Every shard is served by its own long-lived process (a single-worker ProcessPoolExecutor), so each
+process keeps the decoded pages of its shard warm between queries, up to a per-shard memory cap;
+documents past the cap are decoded from the store each time. A query plan is sent to every shard,
+scanned there (see QueryPlan.scan) and the matches are merged here.
+
+Workers pick up documents added, replaced or removed since the last query from the store's offset
+index, so they never need to be told about ingests.
+"""
+import os
+import time
+import zlib
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional, Tuple
+
+from app.config import SEARCH_SHARD_MAX_MB, SEARCH_WORKERS
+from app.services.metrics import SEARCH_FIELD_SECONDS
+from app.services.query_plan import QueryPlan, iter_matching_documents
+from app.services.storage import DocumentStore, open_store, store_path
+
+logger = logging.getLogger(__name__)
+
+SHARD_MAX_BYTES = SEARCH_SHARD_MAX_MB * 1024 * 1024
+PAGE_OVERHEAD_BYTES = 56  # Python str header per cached page
+
+_pools: List[ProcessPoolExecutor] = []
+_pools_lock = threading.Lock()
+
+
+def shard_of(filename: str, shard_count: int) -> int:
+    """Stable across processes and runs, unlike hash(), so a worker keeps the same documents."""
+    return zlib.crc32(filename.encode("utf-8")) % shard_count
+
+
+def _pages_size(pages: List[str]) -> int:
+    return sum(len(page) + PAGE_OVERHEAD_BYTES for page in pages)
+
+
+class _ShardState:
+    """A worker's view of its shard: the store, and the decoded documents it keeps in memory."""
+
+    def __init__(self, output_json_folder: str, max_bytes: int):
+        self.store = DocumentStore(store_path(output_json_folder))
+        self.max_bytes = max_bytes
+        self.documents: Dict[str, Tuple[Tuple[str, int, int], List[str]]] = {}
+        self.bytes = 0
+
+    def sync(self, shard_id: int, shard_count: int) -> List[str]:
+        """Drop cached documents that were replaced, removed or moved to another shard; returns this shard's files."""
+        self.store.refresh()
+        locations = self.store.locations
+        mine = [filename for filename in locations if shard_of(filename, shard_count) == shard_id]
+        keep = set(mine)
+        for filename in list(self.documents):
+            location, pages = self.documents[filename]
+            if filename not in keep or locations.get(filename) != location:
+                del self.documents[filename]
+                self.bytes -= _pages_size(pages)
+        return mine
+
+    def iter_documents(self, filenames: List[str]):
+        """
+        Yield (filename, pages) from memory where possible. New documents are kept while the shard is
+        under its cap; past it they are decoded for this query only, so a full scan cannot thrash the cache.
+        """
+        for filename in filenames:
+            cached = self.documents.get(filename)
+            if cached is not None:
+                yield filename, cached[1]
+                continue
+            location = self.store.locations.get(filename)
+            try:
+                pages = self.store.get(filename)
+            except KeyError:
+                continue  # Removed since sync
+            size = _pages_size(pages)
+            if self.bytes + size <= self.max_bytes:
+                self.documents[filename] = (location, pages)
+                self.bytes += size
+            yield filename, pages
+
+
+# Worker-process state, keyed by output folder and shard layout
+_shards: Dict[Tuple[str, int, int], _ShardState] = {}
+
+
+def _search_shard(output_json_folder: str, shard_id: int, shard_count: int, max_bytes: int, plan: QueryPlan):
+    """Runs in the shard's worker; returns its matches and how much of the shard was served from memory."""
+    start = time.perf_counter()
+    key = (output_json_folder, shard_id, shard_count)
+    shard = _shards.get(key)
+    if shard is None or shard.max_bytes != max_bytes:
+        shard = _shards[key] = _ShardState(output_json_folder, max_bytes)
+    filenames = shard.sync(shard_id, shard_count)
+    warm = sum(filename in shard.documents for filename in filenames)
+    matches = list(iter_matching_documents(plan, shard.iter_documents(filenames)))
+    stats = {
+        "documents": len(filenames),
+        "warm": warm,
+        "cached": len(shard.documents),
+        "cached_bytes": shard.bytes,
+        "seconds": time.perf_counter() - start,
+    }
+    return matches, stats
+
+
+def get_search_pools(workers: int) -> List[ProcessPoolExecutor]:
+    """One single-process pool per shard, created once and reused by every search."""
+    global _pools
+    with _pools_lock:
+        if len(_pools) != workers:
+            for pool in _pools:
+                pool.shutdown(wait=False)
+            _pools = [ProcessPoolExecutor(max_workers=1) for _ in range(workers)]
+        return list(_pools)
+
+
+def shutdown_search_pools():
+    global _pools
+    with _pools_lock:
+        for pool in _pools:
+            pool.shutdown(wait=True)
+        _pools = []
+
+
+def iter_in_parallel(
+    plan: QueryPlan,
+    output_json_folder: str,
+    workers: int = SEARCH_WORKERS,
+    max_bytes: int = SHARD_MAX_BYTES,
+    timings: Optional[Dict[str, float]] = None,
+    counts: Optional[Dict[str, int]] = None
+):
+    """
+    Evaluate the plan on every shard at once and yield (filename, reasons, hits) shard by shard, as each
+    one finishes. Raises BrokenProcessPool if a worker died; the pools are recreated on the next call.
+    If `counts` is given, the number of documents searched is added to its "documents".
+    """
+    workers = workers or os.cpu_count() or 1
+    open_store(output_json_folder)  # Migrates legacy batch files before the workers read the store
+    try:
+        futures = {
+            pool.submit(_search_shard, output_json_folder, shard_id, workers, max_bytes, plan): shard_id
+            for shard_id, pool in enumerate(get_search_pools(workers))
+        }
+        for future in as_completed(futures):
+            shard_id = futures[future]
+            with SEARCH_FIELD_SECONDS.time(timings, "parallel_merge", field="parallel_merge"):
+                matches, stats = future.result()
+            if timings is not None:
+                timings[f"shard:{shard_id}"] = stats["seconds"]
+            if counts is not None:
+                counts["documents"] = counts.get("documents", 0) + stats["documents"]
+            logger.info(
+                f"Shard {shard_id}/{workers}: {len(matches)} of {stats['documents']} documents matched, "
+                f"{stats['warm']} served from memory ({stats['cached_bytes']} bytes cached)"
+            )
+            yield from matches
+    except BrokenProcessPool:
+        logger.error("A search worker died, the search workers are restarted on the next search")
+        shutdown_search_pools()
+        raise
+
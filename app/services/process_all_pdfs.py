@@ -1,7 +1,10 @@
-def process_all_pdfs(folder_path: str, output_json_path: str,batch_size:int):
-    from app.services.extractor import process_folder_fast
-    processed_count, total_files = process_folder_fast(folder_path, output_json_path,batch_size)
-    if total_files == 0 or processed_count ==0:
-        return False, output_json_path, "No file exist in the folder or files are corrupted"
-    percent = processed_count / total_files
-    return percent >= 0.9, output_json_path, "",processed_count,total_files
+def process_all_pdfs(folder_path: str, output_json_path: str,batch_size:int, progress=None, cancel_event=None, mode=None):
+    from app.services.extractor import MODE_FULL, process_folder_fast
+    processed_count, total_files, stats = process_folder_fast(
+        folder_path, output_json_path, batch_size, progress=progress, cancel_event=cancel_event, mode=mode or MODE_FULL
+    )
+    available_count = processed_count + stats["unchanged"]
+    if total_files == 0 or available_count ==0:
+        return False, output_json_path, "No file exist in the folder or files are corrupted",processed_count,total_files,stats
+    percent = available_count / total_files
+    return percent >= 0.9, output_json_path, "",processed_count,total_files,stats
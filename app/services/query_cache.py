@@ -0,0 +1,131 @@
+import time
+import threading
+from collections import OrderedDict
+from types import MappingProxyType
+from typing import Dict, Hashable, Mapping, Optional, Tuple
+
+from app.services.fields import normalize_vin_query
+from app.services.metrics import gauge
+
+QUERY_CACHE_MAX_ENTRIES = 1024
+QUERY_CACHE_MAX_BYTES = 16 * 1024 * 1024  # Approximate size of the cached file lists and match reasons
+QUERY_CACHE_TTL_SECONDS = 600
+
+_ENTRY_OVERHEAD_BYTES = 200
+_NAME_OVERHEAD_BYTES = 60
+
+
+def normalize_criteria(active_fields: Dict[str, str]) -> Tuple[Tuple[str, str], ...]:
+    """
+    Canonical form of already field_map-ed search criteria, so equivalent requests share a cache entry.
+    Only differences that cannot change the result are normalized away.
+    """
+    normalized = {}
+    for field, value in active_fields.items():
+        value = value.strip()
+        if field == "VIN":
+            value = normalize_vin_query(value)
+        elif field == "Dealer":
+            value = value.lower()  # Dealer matching is case-insensitive
+        normalized[field] = value
+    return tuple(sorted(normalized.items()))
+
+
+def _entry_size(matches: Mapping[str, Tuple[str, ...]]) -> int:
+    return _ENTRY_OVERHEAD_BYTES + sum(
+        len(f) + _NAME_OVERHEAD_BYTES + sum(len(r) + _NAME_OVERHEAD_BYTES for r in reasons)
+        for f, reasons in matches.items()
+    )
+
+
+class QueryCache:
+    """
+    In-process LRU cache of search results ({filename: match reasons}) with a TTL and an entry and byte budget.
+    Keys include the corpus generation, so an ingest makes earlier entries unreachable; they then
+    age out through LRU eviction or the TTL.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = QUERY_CACHE_MAX_ENTRIES,
+        max_bytes: int = QUERY_CACHE_MAX_BYTES,
+        ttl_seconds: float = QUERY_CACHE_TTL_SECONDS,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Hashable, Tuple[float, int, Mapping[str, Tuple[str, ...]]]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable) -> Optional[Mapping[str, Tuple[str, ...]]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, size, matches = entry
+            if expires_at < time.monotonic():
+                self._drop(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return matches
+
+    def put(self, key: Hashable, matches: Dict[str, Tuple[str, ...]]) -> Mapping[str, Tuple[str, ...]]:
+        """Store a result; returns it as the read-only mapping later gets hand out."""
+        matches = MappingProxyType(dict(matches))
+        size = _entry_size(matches)
+        if size > self.max_bytes:
+            return matches
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, size, matches)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+        return matches
+
+    def _drop(self, key: Hashable):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "Entries": len(self._entries),
+                "Bytes": self._bytes,
+                "Hits": self.hits,
+                "Misses": self.misses,
+                "HitRate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "Evictions": self.evictions,
+                "Expirations": self.expirations,
+                "MaxEntries": self.max_entries,
+                "MaxBytes": self.max_bytes,
+                "TtlSeconds": self.ttl_seconds,
+            }
+
+
+query_cache = QueryCache()
+
+gauge(
+    "claims_query_cache",
+    "Search result cache counters (hits, misses, evictions, expirations) and current size (entries, bytes).",
+    lambda: {(key.lower(),): value for key, value in query_cache.stats().items()
+             if key in ("Entries", "Bytes", "Hits", "Misses", "Evictions", "Expirations")},
+    ("stat",)
+)
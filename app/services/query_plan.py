@@ -0,0 +1,335 @@
+"""
+Search requests compiled into query plans.
+
+A plan is a list of predicates, one per requested field, each with a match mode, combined with AND
+or OR. Predicates are ordered cheapest first (structured-field lookups before full-text verification)
+and, at equal cost, most selective first, so AND plans shrink the candidate set before the expensive
+predicates run and OR plans verify text only for documents nothing cheaper has matched.
+
+Over raw text every regex-expressible predicate is folded into one combined pattern, so a document
+is scanned once however many fields are asked for; VIN predicates share one pass over the VIN-like
+runs of the text, since fuzzy VIN similarity cannot be written as a regex.
+"""
+import re
+import logging
+from bisect import bisect_right
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from app.Exception.InvalidQueryException import InvalidQueryException
+from app.services.fields import DEALER_PATTERN, clean_dealer_name, iter_vin_candidates
+from app.services.metrics import SEARCH_FIELD_SECONDS
+from app.services.query_cache import normalize_criteria
+from app.services.search_index import (
+    all_documents, candidate_documents, documents_with_field, documents_with_field_containing,
+    field_signature, field_values_by_document, index_path, iter_document_texts
+)
+from app.services.vin_index import VIN_MATCH_THRESHOLD, get_vin_index, similarity
+
+logger = logging.getLogger(__name__)
+
+OPERATOR_OR = "or"
+OPERATOR_AND = "and"
+OPERATORS = (OPERATOR_OR, OPERATOR_AND)
+
+MATCH_EXACT = "exact"
+MATCH_CONTAINS = "contains"
+MATCH_FUZZY = "fuzzy"
+MATCH_IGNORECASE = "ignorecase"
+MATCH_WORD = "word"
+
+# Request keys, as sent by clients, to the field they search
+FIELD_MAP = {
+    "Dealer Name": "Dealer",
+    "Dealer": "Dealer",
+    "VIN": "VIN",
+    "Contract #": "Contract",
+    "Contract": "Contract",
+    "Claim #": "Claim",
+    "Claim": "Claim",
+    "Search by Word": "searchbyany",
+    "searchbyany": "searchbyany"
+}
+FIELD_LABELS = {
+    "Dealer": "Dealer Name", "VIN": "VIN", "Contract": "Contract #", "Claim": "Claim #", "searchbyany": "Search by Word"
+}
+
+# Match modes each field supports; the first is the default and keeps the historical behaviour
+FIELD_MATCH_MODES = {
+    "VIN": (MATCH_FUZZY, MATCH_EXACT),
+    "Contract": (MATCH_EXACT, MATCH_CONTAINS),
+    "Claim": (MATCH_EXACT, MATCH_CONTAINS),
+    "Dealer": (MATCH_CONTAINS, MATCH_EXACT),
+    "searchbyany": (MATCH_CONTAINS, MATCH_IGNORECASE, MATCH_WORD),
+}
+
+# Relative cost of evaluating a predicate against the search index
+COST_FIELD_LOOKUP = 1  # Indexed equality on the structured-field records
+COST_FIELD_SCAN = 2  # Substring test over one field's records
+COST_VIN_INDEX = 3  # q-gram candidates scored by OCR edit distance
+COST_TEXT = 10  # Trigram candidates verified against their text
+COST_TEXT_UNINDEXED = 50  # Too short for trigrams: every document's text is verified
+
+NUMBER_MIN_DIGITS = 6  # Contract and claim numbers, as in extract_fields
+SNIPPET_CONTEXT_CHARS = 40  # Page text kept on each side of a hit in its snippet
+
+Hit = Tuple[str, int, int, int, str]  # (field, page_no, start, end, snippet); offsets within the page text
+
+
+@lru_cache(maxsize=256)
+def _compile(pattern: str):
+    return re.compile(pattern)
+
+
+def make_snippet(page: str, start: int, end: int, context: int = SNIPPET_CONTEXT_CHARS) -> str:
+    """The hit and some text around it on one line, with an ellipsis where the page text was cut."""
+    left, right = max(0, start - context), min(len(page), end + context)
+    snippet = " ".join(page[left:right].split())
+    return ("..." if left > 0 else "") + snippet + ("..." if right < len(page) else "")
+
+
+class Predicate:
+    """One field of a search request, with its match mode, compiled for the index and for raw text."""
+
+    def __init__(self, field: str, value: str, mode: str):
+        self.field = field
+        self.value = value
+        self.mode = mode
+        self.impossible = not value
+        self.pattern = None
+        if field in ("Contract", "Claim"):
+            # Only numbers of NUMBER_MIN_DIGITS or more are recorded after the keyword
+            self.impossible = not value.isdigit() or (mode == MATCH_EXACT and len(value) < NUMBER_MIN_DIGITS)
+            number = re.escape(value) if mode == MATCH_EXACT else rf"\d*{re.escape(value)}\d*"
+            # The number is captured, so a hit covers it and not its label
+            self.pattern = rf"(?i:{field})[^\n\r]*?(?<!\d)(?=\d{{{NUMBER_MIN_DIGITS}}})({number})(?!\d)"
+            self.cost = COST_FIELD_LOOKUP if mode == MATCH_EXACT else COST_FIELD_SCAN
+        elif field == "Dealer":
+            # Finds candidate lines; match_at cuts the dealer name out and compares it
+            self.pattern = rf"(?i:dealer[:;\s#]*[^\n\r]*?{re.escape(value)})"
+            self.cost = COST_FIELD_LOOKUP if mode == MATCH_EXACT else COST_FIELD_SCAN
+        elif field == "VIN":
+            self.cost = COST_FIELD_LOOKUP if mode == MATCH_EXACT else COST_VIN_INDEX
+        else:
+            escaped = re.escape(value)
+            if mode == MATCH_IGNORECASE:
+                self.pattern = f"(?i:{escaped})"
+            elif mode == MATCH_WORD:
+                self.pattern = rf"(?<!\w){escaped}(?!\w)"
+            else:
+                self.pattern = escaped
+            self.cost = COST_TEXT if len(value) >= 3 else COST_TEXT_UNINDEXED
+        if self.impossible:
+            self.pattern = None
+        self.regex = _compile(self.pattern) if self.pattern else None
+
+    def sort_key(self):
+        # Longer values are rarer, so at equal cost they go first
+        return self.cost, -len(self.value), self.field
+
+    def describe(self) -> str:
+        return f"{FIELD_LABELS[self.field]} {self.mode}: {self.value}"
+
+    # Raw text
+
+    def match_at(self, text: str, pos: int) -> Optional[Tuple[int, int]]:
+        """Span of a match of this predicate starting at pos, if any."""
+        match = self.regex.match(text, pos)
+        if match is None:
+            return None
+        if self.field == "Dealer":
+            dealer = DEALER_PATTERN.match(text, pos)
+            if dealer is None:
+                return None
+            name = clean_dealer_name(dealer.group(1)).lower()
+            if not (name == self.value if self.mode == MATCH_EXACT else self.value in name):
+                return None
+            return dealer.start(1), dealer.end(1)
+        return match.span(1) if self.regex.groups else match.span()
+
+    def vin_matches(self, vin: str) -> bool:
+        if self.mode == MATCH_EXACT:
+            return vin == self.value
+        return similarity(self.value, vin) >= VIN_MATCH_THRESHOLD
+
+    # Search index
+
+    def match_index(self, conn, output_json_folder: str, candidates: Optional[Set[str]] = None) -> Set[str]:
+        """
+        Documents matching this predicate. When candidates is given, only those documents can be returned,
+        and text is verified only for them.
+        """
+        if self.impossible:
+            return set()
+        if self.field == "searchbyany":
+            found = candidate_documents(conn, self.value)
+            if found is None:
+                found = all_documents(conn)
+            if candidates is not None:
+                found &= candidates
+            return {filename for filename, all_text in iter_document_texts(conn, found) if self.regex.search(all_text)}
+        if self.field == "VIN" and self.mode == MATCH_FUZZY:
+            found = match_vin(conn, self.value, output_json_folder)
+        elif self.mode == MATCH_EXACT:
+            found = documents_with_field(conn, self.field, self.value)
+        else:
+            found = documents_with_field_containing(conn, self.field, self.value)
+        return found if candidates is None else found & candidates
+
+
+def match_vin(conn, value: str, output_json_folder: str) -> Set[str]:
+    vin_index = get_vin_index(
+        index_path(output_json_folder),
+        field_signature(conn, "VIN"),
+        lambda: field_values_by_document(conn, "VIN")
+    )
+    scores = vin_index.match_documents(value, VIN_MATCH_THRESHOLD)
+    for filename, score in scores.items():
+        logger.info(f"{'Exact' if score == 1.0 else 'Fuzzy'} VIN match in {filename} (score {score:.2f})")
+    return set(scores)
+
+
+class QueryPlan:
+    """Predicates in evaluation order, combined with `operator`."""
+
+    def __init__(self, operator: str, predicates: List[Predicate]):
+        self.operator = operator
+        self.predicates = sorted(predicates, key=Predicate.sort_key)
+        # Positions in self.predicates of the predicates in the combined pattern, and of the VIN ones
+        self._text_predicates = [i for i, p in enumerate(self.predicates) if p.regex is not None]
+        self._vin_predicates = [i for i, p in enumerate(self.predicates) if p.field == "VIN" and not p.impossible]
+        # Each alternative is a lookahead, so a match of one predicate never consumes text another needs
+        self.scanner = _compile(
+            "|".join(f"(?=(?:{self.predicates[i].pattern}))" for i in self._text_predicates)
+        ) if self._text_predicates else None
+
+    def key(self) -> Tuple:
+        """Identity of the plan for the query cache."""
+        return self.operator, tuple(sorted((p.field, p.value, p.mode) for p in self.predicates))
+
+    def describe(self) -> List[str]:
+        return [f"{p.describe()} (cost {p.cost})" for p in self.predicates]
+
+    def accepts(self, reasons: Tuple[str, ...]) -> bool:
+        """Whether a document satisfying the predicates behind these reasons matches the plan."""
+        if self.operator == OPERATOR_AND:
+            return len(reasons) == len(self.predicates)
+        return bool(reasons)
+
+    # Search index
+
+    def evaluate_index(self, conn, output_json_folder: str, timings=None) -> Dict[str, Tuple[str, ...]]:
+        """Matching documents with the reasons they matched: the predicates they satisfied, in plan order."""
+        if self.operator == OPERATOR_AND and any(p.impossible for p in self.predicates):
+            return {}
+        reasons: Dict[str, List[str]] = {}
+        candidates = None  # With AND, the documents that matched every predicate so far
+        for predicate in self.predicates:
+            if self.operator == OPERATOR_AND:
+                restrict = candidates
+            elif predicate.field == "searchbyany" and reasons:
+                # Verifying text is the expensive part; documents a cheaper predicate matched need none
+                restrict = all_documents(conn) - set(reasons)
+            else:
+                restrict = None
+            with SEARCH_FIELD_SECONDS.time(timings, f"field:{predicate.field}", field=predicate.field):
+                found = predicate.match_index(conn, output_json_folder, restrict)
+            logger.info(f"{len(found)} documents matched {predicate.describe()}")
+            for filename in found:
+                reasons.setdefault(filename, []).append(predicate.describe())
+            if self.operator == OPERATOR_AND:
+                candidates = found
+                if not candidates:
+                    return {}
+        if candidates is not None:
+            return {filename: tuple(reasons[filename]) for filename in candidates}
+        return {filename: tuple(found) for filename, found in reasons.items()}
+
+    # Raw text
+
+    def scan(self, pages: List[str]) -> Tuple[Tuple[str, ...], List[Hit]]:
+        """
+        One pass over a document's text: the reasons it satisfies predicates of the plan (see accepts)
+        and where, on which page, each predicate matched.
+        """
+        text = "\n".join(pages)
+        starts = [0]
+        for page in pages[:-1]:
+            starts.append(starts[-1] + len(page) + 1)
+
+        matched: Set[int] = set()
+        spans: Set[Tuple[int, int, int]] = set()
+        if self.scanner is not None:
+            ends: Dict[int, int] = {}
+            for match in self.scanner.finditer(text):
+                pos = match.start()
+                # Predicates matching at the same position: the alternation only reports the first one
+                for i in self._text_predicates:
+                    span = self.predicates[i].match_at(text, pos)
+                    # Overlapping matches of one predicate (a word inside a repeated word) count once
+                    if span is None or span[0] < ends.get(i, 0):
+                        continue
+                    ends[i] = span[1]
+                    matched.add(i)
+                    spans.add((span[0], span[1], i))
+        if self._vin_predicates:
+            for start, end, vin in iter_vin_candidates(text):
+                for i in self._vin_predicates:
+                    if self.predicates[i].vin_matches(vin):
+                        matched.add(i)
+                        spans.add((start, end, i))
+
+        hits = []
+        for start, end, i in sorted(spans):
+            page_no = bisect_right(starts, start) - 1
+            # A VIN run can continue onto the next page; the hit is clipped to the page it starts on
+            start, end = start - starts[page_no], min(end - starts[page_no], len(pages[page_no]))
+            hits.append((self.predicates[i].field, page_no, start, end, make_snippet(pages[page_no], start, end)))
+        return tuple(self.predicates[i].describe() for i in sorted(matched)), hits
+
+    def merge_reasons(self, *reason_lists: Iterable[str]) -> Tuple[str, ...]:
+        """Union of reasons found by different evaluations, in plan order."""
+        found = {reason for reasons in reason_lists for reason in reasons}
+        return tuple(reason for reason in (p.describe() for p in self.predicates) if reason in found)
+
+
+def compile_query(
+    search_params: Dict[str, Optional[str]],
+    operator: Optional[str] = None,
+    match_modes: Optional[Dict[str, str]] = None
+) -> QueryPlan:
+    """
+    Compile request fields ({"VIN": ..., "Dealer Name": ...}), an operator and per-field match modes
+    (keyed like the request fields) into a plan. Raises InvalidQueryException for unknown operators,
+    fields or modes.
+    """
+    operator = (operator or OPERATOR_OR).lower()
+    if operator not in OPERATORS:
+        raise InvalidQueryException(f"Unknown operator '{operator}', expected one of {', '.join(OPERATORS)}")
+
+    active_fields = {FIELD_MAP[k]: v.strip() for k, v in search_params.items() if v and k in FIELD_MAP}
+    modes = {}
+    for key, mode in (match_modes or {}).items():
+        field = FIELD_MAP.get(key)
+        if field is None:
+            raise InvalidQueryException(f"Unknown search field '{key}' in match modes")
+        mode = (mode or "").lower()
+        if mode not in FIELD_MATCH_MODES[field]:
+            raise InvalidQueryException(
+                f"Unknown match mode '{mode}' for {key}, expected one of {', '.join(FIELD_MATCH_MODES[field])}"
+            )
+        modes[field] = mode
+
+    predicates = [
+        Predicate(field, value, modes.get(field, FIELD_MATCH_MODES[field][0]))
+        for field, value in normalize_criteria(active_fields)
+    ]
+    return QueryPlan(operator, predicates)
+
+
+def iter_matching_documents(plan: QueryPlan, documents: Iterable[Tuple[str, List[str]]]):
+    """Yield (filename, reasons, hits) for the documents, given as (filename, pages), that match the plan."""
+    for filename, pages in documents:
+        reasons, hits = plan.scan(pages)
+        if plan.accepts(reasons):
+            yield filename, reasons, hits
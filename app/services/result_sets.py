@@ -0,0 +1,131 @@
+import os
+import time
+import uuid
+import base64
+import logging
+import binascii
+import threading
+from bisect import bisect_right
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.Exception.InvalidQueryException import InvalidQueryException
+
+logger = logging.getLogger(__name__)
+
+RESULT_SET_MAX_ENTRIES = 256
+RESULT_SET_TTL_SECONDS = 4 * 60 * 60
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+def encode_cursor(filename: str) -> str:
+    """A cursor is the last file name of the previous page, so pages stay stable while files are paged."""
+    return base64.urlsafe_b64encode(filename.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> str:
+    try:
+        return base64.b64decode(cursor + "=" * (-len(cursor) % 4), altchars=b"-_", validate=True).decode("utf-8")
+    except (binascii.Error, ValueError):
+        raise InvalidQueryException(f"Invalid cursor: {cursor}")
+
+
+def page_size(limit: Optional[int]) -> int:
+    if limit is None:
+        return DEFAULT_PAGE_SIZE
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise InvalidQueryException(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+    return limit
+
+
+class ResultSet:
+    """The documents matched by one search. Only file names are kept; the PDFs stay in the input folder."""
+
+    def __init__(
+        self, input_folder: str, files: Iterable[str], criteria: dict,
+        reasons: Optional[Dict[str, Tuple[str, ...]]] = None, plan=None, output_json_folder: Optional[str] = None
+    ):
+        self.result_set_id = uuid.uuid4().hex
+        self.input_folder = input_folder
+        self.files: List[str] = sorted(files)
+        self.criteria = dict(criteria)
+        # Kept so later pages can locate their hits (see app.services.search.locate_matches)
+        self.reasons = dict(reasons or {})
+        self.plan = plan
+        self.output_json_folder = output_json_folder
+        self.created_at = datetime.now(timezone.utc).isoformat()
+        self.expires_at = 0.0
+
+    def entries(self) -> List[Tuple[str, str]]:
+        """(path, arcname) of every matched file that is still present in the input folder."""
+        entries = []
+        for filename in self.files:
+            path = os.path.join(self.input_folder, os.path.basename(filename))
+            if os.path.isfile(path):
+                entries.append((path, os.path.basename(filename)))
+            else:
+                logger.warning(f"{filename} from result set {self.result_set_id} is no longer in {self.input_folder}")
+        return entries
+
+    def page(self, cursor: Optional[str] = None, limit: Optional[int] = None) -> Tuple[List[str], Optional[str]]:
+        """The files after `cursor`, at most `limit` of them, and the cursor of the next page (None on the last)."""
+        limit = page_size(limit)
+        start = bisect_right(self.files, decode_cursor(cursor)) if cursor else 0
+        files = self.files[start:start + limit]
+        next_cursor = encode_cursor(files[-1]) if start + limit < len(self.files) else None
+        return files, next_cursor
+
+    def describe(self) -> dict:
+        return {
+            "ResultSetId": self.result_set_id,
+            "CreatedAt": self.created_at,
+            "Criteria": self.criteria,
+            "FileCount": len(self.files),
+            "files": self.files,
+        }
+
+
+class ResultSetRegistry:
+    """In-process registry of recent result sets, bounded by count and age."""
+
+    def __init__(self, max_entries: int = RESULT_SET_MAX_ENTRIES, ttl_seconds: float = RESULT_SET_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._sets: "OrderedDict[str, ResultSet]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(
+        self, input_folder: str, files: Iterable[str], criteria: dict,
+        reasons: Optional[Dict[str, Tuple[str, ...]]] = None, plan=None, output_json_folder: Optional[str] = None
+    ) -> ResultSet:
+        result_set = ResultSet(input_folder, files, criteria, reasons, plan, output_json_folder)
+        result_set.expires_at = time.monotonic() + self.ttl_seconds
+        with self._lock:
+            self._expire()
+            self._sets[result_set.result_set_id] = result_set
+            while len(self._sets) > self.max_entries:
+                self._sets.popitem(last=False)
+        return result_set
+
+    def get(self, result_set_id: str) -> Optional[ResultSet]:
+        with self._lock:
+            self._expire()
+            return self._sets.get(result_set_id)
+
+    def latest(self) -> Optional[ResultSet]:
+        with self._lock:
+            self._expire()
+            return next(reversed(self._sets.values()), None)
+
+    def _expire(self):
+        now = time.monotonic()
+        while self._sets:
+            oldest = next(iter(self._sets.values()))
+            if oldest.expires_at >= now:
+                break
+            self._sets.popitem(last=False)
+
+
+result_sets = ResultSetRegistry()
@@ -0,0 +1,92 @@
+import os
+import json
+import logging
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+
+from app.services.extractor import ocr_image
+
+logger = logging.getLogger(__name__)
+
+# Page areas, as (left, top, right, bottom) fractions of the page, where the structured fields of
+# our claim forms are printed. Override them with a JSON file of the same shape, see load_templates.
+DEFAULT_TEMPLATES = {
+    "header": (0.0, 0.0, 1.0, 0.4),
+}
+
+# Layout analysis tuning, in pixels at 100 DPI; scaled with the render resolution
+LINE_KERNEL = (25, 3)  # Dilation that merges the characters of a text line into one blob
+MIN_REGION_HEIGHT = 6
+MIN_REGION_WIDTH = 12
+MAX_REGION_HEIGHT = 80  # Taller blobs are logos, stamps or photos, not text lines
+REGION_PADDING = 4
+
+Box = Tuple[int, int, int, int]
+
+
+def load_templates(path: Optional[str]) -> Dict[str, Tuple[float, float, float, float]]:
+    """Templates from a JSON file of {name: [left, top, right, bottom]}, or the defaults."""
+    if not path or not os.path.exists(path):
+        return dict(DEFAULT_TEMPLATES)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            templates = {name: tuple(float(v) for v in box) for name, box in json.load(f).items()}
+    except (OSError, ValueError, TypeError) as e:
+        logger.error(f"Invalid ROI templates in {path}, using the defaults: {e}")
+        return dict(DEFAULT_TEMPLATES)
+    if not all(len(box) == 4 and 0 <= box[0] < box[2] <= 1 and 0 <= box[1] < box[3] <= 1 for box in templates.values()):
+        logger.error(f"ROI templates in {path} must be [left, top, right, bottom] fractions, using the defaults")
+        return dict(DEFAULT_TEMPLATES)
+    return templates
+
+
+def find_text_regions(binary, dpi: int = 100) -> List[Box]:
+    """
+    Bounding boxes of the text lines on a binarized page (dark text on white, as from fast_preprocess),
+    found by dilating the ink horizontally and taking the outer contours. Returned top to bottom.
+    """
+    scale = dpi / 100.0
+    kernel = cv2.getStructuringElement(
+        cv2.MORPH_RECT, (max(1, int(LINE_KERNEL[0] * scale)), max(1, int(LINE_KERNEL[1] * scale)))
+    )
+    merged = cv2.dilate(cv2.bitwise_not(binary), kernel, iterations=1)
+    contours, _ = cv2.findContours(merged, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    regions = []
+    for contour in contours:
+        x, y, w, h = cv2.boundingRect(contour)
+        if MIN_REGION_HEIGHT * scale <= h <= MAX_REGION_HEIGHT * scale and w >= MIN_REGION_WIDTH * scale:
+            regions.append((x, y, x + w, y + h))
+    regions.sort(key=lambda box: (box[1], box[0]))
+    return regions
+
+
+def select_regions(binary, templates, dpi: int = 100) -> List[Box]:
+    """
+    One crop per template: the tight box around the text lines whose centre falls inside it.
+    Templates with no text on this page are dropped, so blank areas are never OCR'd.
+    """
+    height, width = binary.shape[:2]
+    lines = find_text_regions(binary, dpi)
+    pad = int(REGION_PADDING * dpi / 100.0)
+    crops = []
+    for left, top, right, bottom in templates.values():
+        area = (left * width, top * height, right * width, bottom * height)
+        inside = [
+            box for box in lines
+            if area[0] <= (box[0] + box[2]) / 2 <= area[2] and area[1] <= (box[1] + box[3]) / 2 <= area[3]
+        ]
+        if not inside:
+            continue
+        crops.append((
+            max(0, min(box[0] for box in inside) - pad), max(0, min(box[1] for box in inside) - pad),
+            min(width, max(box[2] for box in inside) + pad), min(height, max(box[3] for box in inside) + pad),
+        ))
+    return crops
+
+
+def ocr_regions(binary, templates=None, dpi: int = 100) -> str:
+    """OCR only the template areas of a binarized page that contain text; returns their text top to bottom."""
+    crops = select_regions(binary, templates or DEFAULT_TEMPLATES, dpi)
+    crops.sort(key=lambda box: (box[1], box[0]))
+    return "\n".join(ocr_image(binary[top:bottom, left:right]) for left, top, right, bottom in crops)
@@ -0,0 +1,392 @@
+import os
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import fitz  # PyMuPDF
+
+from app.config import ADAPTIVE_OCR, OCR_QUEUE_SIZE, OCR_WORKERS, PREPROCESS_WORKERS, RENDER_QUEUE_SIZE
+from app.services.extractor import (
+    DPI, ESCALATE_PAGE, ESCALATE_REGION, MODE_FIELDS, MODE_FULL, ROI_DPI, ROUTE_OCR, ROUTE_ROI,
+    ROUTE_TEXT, escalate_page, fast_preprocess, iter_page_pixmaps, lines_to_text, needs_escalation, ocr_image,
+    ocr_image_data, pixmap_to_array, route_pages
+)
+from app.services.metrics import (
+    EXTRACTION_ESCALATIONS, EXTRACTION_PAGES, EXTRACTION_QUEUE_WAIT_SECONDS, EXTRACTION_STAGE_FAILURES,
+    EXTRACTION_STAGE_SECONDS
+)
+from app.services.ocr_engine import get_engine
+from app.services.page_cache import exact_hash, is_blank_page, page_variant
+from app.services.roi import ocr_regions
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+_CANCELLED = object()
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _init_ocr_worker():
+    # Tesseract would otherwise start one OpenMP thread per core inside every worker
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+
+
+def _engine_name():
+    """Runs in an OCR worker; the OCR engine it picked."""
+    return get_engine().name
+
+
+def _timed_ocr(img, adaptive=False):
+    """
+    Runs in an OCR worker; the time spent inside Tesseract is returned with the result.
+    The result is the page text, or its lines with confidences in adaptive mode.
+    """
+    start = time.perf_counter()
+    result = ocr_image_data(img) if adaptive else ocr_image(img)
+    return result, time.perf_counter() - start
+
+
+def _timed_roi_ocr(img, templates, dpi):
+    """Runs in an OCR worker; OCR only the field regions of the page."""
+    start = time.perf_counter()
+    text = ocr_regions(img, templates, dpi)
+    return text, time.perf_counter() - start
+
+
+def _timed_escalation(pdf_path, page_no, lines, dpi):
+    """
+    Runs in an OCR worker; re-render the low-confidence parts of a page at HIGH_DPI and OCR them again.
+    The page is opened here so PyMuPDF is only ever used by one thread of each process.
+    """
+    start = time.perf_counter()
+    with fitz.open(pdf_path) as doc:
+        lines, escalation = escalate_page(doc.load_page(page_no), lines, dpi=dpi)
+    return lines, escalation, time.perf_counter() - start
+
+
+def _timed_pixmaps(pixmaps):
+    """Yield from a lazy page renderer, recording how long each page took to render."""
+    while True:
+        start = time.perf_counter()
+        item = next(pixmaps, None)
+        if item is None:
+            return
+        EXTRACTION_STAGE_SECONDS.observe(time.perf_counter() - start, stage="render")
+        yield item
+
+
+def get_ocr_pool(max_workers: int = OCR_WORKERS) -> ProcessPoolExecutor:
+    """
+    Process pool shared by every scheduler in this process, so concurrent runs share one budget.
+    It is sized on first use and keeps that size until shutdown_ocr_pool; a scheduler's `ocr_workers`
+    only limits how many of its pages are in the pool at once.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=max_workers, initializer=_init_ocr_worker)
+        return _pool
+
+
+def shutdown_ocr_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True)
+            _pool = None
+
+
+class _Document:
+    """Collects the OCR text of one PDF as its OCR pages come back in any order."""
+
+    def __init__(self, filename: str, pdf_path: str, texts: List[str], routes: List[str], ocr_pages: List[int]):
+        self.filename = filename
+        self.pdf_path = pdf_path
+        self.texts = texts
+        self.routes = routes
+        self.ocr_pages = ocr_pages
+        self.remaining = len(ocr_pages)
+        self.cancelled = False
+        self.lock = threading.Lock()
+
+    def set_page(self, page_no: int, text: str, route: Optional[str] = None) -> bool:
+        with self.lock:
+            self.texts[page_no] = text
+            if route:
+                self.routes[page_no] = route
+            self.remaining -= 1
+            return self.remaining == 0
+
+    def result(self):
+        if self.cancelled:
+            return self.filename, _CANCELLED, None
+        return self.filename, self.texts, self.routes
+
+
+class OcrScheduler:
+    """
+    Pipelined extraction over many documents.
+    A render stage, a preprocess stage and an OCR stage are joined by bounded queues, so pages from
+    different documents flow through continuously and rendering can never run ahead of OCR by more
+    than the queue depths. PyMuPDF is not thread-safe, so a single thread opens and renders the
+    documents, and pages escalated at HIGH_DPI are re-rendered inside the OCR worker processes.
+
+    `progress`, if given, receives document_started(filename, page_count) and pages_done(filename, count).
+    Pages that could not be rendered, preprocessed or OCR'd are left empty and listed in `failed_pages`
+    by filename before their document is yielded, so callers can keep the document for a retry.
+    Setting `cancel_event` stops the scheduler from starting new documents or pages; documents that
+    were cut short are not yielded.
+
+    In MODE_FIELDS only the template regions of OCR pages that hold text are OCR'd (see app.services.roi),
+    and those pages are routed ROUTE_ROI until a full pass replaces them.
+
+    With a `page_cache` (see app.services.page_cache), blank pages and pages already OCR'd under the
+    same settings are completed in the preprocess stage and never reach Tesseract.
+    """
+
+    def __init__(
+        self,
+        preprocess_workers: int = PREPROCESS_WORKERS,
+        ocr_workers: int = OCR_WORKERS,
+        render_queue_size: int = RENDER_QUEUE_SIZE,
+        ocr_queue_size: int = OCR_QUEUE_SIZE,
+        progress=None,
+        cancel_event: Optional[threading.Event] = None,
+        adaptive: bool = ADAPTIVE_OCR,
+        mode: str = MODE_FULL,
+        templates=None,
+        page_cache=None,
+    ):
+        self.preprocess_workers = preprocess_workers
+        self.ocr_workers = ocr_workers
+        self.render_queue_size = render_queue_size
+        self.ocr_queue_size = ocr_queue_size
+        self.progress = progress
+        self.cancel_event = cancel_event or threading.Event()
+        self.adaptive = adaptive
+        self.mode = mode
+        self.templates = templates
+        self.dpi = ROI_DPI if mode == MODE_FIELDS else DPI
+        self.page_cache = page_cache
+        self.variant = None  # Page cache key prefix, set once the OCR workers report their engine
+        # Pages completed without OCR: blank, or their text taken from the page cache
+        self.skipped = {"blank": 0, "cached": 0}
+        # Pages re-OCR'd at HIGH_DPI in this scheduler, by how they were escalated
+        self.escalations = {ESCALATE_PAGE: 0, ESCALATE_REGION: 0}
+        # Page numbers per document whose text is missing because a stage failed
+        self.failed_pages: Dict[str, List[int]] = {}
+        self._escalations_lock = threading.Lock()
+        self._skipped_lock = threading.Lock()
+        self._failed_lock = threading.Lock()
+
+    def run(self, documents: Iterable[Tuple[str, str]]) -> Iterator[Tuple[str, Optional[List[str]], Optional[List[str]]]]:
+        """
+        Extract (filename, pdf_path) pairs and yield (filename, page_texts, page_routes) as each
+        document completes. page_texts and page_routes are None when the document could not be opened.
+        """
+        document_q = queue.Queue()
+        render_q = queue.Queue(maxsize=self.render_queue_size)
+        ocr_q = queue.Queue(maxsize=self.ocr_queue_size)
+        results_q = queue.Queue()
+        pool = get_ocr_pool()
+        if self.page_cache is not None:
+            self.variant = page_variant(
+                self.mode, self.dpi, self.adaptive, pool.submit(_engine_name).result(), self.templates
+            )
+
+        documents = list(documents)
+        for item in documents:
+            document_q.put(item)
+        document_q.put(_STOP)
+
+        stages = [
+            (self._render_worker, (document_q, render_q, results_q), 1, render_q, self.preprocess_workers),
+            (self._preprocess_worker, (render_q, ocr_q, results_q), self.preprocess_workers, ocr_q, self.ocr_workers),
+            (self._ocr_worker, (ocr_q, results_q, pool), self.ocr_workers, None, 0),
+        ]
+        for target, args, count, downstream, downstream_count in stages:
+            threads = [threading.Thread(target=target, args=args, daemon=True) for _ in range(count)]
+            for t in threads:
+                t.start()
+            if downstream is not None:
+                threading.Thread(
+                    target=self._close_stage, args=(threads, downstream, downstream_count), daemon=True
+                ).start()
+
+        for _ in range(len(documents)):
+            filename, texts, routes = results_q.get()
+            if texts is not _CANCELLED:
+                yield filename, texts, routes
+
+    def _notify(self, event: str, *args):
+        """Call the progress listener; its errors are logged, a page must still reach its document."""
+        if self.progress is None:
+            return
+        try:
+            getattr(self.progress, event)(*args)
+        except Exception as e:
+            logger.error("Progress listener failed on %s: %s", event, e)
+
+    @staticmethod
+    def _close_stage(threads, downstream, downstream_count):
+        # Once every producer of a stage has finished, tell each downstream consumer to stop
+        for t in threads:
+            t.join()
+        for _ in range(downstream_count):
+            downstream.put(_STOP)
+
+    def _render_worker(self, document_q, render_q, results_q):
+        while True:
+            item = document_q.get()
+            if item is _STOP:
+                return
+            filename, pdf_path = item
+            if self.cancel_event.is_set():
+                results_q.put((filename, _CANCELLED, None))
+                continue
+            document = None
+            queued = 0
+            try:
+                with fitz.open(pdf_path) as doc:
+                    if len(doc) == 0:
+                        results_q.put((filename, None, None))
+                        continue
+                    # Each page is routed on its own: embedded text where there is enough, OCR otherwise
+                    with EXTRACTION_STAGE_SECONDS.time(stage="route"):
+                        texts, routes = route_pages(doc)
+                    ocr_pages = [page_no for page_no, route in enumerate(routes) if route == ROUTE_OCR]
+                    EXTRACTION_PAGES.inc(len(texts) - len(ocr_pages), route=ROUTE_TEXT)
+                    logger.info(
+                        "Processing %s: %d text pages, %d OCR pages", pdf_path, len(texts) - len(ocr_pages), len(ocr_pages)
+                    )
+                    self._notify("document_started", filename, len(doc))
+                    self._notify("pages_done", filename, len(texts) - len(ocr_pages))
+                    if not ocr_pages:
+                        results_q.put((filename, texts, routes))
+                        continue
+                    document = _Document(filename, pdf_path, texts, routes, ocr_pages)
+                    # Pages are rendered one at a time; the bounded render queue is the in-flight window
+                    for page_no, pix in _timed_pixmaps(iter_page_pixmaps(doc, dpi=self.dpi, page_numbers=ocr_pages)):
+                        if self.cancel_event.is_set():
+                            document.cancelled = True
+                            break
+                        render_q.put((document, page_no, pix, time.perf_counter()))
+                        queued += 1
+                    if document.cancelled:
+                        self._close_unrendered(document, queued, results_q)
+            except Exception as e:
+                logger.error("Rendering failed for %s: %s", pdf_path, e)
+                EXTRACTION_STAGE_FAILURES.inc(stage="render")
+                if document is None:
+                    results_q.put((filename, None, None))
+                    continue
+                self._close_unrendered(document, queued, results_q, failed=True)
+
+    def _close_unrendered(self, document, queued, results_q, failed=False):
+        # Pages already queued will still complete; close out the ones that were never rendered
+        for page_no in document.ocr_pages[queued:]:
+            if failed:
+                self._fail_page(document, page_no)
+            if document.set_page(page_no, ""):
+                results_q.put(document.result())
+
+    def _fail_page(self, document, page_no):
+        with self._failed_lock:
+            self.failed_pages.setdefault(document.filename, []).append(page_no)
+
+    def _preprocess_worker(self, render_q, ocr_q, results_q):
+        while True:
+            item = render_q.get()
+            if item is _STOP:
+                return
+            document, page_no, pix, queued_at = item
+            EXTRACTION_QUEUE_WAIT_SECONDS.observe(time.perf_counter() - queued_at, queue="render")
+            img = key = None
+            try:
+                with EXTRACTION_STAGE_SECONDS.time(stage="preprocess"):
+                    gray = pixmap_to_array(pix)
+                    if self.page_cache is not None and is_blank_page(gray, self.dpi):
+                        self.page_cache.record_blank()
+                        self._skip(document, page_no, "", None, "blank", results_q)
+                        continue
+                    img = fast_preprocess(gray)
+                if self.page_cache is not None:
+                    with EXTRACTION_STAGE_SECONDS.time(stage="page_cache"):
+                        key = exact_hash(img, self.variant)
+                        text, _ = self.page_cache.lookup(key)
+                    if text is not None:
+                        route = ROUTE_ROI if self.mode == MODE_FIELDS else None
+                        self._skip(document, page_no, text, route, "cached", results_q)
+                        continue
+            except Exception as e:
+                logger.error("Preprocessing failed for %s page %d: %s", document.filename, page_no + 1, e)
+                EXTRACTION_STAGE_FAILURES.inc(stage="preprocess")
+                img = key = None
+            ocr_q.put((document, page_no, img, key, time.perf_counter()))
+
+    def _skip(self, document, page_no, text, route, reason, results_q):
+        """Complete a page without OCR."""
+        with self._skipped_lock:
+            self.skipped[reason] += 1
+        self._notify("pages_done", document.filename)
+        if document.set_page(page_no, text, route):
+            results_q.put(document.result())
+
+    def _ocr_worker(self, ocr_q, results_q, pool):
+        while True:
+            item = ocr_q.get()
+            if item is _STOP:
+                return
+            document, page_no, img, key, queued_at = item
+            EXTRACTION_QUEUE_WAIT_SECONDS.observe(time.perf_counter() - queued_at, queue="ocr")
+            # In fields mode a page that could not be OCR'd is still left for the full pass
+            text, route = "", ROUTE_ROI if self.mode == MODE_FIELDS else None
+            if img is None and not document.cancelled:
+                self._fail_page(document, page_no)  # Preprocessing failed
+            elif img is not None and not document.cancelled:
+                try:
+                    submitted = time.perf_counter()
+                    if self.mode == MODE_FIELDS:
+                        future = pool.submit(_timed_roi_ocr, img, self.templates, self.dpi)
+                    else:
+                        future = pool.submit(_timed_ocr, img, self.adaptive)
+                    result, ocr_seconds = future.result()
+                    EXTRACTION_STAGE_SECONDS.observe(ocr_seconds, stage="ocr")
+                    # Pickling the page to the worker and waiting for a free process
+                    EXTRACTION_QUEUE_WAIT_SECONDS.observe(
+                        max(0.0, time.perf_counter() - submitted - ocr_seconds), queue="ocr_pool"
+                    )
+                    EXTRACTION_PAGES.inc(route=route or ROUTE_OCR)
+                    if self.adaptive and route is None:
+                        text = self._escalate(document, page_no, result, pool)
+                    else:
+                        text = result
+                    if key is not None:
+                        self.page_cache.put(key, self.variant, text)
+                except Exception as e:
+                    logger.error("OCR failed for %s page %d: %s", document.filename, page_no + 1, e)
+                    EXTRACTION_STAGE_FAILURES.inc(stage="ocr")
+                    self._fail_page(document, page_no)
+            self._notify("pages_done", document.filename)
+            if document.set_page(page_no, text, route):
+                results_q.put(document.result())
+
+    def _escalate(self, document, page_no, lines, pool) -> str:
+        """Re-OCR the low-confidence lines of a page at HIGH_DPI, through the same worker pool."""
+        if needs_escalation(lines) and not document.cancelled:
+            try:
+                lines, escalation, seconds = pool.submit(
+                    _timed_escalation, document.pdf_path, page_no, lines, self.dpi
+                ).result()
+                EXTRACTION_STAGE_SECONDS.observe(seconds, stage="escalation")
+                EXTRACTION_ESCALATIONS.inc(mode=escalation)
+                with self._escalations_lock:
+                    self.escalations[escalation] += 1
+            except Exception as e:
+                logger.error("Escalating %s page %d failed: %s", document.filename, page_no + 1, e)
+                EXTRACTION_STAGE_FAILURES.inc(stage="escalation")
+        return lines_to_text(lines)
@@ -1,17 +1,18 @@
-import os
-import json
-import re
-import shutil
+import time
+import sqlite3
 import logging
-from typing import Optional, List, Dict
-from difflib import SequenceMatcher
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional, Iterator, List, Dict, Mapping, Tuple
+from app.config import SEARCH_WORKERS
 from app.Exception.NoMatchFoundException import NoMatchFoundException
-
-VIN_MIN_LENGTH = 13
-
-FIELD_PATTERNS = {
-    "Dealer": r"dealer[:;\s#]*([^\n\r]+)",
-}
+from app.services.search_index import (
+    connect, ensure_index, get_generation, index_exists, refresh_stale_fields
+)
+from app.services.metrics import SEARCH_FIELD_SECONDS, SEARCH_REQUESTS, SEARCH_SECONDS
+from app.services.parallel_search import iter_in_parallel
+from app.services.query_cache import query_cache
+from app.services.query_plan import Hit, QueryPlan, compile_query, iter_matching_documents
+from app.services.storage import has_documents, open_store
 
 # Configure logging
 logging.basicConfig(
@@ -20,171 +21,185 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def ocr_vin_normalize(s: str) -> str:
-    return (
-        s.upper()
-        .replace('O', '0')
-        .replace('Q', '0')
-        .replace('I', '1')
-    )
-
-def find_vin_candidates(text: str) -> List[str]:
-    vin_candidates = []
-    vin_lines = re.findall(r'VIN[:\s]*([A-Z0-9\W]{13,25})', text.upper())
-    for raw in vin_lines:
-        normalized = re.sub(r'[^A-HJ-NPR-Z0-9]', '', raw)
-        if len(normalized) >= VIN_MIN_LENGTH:
-            vin_candidates.append(normalized)
-    raw_candidates = re.findall(r'([A-HJ-NPR-Z0-9][A-HJ-NPR-Z0-9\W]{12,})', text.upper())
-    for raw in raw_candidates:
-        normalized = re.sub(r'[^A-HJ-NPR-Z0-9]', '', raw)
-        if len(normalized) >= VIN_MIN_LENGTH and normalized not in vin_candidates:
-            vin_candidates.append(normalized)
-    return vin_candidates
-
-def extract_numeric_after_keyword(text: str, keyword: str, min_digits: int = 6) -> List[str]:
-    results = []
-    lines = text.splitlines()
-    keyword_lower = keyword.lower()
-    for line in lines:
-        if keyword_lower in line.lower():
-            idx = line.lower().find(keyword_lower)
-            after = line[idx + len(keyword):]
-            numbers = re.findall(r'\d+', after)
-            long_numbers = [num for num in numbers if len(num) >= min_digits]
-            results.extend(long_numbers)
-    return results
-
-def get_best_fuzzy_match(target: str, candidates: List[str], threshold: float = 0.6) -> Optional[str]:
-    best_ratio = 0
-    best_candidate = None
-    for cand in candidates:
-        ratio = SequenceMatcher(None, target, cand).ratio()
-        if ratio > best_ratio:
-            best_ratio = ratio
-            best_candidate = cand
-    if best_ratio >= threshold:
-        return best_candidate
-    return None
-
-def clear_destination_folder(destination_folder: str):
-    if os.path.exists(destination_folder):
-        for filename in os.listdir(destination_folder):
-            file_path = os.path.join(destination_folder, filename)
+FileMatch = Tuple[str, Tuple[str, ...], List[Hit]]  # (filename, match reasons, page hits)
+
+def match_with_index(
+    conn, plan: QueryPlan, output_json_folder: str, timings: Optional[Dict[str, float]] = None
+) -> Dict[str, Tuple[str, ...]]:
+    """
+    Structured fields are answered from the per-document field records computed at ingest.
+    Free-word queries are narrowed to candidate documents through the text index, then verified.
+    Returns the matching documents with the reasons they matched.
+    """
+    return plan.evaluate_index(conn, output_json_folder, timings)
+
+def cached_match_with_index(
+    plan: QueryPlan, output_json_folder: str, timings: Optional[Dict[str, float]] = None,
+    counts: Optional[Dict[str, int]] = None
+) -> Tuple[Mapping[str, Tuple[str, ...]], bool]:
+    """
+    Answer from the query cache when the same plan was already evaluated on this corpus generation.
+    Returns the matching documents with their match reasons, and whether they came from the cache.
+    If `counts` is given, its "documents" is set to the number of indexed documents.
+    """
+    conn = connect(output_json_folder)
+    try:
+        with SEARCH_FIELD_SECONDS.time(timings, "cache_lookup", field="cache_lookup"):
+            refresh_stale_fields(conn)
+            key = (output_json_folder, plan.key(), get_generation(conn))
+            matches = query_cache.get(key)
+            if counts is not None:
+                counts["documents"] = conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+        if matches is not None:
+            logger.info(f"Query cache hit: {len(matches)} documents")
+            return matches, True
+        return query_cache.put(key, match_with_index(conn, plan, output_json_folder, timings)), False
+    finally:
+        conn.close()
+
+def locate_matches(
+    plan: QueryPlan, output_json_folder: str, matches: Mapping[str, Tuple[str, ...]],
+    timings: Optional[Dict[str, float]] = None
+) -> Iterator[FileMatch]:
+    """Page-level hits of already matched documents, in the order given, found by one scan of each one's text."""
+    store = open_store(output_json_folder)
+    for filename, reasons in matches.items():
+        with SEARCH_FIELD_SECONDS.time(timings, "locate_hits", field="locate_hits"):
             try:
-                if os.path.isfile(file_path) or os.path.islink(file_path):
-                    os.unlink(file_path)
-                elif os.path.isdir(file_path):
-                    shutil.rmtree(file_path)
-            except Exception as e:
-                logger.error(f"Failed to delete {file_path}: {e}")
-    else:
-        os.makedirs(destination_folder, exist_ok=True)
-
-def search_claim_documents(
-    search_params: Dict[str, Optional[str]],
-    input_folder: str,
-    output_json_folder: str
-) -> List[str]:
-    field_map = {
-        "Dealer Name": "Dealer",
-        "Dealer": "Dealer",
-        "VIN": "VIN",
-        "Contract #": "Contract",
-        "Contract": "Contract",
-        "Claim #": "Claim",
-        "Claim": "Claim",
-        "Search by Word": "searchbyany",
-        "searchbyany": "searchbyany"
-    }
-
-    active_fields = {field_map[k]: v.strip() for k, v in search_params.items() if v and k in field_map}
-    if not active_fields:
+                pages = store.get(filename)
+            except KeyError:
+                pages = []  # Removed since it matched
+            found, hits = plan.scan(pages)
+        yield filename, plan.merge_reasons(reasons, found), hits
+
+def plan_search(
+    search_params: Dict[str, Optional[str]], operator: Optional[str] = None, match_modes: Optional[Dict[str, str]] = None
+) -> QueryPlan:
+    """Compile the search; raises InvalidQueryException for bad operators or modes, NoMatchFoundException without fields."""
+    plan = compile_query(search_params, operator, match_modes)
+    if not plan.predicates:
         raise NoMatchFoundException("No valid search fields provided.")
-
-    # Find all JSON files in the output_json_folder
-    json_files = [os.path.join(output_json_folder, f)
-                  for f in os.listdir(output_json_folder)
-                  if f.lower().endswith('.json')]
-
-    if not json_files:
-        raise FileNotFoundError(f"No JSON files found in: {output_json_folder}")
-
-    destination_folder = os.path.join(input_folder, "destination")
-    clear_destination_folder(destination_folder)
-    matching_files = set()
-
-    for json_idx, json_file in enumerate(json_files, 1):
-        logger.info(f"Searching in JSON file {json_idx}/{len(json_files)}: {json_file}")
-        try:
-            with open(json_file, "r", encoding="utf-8") as f:
-                data = json.load(f)
-        except Exception as e:
-            logger.error(f"Could not load {json_file}: {e}")
-            continue
-
-        for file_idx, (filename, pages) in enumerate(data.items(), 1):
-            logger.debug(f"Searching in file {filename} from {json_file} (file {file_idx})")
-            if isinstance(pages, list):
-                all_text = "\n".join(pages)
-            else:
-                all_text = str(pages)
-
-            for field, value in active_fields.items():
-                found = False
-                if field == "Contract":
-                    extracted_numbers = extract_numeric_after_keyword(all_text, "Contract", min_digits=6)
-                    if any(num.strip() == value for num in extracted_numbers):
-                        found = True
-                        logger.info(f"Match found for Contract in {filename}")
-                elif field == "Claim":
-                    extracted_numbers = extract_numeric_after_keyword(all_text, "Claim", min_digits=6)
-                    if any(num.strip() == value for num in extracted_numbers):
-                        found = True
-                        logger.info(f"Match found for Claim in {filename}")
-                elif field == "VIN":
-                    vin_param_normalized = ocr_vin_normalize(re.sub(r'[^A-HJ-NPR-Z0-9]', '', value.upper()))
-                    vin_candidates_raw = find_vin_candidates(all_text)
-                    vin_candidates = [ocr_vin_normalize(v) for v in vin_candidates_raw]
-                    if vin_param_normalized in vin_candidates:
-                        found = True
-                        logger.info(f"Exact VIN match in {filename}")
-                    else:
-                        match = get_best_fuzzy_match(vin_param_normalized, vin_candidates, threshold=0.8)
-                        if match:
-                            found = True
-                            logger.info(f"Fuzzy VIN match in {filename}")
-                elif field == "Dealer":
-                    pattern = re.compile(FIELD_PATTERNS["Dealer"], re.IGNORECASE)
-                    for match in pattern.finditer(all_text):
-                        extracted_value = match.group(1).strip().rstrip(':;\\').strip()
-                        extracted_value_clean = re.sub(r'\s*\d+\s*$', '', extracted_value)
-                        if value.lower() in extracted_value_clean.lower():
-                            found = True
-                            logger.info(f"Dealer match in {filename}")
-                            break
-                elif field == "searchbyany":
-                    if value in all_text:
-                        found = True
-                        logger.info(f"Keyword '{value}' found in {filename}")
+    logger.info(f"Query plan ({plan.operator}): {'; '.join(plan.describe())}")
+    return plan
+
+def check_documents(output_json_folder: str):
+    if not has_documents(output_json_folder) and not index_exists(output_json_folder):
+        raise FileNotFoundError(f"No extracted documents found in: {output_json_folder}")
+
+def _counted(documents, counts: Optional[Dict[str, int]]):
+    """Pass the documents through, counting them in counts["documents"]."""
+    if counts is not None:
+        counts["documents"] = 0
+    for document in documents:
+        if counts is not None:
+            counts["documents"] += 1
+        yield document
+
+def iter_claim_matches(
+    plan: QueryPlan,
+    output_json_folder: str,
+    timings: Optional[Dict[str, float]] = None,
+    search_workers: Optional[int] = None,
+    locate: bool = True,
+    counts: Optional[Dict[str, int]] = None
+) -> Iterator[FileMatch]:
+    """
+    Yield (filename, match reasons, page hits) for each document matching the plan, as soon as it is known:
+    per shard with the parallel scan, per document when scanning the store, and per located document
+    on the index path. Without `locate`, the index path yields no hits (see locate_matches).
+    The order is by filename within each shard, not overall.
+
+    With `search_workers` (SEARCH_WORKERS by default) above 0 the stored documents are scanned by
+    that many shard workers in parallel instead of being looked up in the search index.
+
+    If `counts` is given, its "documents" holds the number of documents searched once the matches
+    are exhausted, taken from the path that answered rather than by opening the store again.
+    """
+    workers = SEARCH_WORKERS if search_workers is None else search_workers
+    start = time.perf_counter()
+    path, found = None, 0
+    try:
+        if workers > 0:
+            try:
+                for match in iter_in_parallel(plan, output_json_folder, workers, timings=timings, counts=counts):
+                    found += 1
+                    yield match
+                path = "parallel"
+                return
+            except BrokenProcessPool as e:
                 if found:
-                    matching_files.add(filename)
-                    break  # No need to check other fields for this file
-
-    if not matching_files:
+                    raise  # Part of the result was already handed out
+                logger.error(f"Parallel search failed, using the search index instead: {e}")
+                SEARCH_REQUESTS.inc(outcome="parallel_error")
+                if counts is not None:
+                    counts.pop("documents", None)
+        try:
+            with SEARCH_FIELD_SECONDS.time(timings, "ensure_index", field="ensure_index"):
+                ensure_index(output_json_folder)
+            matches, cached = cached_match_with_index(plan, output_json_folder, timings, counts)
+            path = "cache" if cached else "index"
+        except sqlite3.Error as e:
+            logger.error(f"Search index unavailable, scanning stored documents instead: {e}")
+            SEARCH_REQUESTS.inc(outcome="index_error")
+            path = "store"
+            documents = _counted(open_store(output_json_folder).iter_documents(), counts)
+            with SEARCH_FIELD_SECONDS.time(timings, "store_scan", field="store_scan"):
+                for match in iter_matching_documents(plan, documents):
+                    found += 1
+                    yield match
+            return
+        ordered = {filename: matches[filename] for filename in sorted(matches)}
+        found = len(ordered)
+        if locate:
+            yield from locate_matches(plan, output_json_folder, ordered, timings)
+        else:
+            yield from ((filename, reasons, []) for filename, reasons in ordered.items())
+    finally:
+        if path is not None:
+            SEARCH_SECONDS.observe(time.perf_counter() - start, path=path)
+            SEARCH_REQUESTS.inc(outcome="match" if found else "no_match")
+
+def search_claim_matches(
+    search_params: Dict[str, Optional[str]],
+    input_folder: str,
+    output_json_folder: str,
+    timings: Optional[Dict[str, float]] = None,
+    operator: Optional[str] = None,
+    match_modes: Optional[Dict[str, str]] = None,
+    search_workers: Optional[int] = None,
+    locate: bool = True
+) -> Tuple[QueryPlan, List[FileMatch], int]:
+    """
+    Return the compiled plan, (filename, match reasons, page hits) for the documents matching the search
+    fields sorted by filename, and the number of documents searched. The fields are combined with `operator` ("or" by default, or "and") and compared per
+    `match_modes` (see app.services.query_plan); see iter_claim_matches for `search_workers` and `locate`.
+    If `timings` is given, the seconds spent in each step (index upkeep, cache lookup, each field,
+    locating hits) are added to it.
+    """
+    plan = plan_search(search_params, operator, match_modes)
+    check_documents(output_json_folder)
+    counts = {}
+    results = sorted(iter_claim_matches(plan, output_json_folder, timings, search_workers, locate, counts))
+
+    if not results:
         provided = {k: v for k, v in search_params.items() if v}
         logger.warning(f"No value matching with the keyword: {provided}")
         raise NoMatchFoundException(f"No value matching with the keyword: {provided}")
 
-    # Copy matching files to destination subfolder inside input_folder
-    for filename in matching_files:
-        src_path = os.path.join(input_folder, filename)
-        dst_path = os.path.join(destination_folder, filename)
-        try:
-            shutil.copy2(src_path, dst_path)
-            logger.info(f"Copied {filename} to {destination_folder}")
-        except Exception as e:
-            logger.error(f"Failed to copy {filename}: {e}")
+    logger.info(f"Total matching files: {len(results)}")
+    return plan, results, counts.get("documents", len(results))
 
-    logger.info(f"Total matching files: {len(matching_files)}")
-    return list(matching_files)
+def search_claim_documents(
+    search_params: Dict[str, Optional[str]],
+    input_folder: str,
+    output_json_folder: str,
+    timings: Optional[Dict[str, float]] = None,
+    operator: Optional[str] = None,
+    match_modes: Optional[Dict[str, str]] = None,
+    search_workers: Optional[int] = None
+) -> List[str]:
+    """Return the names of the documents matching the search, see search_claim_matches."""
+    _, matches, _ = search_claim_matches(
+        search_params, input_folder, output_json_folder, timings, operator, match_modes, search_workers
+    )
+    return [filename for filename, _, _ in matches]
@@ -0,0 +1,256 @@
+import os
+import sys
+import sqlite3
+import logging
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from app.services.fields import FIELDS_VERSION, extract_fields
+from app.services.storage import has_documents, open_store
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILENAME = "search_index.sqlite3"
+MIN_QUERY_LENGTH = 3  # The trigram tokenizer cannot narrow down shorter values
+
+# Page text lives in a regular table (indexed by filename for cheap replacement) and is mirrored
+# into an external-content FTS5 table with the trigram tokenizer for substring lookups.
+# field_values holds the structured-field record of each document, computed once at ingest.
+# meta.generation is bumped by every change to the indexed corpus.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    filename TEXT PRIMARY KEY,
+    page_count INTEGER NOT NULL,
+    fields_version INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS pages (
+    id INTEGER PRIMARY KEY,
+    filename TEXT NOT NULL,
+    page_no INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    source TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS pages_filename ON pages (filename, page_no);
+CREATE VIRTUAL TABLE IF NOT EXISTS pages_fts USING fts5(
+    text, content = 'pages', content_rowid = 'id', tokenize = 'trigram'
+);
+CREATE TRIGGER IF NOT EXISTS pages_ai AFTER INSERT ON pages BEGIN
+    INSERT INTO pages_fts (rowid, text) VALUES (new.id, new.text);
+END;
+CREATE TABLE IF NOT EXISTS field_values (
+    filename TEXT NOT NULL,
+    field TEXT NOT NULL,
+    value TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS field_values_lookup ON field_values (field, value);
+CREATE INDEX IF NOT EXISTS field_values_filename ON field_values (filename);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE TRIGGER IF NOT EXISTS pages_ad AFTER DELETE ON pages BEGIN
+    INSERT INTO pages_fts (pages_fts, rowid, text) VALUES ('delete', old.id, old.text);
+END;
+"""
+
+def index_path(output_json_folder: str) -> str:
+    return os.path.join(output_json_folder, INDEX_FILENAME)
+
+
+def index_exists(output_json_folder: str) -> bool:
+    return os.path.exists(index_path(output_json_folder))
+
+
+def _migrate(conn: sqlite3.Connection):
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(documents)")}
+    if "fields_version" not in columns:
+        conn.execute("ALTER TABLE documents ADD COLUMN fields_version INTEGER NOT NULL DEFAULT 0")
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(pages)")}
+    if "source" not in columns:
+        conn.execute("ALTER TABLE pages ADD COLUMN source TEXT NOT NULL DEFAULT ''")
+    conn.commit()
+
+
+def connect(output_json_folder: str) -> sqlite3.Connection:
+    os.makedirs(output_json_folder, exist_ok=True)
+    conn = sqlite3.connect(index_path(output_json_folder))
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    _migrate(conn)
+    return conn
+
+
+def get_generation(conn: sqlite3.Connection) -> int:
+    row = conn.execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()
+    return row[0] if row else 0
+
+
+def bump_generation(conn: sqlite3.Connection, minimum: int = 0):
+    """Mark the corpus as changed so cached query results keyed on the old generation are not reused."""
+    conn.execute(
+        "INSERT INTO meta (key, value) VALUES ('generation', ?) "
+        "ON CONFLICT (key) DO UPDATE SET value = max(value + 1, excluded.value)",
+        (max(minimum, 1),)
+    )
+
+
+def _write_fields(conn: sqlite3.Connection, filename: str, all_text: str):
+    conn.execute("DELETE FROM field_values WHERE filename = ?", (filename,))
+    conn.executemany(
+        "INSERT INTO field_values (filename, field, value) VALUES (?, ?, ?)",
+        [(filename, field, value) for field, values in extract_fields(all_text).items() for value in values]
+    )
+    conn.execute("UPDATE documents SET fields_version = ? WHERE filename = ?", (FIELDS_VERSION, filename))
+
+
+def add_document(conn: sqlite3.Connection, filename: str, pages: List[str], sources: Optional[List[str]] = None):
+    """
+    Insert or replace a document and its structured-field record; the caller commits.
+    sources records how each page's text was obtained (embedded text or OCR), when known.
+    """
+    remove_documents(conn, [filename])
+    sources = sources or [""] * len(pages)
+    conn.execute("INSERT INTO documents (filename, page_count) VALUES (?, ?)", (filename, len(pages)))
+    conn.executemany(
+        "INSERT INTO pages (filename, page_no, text, source) VALUES (?, ?, ?, ?)",
+        [(filename, page_no, text, source) for page_no, (text, source) in enumerate(zip(pages, sources))]
+    )
+    _write_fields(conn, filename, "\n".join(pages))
+    bump_generation(conn)
+
+
+def remove_documents(conn: sqlite3.Connection, filenames: Iterable[str]):
+    for filename in filenames:
+        conn.execute("DELETE FROM pages WHERE filename = ?", (filename,))
+        conn.execute("DELETE FROM field_values WHERE filename = ?", (filename,))
+        if conn.execute("DELETE FROM documents WHERE filename = ?", (filename,)).rowcount:
+            bump_generation(conn)
+
+
+def refresh_stale_fields(conn: sqlite3.Connection) -> int:
+    """Regenerate field records written by an older FIELDS_VERSION; returns the number refreshed."""
+    stale = [row[0] for row in conn.execute(
+        "SELECT filename FROM documents WHERE fields_version != ?", (FIELDS_VERSION,)
+    )]
+    if not stale:
+        return 0
+    for filename, all_text in iter_document_texts(conn, stale):
+        _write_fields(conn, filename, all_text)
+    bump_generation(conn)
+    conn.commit()
+    logger.info(f"Regenerated field records for {len(stale)} documents (version {FIELDS_VERSION})")
+    return len(stale)
+
+
+def rebuild_index(output_json_folder: str) -> int:
+    """Rebuild the index from the document store; returns the number of documents indexed."""
+    store = open_store(output_json_folder)
+    path = index_path(output_json_folder)
+    previous_generation = 0
+    if os.path.exists(path):
+        previous = connect(output_json_folder)
+        previous_generation = get_generation(previous)
+        previous.close()
+    tmp_path = path + ".rebuild"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    conn = sqlite3.connect(tmp_path)
+    conn.executescript(SCHEMA)
+    count = 0
+    try:
+        for filename, pages in store.iter_documents():
+            add_document(conn, filename, pages, store.routes(filename))
+            count += 1
+        # Generations keep increasing across rebuilds so no cached result from before can match
+        bump_generation(conn, minimum=previous_generation + 1)
+        conn.commit()
+    finally:
+        conn.close()
+    for suffix in ("-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    os.replace(tmp_path, path)
+    logger.info(f"Rebuilt search index with {count} documents at {path}")
+    return count
+
+
+def ensure_index(output_json_folder: str):
+    """Build the index from the stored documents the first time it is needed."""
+    if not index_exists(output_json_folder) and has_documents(output_json_folder):
+        rebuild_index(output_json_folder)
+
+
+def _phrase(value: str) -> str:
+    return '"' + value.replace('"', '""') + '"'
+
+
+def candidate_documents(conn: sqlite3.Connection, value: str) -> Optional[Set[str]]:
+    """
+    Documents whose text can contain value, or None when the index cannot narrow the search
+    (very short values have no trigrams). Candidates still have to be verified against the text.
+    """
+    if len(value) < MIN_QUERY_LENGTH:
+        return None
+    rows = conn.execute(
+        "SELECT DISTINCT pages.filename FROM pages_fts JOIN pages ON pages.id = pages_fts.rowid "
+        "WHERE pages_fts MATCH ?",
+        (_phrase(value),)
+    )
+    return {row[0] for row in rows}
+
+
+def documents_with_field(conn: sqlite3.Connection, field: str, value: str) -> Set[str]:
+    """Documents whose field record holds exactly value."""
+    rows = conn.execute(
+        "SELECT DISTINCT filename FROM field_values WHERE field = ? AND value = ?", (field, value)
+    )
+    return {row[0] for row in rows}
+
+
+def documents_with_field_containing(conn: sqlite3.Connection, field: str, value: str) -> Set[str]:
+    """Documents with a field value that contains value as a substring."""
+    rows = conn.execute(
+        "SELECT DISTINCT filename FROM field_values WHERE field = ? AND instr(value, ?) > 0", (field, value)
+    )
+    return {row[0] for row in rows}
+
+
+def field_signature(conn: sqlite3.Connection, field: str) -> Tuple[int, int]:
+    """Changes whenever values of field are added, removed or rewritten."""
+    count, last_rowid = conn.execute(
+        "SELECT count(*), coalesce(max(rowid), 0) FROM field_values WHERE field = ?", (field,)
+    ).fetchone()
+    return count, last_rowid
+
+
+def field_values_by_document(conn: sqlite3.Connection, field: str) -> Dict[str, List[str]]:
+    values = {}
+    for filename, value in conn.execute("SELECT filename, value FROM field_values WHERE field = ?", (field,)):
+        values.setdefault(filename, []).append(value)
+    return values
+
+
+def all_documents(conn: sqlite3.Connection) -> Set[str]:
+    return {row[0] for row in conn.execute("SELECT filename FROM documents")}
+
+
+def iter_document_pages(conn: sqlite3.Connection, filenames: Iterable[str]) -> Iterator[Tuple[str, List[str]]]:
+    """Yield (filename, page texts in order), one document at a time."""
+    for filename in filenames:
+        rows = conn.execute(
+            "SELECT text FROM pages WHERE filename = ? ORDER BY page_no", (filename,)
+        )
+        yield filename, [row[0] for row in rows]
+
+
+def iter_document_texts(conn: sqlite3.Connection, filenames: Iterable[str]) -> Iterator[Tuple[str, str]]:
+    """Yield (filename, full text) with pages joined in order, one document at a time."""
+    for filename, pages in iter_document_pages(conn, filenames):
+        yield filename, "\n".join(pages)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Usage: python -m app.services.search_index <output_json_folder>")
+        sys.exit(1)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    rebuild_index(sys.argv[1])
@@ -0,0 +1,327 @@
+"""
+Append-only sharded storage for extracted documents.
+
+Each document is one record appended to the current shard file:
+
+    >Q  total record length (excluding these 8 bytes)
+    >I  header length
+    header JSON  {"filename", "routes", "codec", "pages": [[offset, length], ...]}
+    page blobs   each page's UTF-8 text, compressed on its own with `codec`
+
+documents.idx is an append-only JSONL offset index: one line per put ({"filename", "shard", "offset",
+"length"}) or removal ({"filename", "shard": null}); the last line for a filename wins. Readers mmap the
+shards and decode only the header and the pages they ask for.
+"""
+import os
+import sys
+import json
+import mmap
+import zlib
+import struct
+import shutil
+import logging
+import argparse
+import threading
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from app.services.metrics import STORE_BYTES_READ, STORE_BYTES_WRITTEN
+from app.utils.file_utils import batch_file_name, list_batch_files
+
+logger = logging.getLogger(__name__)
+
+STORE_FOLDER_NAME = "store"
+INDEX_FILENAME = "documents.idx"
+SHARD_PREFIX = "shard-"
+SHARD_SUFFIX = ".bin"
+SHARD_MAX_BYTES = 64 * 1024 * 1024  # Roll over to a new shard past this size
+DEFAULT_CODEC = "zlib"  # "zlib" or "none"
+LEGACY_BATCH_FOLDER = "legacy_batches"  # Where migrated ExtractedData_Batch files are moved
+
+_RECORD_LENGTH = struct.Struct(">Q")
+_HEADER_LENGTH = struct.Struct(">I")
+
+
+def _encode(text: str, codec: str) -> bytes:
+    data = text.encode("utf-8")
+    return zlib.compress(data, 6) if codec == "zlib" else data
+
+
+def _decode(blob: bytes, codec: str) -> str:
+    return (zlib.decompress(blob) if codec == "zlib" else bytes(blob)).decode("utf-8")
+
+
+class DocumentStore:
+    """Reader and writer for one store folder. Safe to share between threads."""
+
+    def __init__(self, folder: str, codec: str = DEFAULT_CODEC, shard_max_bytes: int = SHARD_MAX_BYTES):
+        self.folder = folder
+        self.codec = codec
+        self.shard_max_bytes = shard_max_bytes
+        self.index_path = os.path.join(folder, INDEX_FILENAME)
+        self.locations: Dict[str, Tuple[str, int, int]] = {}
+        self._index_read_offset = 0
+        self._maps: Dict[str, mmap.mmap] = {}
+        self._lock = threading.RLock()
+        os.makedirs(folder, exist_ok=True)
+        self.refresh()
+
+    # Offset index
+
+    def refresh(self):
+        """Pick up index lines appended since the last read, by this or another process."""
+        with self._lock:
+            if not os.path.exists(self.index_path):
+                return
+            with open(self.index_path, "rb") as f:
+                f.seek(self._index_read_offset)
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break  # A writer is mid-line; read it next time
+                    self._index_read_offset += len(line)
+                    entry = json.loads(line)
+                    if entry["shard"] is None:
+                        self.locations.pop(entry["filename"], None)
+                    else:
+                        self.locations[entry["filename"]] = (entry["shard"], entry["offset"], entry["length"])
+
+    def _append_index(self, entries: List[dict]):
+        with open(self.index_path, "ab") as f:
+            for entry in entries:
+                f.write(json.dumps(entry, ensure_ascii=False).encode("utf-8") + b"\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def __len__(self) -> int:
+        self.refresh()
+        return len(self.locations)
+
+    def __contains__(self, filename: str) -> bool:
+        self.refresh()
+        return filename in self.locations
+
+    def filenames(self) -> List[str]:
+        self.refresh()
+        with self._lock:
+            return list(self.locations)
+
+    def shards(self) -> List[str]:
+        return sorted(f for f in os.listdir(self.folder) if f.startswith(SHARD_PREFIX) and f.endswith(SHARD_SUFFIX))
+
+    # Writing
+
+    def _current_shard(self) -> str:
+        shards = self.shards()
+        if shards and os.path.getsize(os.path.join(self.folder, shards[-1])) < self.shard_max_bytes:
+            return shards[-1]
+        number = int(shards[-1][len(SHARD_PREFIX):-len(SHARD_SUFFIX)]) + 1 if shards else 1
+        return f"{SHARD_PREFIX}{number:05d}{SHARD_SUFFIX}"
+
+    def put(self, filename: str, pages: List[str], routes: Optional[List[str]] = None):
+        """Append a document, replacing any earlier version of it."""
+        blobs = [_encode(text, self.codec) for text in pages]
+        layout, position = [], 0
+        for blob in blobs:
+            layout.append([position, len(blob)])
+            position += len(blob)
+        header = json.dumps(
+            {"filename": filename, "routes": routes, "codec": self.codec, "pages": layout}, ensure_ascii=False
+        ).encode("utf-8")
+        body = _HEADER_LENGTH.pack(len(header)) + header + b"".join(blobs)
+        record = _RECORD_LENGTH.pack(len(body)) + body
+        with self._lock:
+            shard = self._current_shard()
+            shard_path = os.path.join(self.folder, shard)
+            with open(shard_path, "ab") as f:
+                offset = f.tell()
+                f.write(record)
+                f.flush()
+                os.fsync(f.fileno())
+            # The index line is written last, so readers never see a half-written record
+            self._append_index([{"filename": filename, "shard": shard, "offset": offset, "length": len(record)}])
+            self.locations[filename] = (shard, offset, len(record))
+            self._index_read_offset = os.path.getsize(self.index_path)
+        STORE_BYTES_WRITTEN.inc(len(record))
+
+    def remove(self, filenames: List[str]):
+        self.refresh()
+        with self._lock:
+            present = [filename for filename in filenames if filename in self.locations]
+            if not present:
+                return
+            self._append_index([{"filename": filename, "shard": None} for filename in present])
+            for filename in present:
+                self.locations.pop(filename, None)
+            self._index_read_offset = os.path.getsize(self.index_path)
+
+    # Reading
+
+    def _view(self, shard: str, offset: int, length: int) -> memoryview:
+        with self._lock:
+            mapped = self._maps.get(shard)
+            if mapped is None or offset + length > len(mapped):
+                # The shard grew since it was mapped; the old map is released once no view uses it
+                with open(os.path.join(self.folder, shard), "rb") as f:
+                    mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self._maps[shard] = mapped
+        return memoryview(mapped)[offset:offset + length]
+
+    def _record(self, filename: str) -> Tuple[dict, memoryview]:
+        self.refresh()
+        location = self.locations.get(filename)
+        if location is None:
+            raise KeyError(filename)
+        view = self._view(*location)
+        body = view[_RECORD_LENGTH.size:]
+        (header_length,) = _HEADER_LENGTH.unpack(body[:_HEADER_LENGTH.size])
+        header_end = _HEADER_LENGTH.size + header_length
+        header = json.loads(bytes(body[_HEADER_LENGTH.size:header_end]))
+        return header, body[header_end:]
+
+    def page_count(self, filename: str) -> int:
+        return len(self._record(filename)[0]["pages"])
+
+    def routes(self, filename: str) -> Optional[List[str]]:
+        return self._record(filename)[0]["routes"]
+
+    def get_page(self, filename: str, page_no: int) -> str:
+        header, blobs = self._record(filename)
+        start, length = header["pages"][page_no]
+        STORE_BYTES_READ.inc(length)
+        return _decode(blobs[start:start + length], header["codec"])
+
+    def get(self, filename: str) -> List[str]:
+        header, blobs = self._record(filename)
+        STORE_BYTES_READ.inc(len(blobs))
+        return [_decode(blobs[start:start + length], header["codec"]) for start, length in header["pages"]]
+
+    def iter_documents(self) -> Iterator[Tuple[str, List[str]]]:
+        for filename in self.filenames():
+            try:
+                yield filename, self.get(filename)
+            except KeyError:
+                continue  # Removed while iterating
+
+    def close(self):
+        with self._lock:
+            for mapped in self._maps.values():
+                try:
+                    mapped.close()
+                except BufferError:
+                    pass  # Still referenced by a reader; released when that view goes away
+            self._maps.clear()
+
+    def compact(self) -> int:
+        """Rewrite live documents into fresh shards and drop superseded records; returns bytes reclaimed."""
+        with self._lock:
+            self.refresh()
+            before = sum(os.path.getsize(os.path.join(self.folder, s)) for s in self.shards())
+            tmp_folder = self.folder + ".compact"
+            if os.path.exists(tmp_folder):
+                shutil.rmtree(tmp_folder)
+            compacted = DocumentStore(tmp_folder, self.codec, self.shard_max_bytes)
+            for filename, pages in self.iter_documents():
+                compacted.put(filename, pages, self.routes(filename))
+            compacted.close()
+            self.close()
+            old_folder = self.folder + ".old"
+            os.replace(self.folder, old_folder)
+            os.replace(tmp_folder, self.folder)
+            shutil.rmtree(old_folder)
+            self.locations.clear()
+            self._index_read_offset = 0
+            self.refresh()
+            after = sum(os.path.getsize(os.path.join(self.folder, s)) for s in self.shards())
+            return before - after
+
+
+_stores: Dict[str, DocumentStore] = {}
+_stores_lock = threading.Lock()
+
+
+def store_path(output_json_folder: str) -> str:
+    return os.path.join(output_json_folder, STORE_FOLDER_NAME)
+
+
+def open_store(output_json_folder: str) -> DocumentStore:
+    """Process-wide store for an output folder; legacy batch files are migrated into it on first open."""
+    path = store_path(output_json_folder)
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            store = _stores[path] = DocumentStore(path)
+    if list_batch_files(output_json_folder):
+        migrate_batches(output_json_folder, store)
+    return store
+
+
+def has_documents(output_json_folder: str) -> bool:
+    if list_batch_files(output_json_folder):
+        return True
+    index_path = os.path.join(store_path(output_json_folder), INDEX_FILENAME)
+    return os.path.exists(index_path) and len(open_store(output_json_folder)) > 0
+
+
+def migrate_batches(output_json_folder: str, store: DocumentStore) -> int:
+    """Import ExtractedData_Batch*.json files into the store, then move them to legacy_batches/."""
+    legacy_folder = os.path.join(output_json_folder, LEGACY_BATCH_FOLDER)
+    count = 0
+    for json_file in list_batch_files(output_json_folder):
+        try:
+            with open(json_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception as e:
+            logger.error(f"Could not load {json_file} for migration: {e}")
+            continue
+        for filename, pages in data.items():
+            store.put(filename, pages if isinstance(pages, list) else [str(pages)])
+            count += 1
+        os.makedirs(legacy_folder, exist_ok=True)
+        shutil.move(json_file, os.path.join(legacy_folder, os.path.basename(json_file)))
+        logger.info(f"Migrated {json_file} into {store.folder}")
+    return count
+
+
+def export_batches(store: DocumentStore, destination_folder: str, batch_size: int) -> int:
+    """Write the store back out as ExtractedData_Batch*.json files; returns the number of files written."""
+    os.makedirs(destination_folder, exist_ok=True)
+    batch_number, batch = 1, {}
+    for filename, pages in store.iter_documents():
+        batch[filename] = pages
+        if len(batch) >= batch_size:
+            _write_batch(destination_folder, batch_number, batch)
+            batch_number, batch = batch_number + 1, {}
+    if batch:
+        _write_batch(destination_folder, batch_number, batch)
+        batch_number += 1
+    return batch_number - 1
+
+
+def _write_batch(destination_folder: str, batch_number: int, batch: dict):
+    batch_json_path = os.path.join(destination_folder, batch_file_name(batch_number))
+    with open(batch_json_path, "w", encoding="utf-8") as f:
+        json.dump(batch, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Manage the extracted document store")
+    commands = parser.add_subparsers(dest="command", required=True)
+    migrate = commands.add_parser("migrate", help="Import ExtractedData_Batch*.json files into the store")
+    migrate.add_argument("output_json_folder")
+    export = commands.add_parser("export", help="Export the store as ExtractedData_Batch*.json files")
+    export.add_argument("output_json_folder")
+    export.add_argument("destination_folder")
+    export.add_argument("--batch-size", type=int, default=5)
+    compact = commands.add_parser("compact", help="Drop superseded records from the shards (stop the API first)")
+    compact.add_argument("output_json_folder")
+    args = parser.parse_args()
+
+    store = DocumentStore(store_path(args.output_json_folder))
+    if args.command == "migrate":
+        print(f"Migrated {migrate_batches(args.output_json_folder, store)} documents")
+    elif args.command == "export":
+        print(f"Wrote {export_batches(store, args.destination_folder, args.batch_size)} batch files")
+    elif args.command == "compact":
+        print(f"Reclaimed {store.compact()} bytes")
+    store.close()
+    sys.exit(0)
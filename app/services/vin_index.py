@@ -0,0 +1,140 @@
+import threading
+import logging
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+VIN_MATCH_THRESHOLD = 0.8  # Minimum similarity for a fuzzy VIN match
+CONFUSION_COST = 0.25  # Cost of substituting characters Tesseract commonly confuses
+QGRAM_SIZE = 2
+
+# Characters OCR confuses with each other. Groups are equivalence classes so that canonical()
+# maps every confusable pair to the same character.
+OCR_CONFUSION_GROUPS = ["O0QD", "I1L", "S5", "B8", "Z2", "G6"]
+
+_CONFUSION_CLASS = {ch: group for group in OCR_CONFUSION_GROUPS for ch in group}
+
+
+def substitution_cost(a: str, b: str) -> float:
+    if a == b:
+        return 0.0
+    group = _CONFUSION_CLASS.get(a)
+    if group is not None and group is _CONFUSION_CLASS.get(b):
+        return CONFUSION_COST
+    return 1.0
+
+
+def ocr_distance(a: str, b: str) -> float:
+    """Levenshtein distance where OCR-confusable substitutions are cheap."""
+    previous = [float(j) for j in range(len(b) + 1)]
+    for i, ca in enumerate(a, 1):
+        current = [float(i)]
+        for j, cb in enumerate(b, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + substitution_cost(ca, cb),
+            ))
+        previous = current
+    return previous[-1]
+
+
+def similarity(a: str, b: str, distance: Optional[float] = None) -> float:
+    longest = max(len(a), len(b))
+    if longest == 0:
+        return 1.0
+    if distance is None:
+        distance = ocr_distance(a, b)
+    return 1.0 - distance / longest
+
+
+def canonical(value: str) -> str:
+    """Collapse every confusion group to one character, so confusable VINs share q-grams."""
+    return "".join(_CONFUSION_CLASS.get(ch, ch)[0] for ch in value)
+
+
+def qgrams(value: str, q: int = QGRAM_SIZE) -> Dict[str, int]:
+    grams = {}
+    for i in range(len(value) - q + 1):
+        gram = value[i:i + q]
+        grams[gram] = grams.get(gram, 0) + 1
+    return grams
+
+
+class VinIndex:
+    """
+    Approximate-match index over every VIN candidate in the corpus.
+    An inverted index of q-grams over the confusion-canonical form of each VIN applies the q-gram
+    count filter: two strings within edit distance k share at least max(len) - q + 1 - k * q q-grams.
+    Only candidates that pass the filter are scored with ocr_distance.
+    """
+
+    def __init__(self, vins_by_document: Dict[str, Iterable[str]]):
+        self.documents: Dict[str, Set[str]] = {}
+        for filename, vins in vins_by_document.items():
+            for vin in vins:
+                self.documents.setdefault(vin, set()).add(filename)
+        self.vins: List[str] = list(self.documents)
+        self.by_length: Dict[int, List[int]] = {}
+        self.postings: Dict[str, List[Tuple[int, int]]] = {}
+        for vin_id, vin in enumerate(self.vins):
+            self.by_length.setdefault(len(vin), []).append(vin_id)
+            for gram, count in qgrams(canonical(vin)).items():
+                self.postings.setdefault(gram, []).append((vin_id, count))
+
+    def _candidates(self, query: str, threshold: float) -> Iterable[int]:
+        common = {}
+        for gram, query_count in qgrams(canonical(query)).items():
+            for vin_id, count in self.postings.get(gram, ()):
+                common[vin_id] = common.get(vin_id, 0) + min(query_count, count)
+        for length, vin_ids in self.by_length.items():
+            longest = max(len(query), length)
+            radius = (1.0 - threshold) * longest
+            if abs(len(query) - length) > radius:
+                continue
+            required = longest - QGRAM_SIZE + 1 - radius * QGRAM_SIZE
+            if required <= 0:
+                # The filter cannot prune at this length, every candidate has to be scored
+                yield from vin_ids
+            else:
+                yield from (vin_id for vin_id in vin_ids if common.get(vin_id, 0) >= required)
+
+    def search(self, query: str, threshold: float = VIN_MATCH_THRESHOLD) -> List[Tuple[str, float]]:
+        """Return (vin, similarity) pairs at or above threshold, best first."""
+        matches = []
+        for vin_id in self._candidates(query, threshold):
+            vin = self.vins[vin_id]
+            score = similarity(query, vin)
+            if score >= threshold:
+                matches.append((vin, score))
+        matches.sort(key=lambda m: (-m[1], m[0]))
+        return matches
+
+    def match_documents(self, query: str, threshold: float = VIN_MATCH_THRESHOLD) -> Dict[str, float]:
+        """Best similarity per document with a VIN matching query."""
+        scores = {}
+        for vin, score in self.search(query, threshold):
+            for filename in self.documents[vin]:
+                if score > scores.get(filename, 0.0):
+                    scores[filename] = score
+        return scores
+
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def get_vin_index(key, signature, loader) -> VinIndex:
+    """
+    Process-wide VinIndex per search index, rebuilt only when its signature changes.
+    loader() returns {filename: [vin, ...]}.
+    """
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+    vin_index = VinIndex(loader())
+    logger.info(f"Built VIN index with {len(vin_index.documents)} distinct candidates")
+    with _cache_lock:
+        _cache[key] = (signature, vin_index)
+    return vin_index
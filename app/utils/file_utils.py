@@ -0,0 +1,22 @@
+import os
+import re
+from typing import List
+
+BATCH_FILE_PREFIX = "ExtractedData_Batch"
+BATCH_FILE_PATTERN = re.compile(rf"^{BATCH_FILE_PREFIX}(\d+)\.json$", re.IGNORECASE)
+
+
+def batch_file_name(batch_number: int) -> str:
+    return f"{BATCH_FILE_PREFIX}{batch_number}.json"
+
+
+def list_batch_files(folder: str) -> List[str]:
+    """Return the extracted batch JSON files in folder, ordered by batch number."""
+    if not os.path.isdir(folder):
+        return []
+    batches = []
+    for f in os.listdir(folder):
+        match = BATCH_FILE_PATTERN.match(f)
+        if match:
+            batches.append((int(match.group(1)), os.path.join(folder, f)))
+    return [path for _, path in sorted(batches)]
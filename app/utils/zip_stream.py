@@ -0,0 +1,55 @@
+import os
+import zipfile
+from typing import Iterable, Iterator, Tuple
+
+ZIP_CHUNK_SIZE = 1024 * 1024
+
+
+class _ChunkBuffer:
+    """Write-only, non-seekable sink for ZipFile; the bytes written so far are handed out by drain()."""
+
+    def __init__(self):
+        self._chunks = []
+        self._offset = 0
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        # ZipFile records local header offsets through tell() when the sink cannot seek
+        return self._offset
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def stream_zip(entries: Iterable[Tuple[str, str]], chunk_size: int = ZIP_CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    Yield a ZIP archive of (path, arcname) entries as it is built, reading each file in chunks.
+    Entries are stored rather than deflated; PDFs are already compressed.
+    """
+    sink = _ChunkBuffer()
+    with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_STORED, allowZip64=True) as zipf:
+        for path, arcname in entries:
+            info = zipfile.ZipInfo.from_file(path, arcname)
+            info.compress_type = zipfile.ZIP_STORED
+            with open(path, "rb") as src, zipf.open(info, mode="w", force_zip64=os.path.getsize(path) >= 2 ** 31) as dst:
+                while True:
+                    chunk = src.read(chunk_size)
+                    if not chunk:
+                        break
+                    dst.write(chunk)
+                    data = sink.drain()
+                    if data:
+                        yield data
+            data = sink.drain()
+            if data:
+                yield data
+    yield sink.drain()  # Central directory
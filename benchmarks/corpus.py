@@ -0,0 +1,161 @@
+"""
+Generate a synthetic claims-PDF corpus with known field values.
+
+    python -m benchmarks.corpus OUTPUT_FOLDER --documents 100 --seed 7
+
+Documents are a mix of digital PDFs, rasterized "scanned" PDFs with noise, mixed packets with
+both kinds of page, and deliberately corrupt files. Every intact document carries a VIN, contract,
+claim and dealer value; the ground truth is written to corpus.json next to the PDFs.
+"""
+import os
+import sys
+import json
+import random
+import argparse
+
+import fitz
+import numpy as np
+
+from benchmarks.vin_lookup import random_vin
+
+DIGITAL = "digital"
+SCANNED = "scanned"
+MIXED = "mixed"
+CORRUPT = "corrupt"
+DEFAULT_MIX = {DIGITAL: 0.45, SCANNED: 0.3, MIXED: 0.2, CORRUPT: 0.05}
+
+GROUND_TRUTH_FILENAME = "corpus.json"
+PAGE_WIDTH, PAGE_HEIGHT = 612, 792  # US Letter in points
+SCAN_DPI = 150
+FILLER_WORDS = (
+    "vehicle", "repair", "engine", "transmission", "coverage", "authorization", "labor", "parts",
+    "inspection", "mileage", "deductible", "warranty", "component", "diagnosis", "replacement",
+    "customer", "complaint", "cause", "correction", "technician", "estimate", "approved", "invoice",
+)
+DEALER_NAMES = (
+    "Sunrise Motors", "Lakeside Auto Group", "Summit Chevrolet", "Riverbend Ford", "Northgate Toyota",
+    "Pioneer Honda", "Harbor City Nissan", "Maple Ridge Hyundai", "Westfield Kia", "Canyon Jeep",
+)
+
+
+def random_fields(rng: random.Random) -> dict:
+    return {
+        "VIN": random_vin(rng),
+        "Contract": str(rng.randint(10 ** 7, 10 ** 8 - 1)),
+        "Claim": str(rng.randint(10 ** 6, 10 ** 7 - 1)),
+        "Dealer": rng.choice(DEALER_NAMES),
+    }
+
+
+def filler(rng: random.Random, lines: int) -> list:
+    return [" ".join(rng.choice(FILLER_WORDS) for _ in range(rng.randint(8, 12))) for _ in range(lines)]
+
+
+def page_lines(fields: dict, page_no: int, rng: random.Random) -> list:
+    if page_no == 0:
+        header = [
+            "VEHICLE SERVICE CONTRACT CLAIM",
+            f"Claim Number: {fields['Claim']}",
+            f"Contract Number: {fields['Contract']}",
+            f"VIN: {fields['VIN']}",
+            f"Dealer: {fields['Dealer']} {rng.randint(100, 999)}",
+            "",
+        ]
+        return header + filler(rng, 20)
+    return [f"Page {page_no + 1} - Repair order notes"] + filler(rng, 30)
+
+
+def write_text_page(doc: fitz.Document, lines: list):
+    page = doc.new_page(width=PAGE_WIDTH, height=PAGE_HEIGHT)
+    page.insert_text((54, 60), "\n".join(lines), fontsize=11, fontname="helv")
+
+
+def scanned_page(doc: fitz.Document, lines: list, rng: random.Random):
+    """Render a text page to grayscale, add scanner noise and a slight skew, and insert it as an image."""
+    source = fitz.open()
+    write_text_page(source, lines)
+    pix = source[0].get_pixmap(dpi=SCAN_DPI, colorspace=fitz.csGRAY)
+    img = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.stride)[:, :pix.width]
+    noise_rng = np.random.default_rng(rng.randrange(2 ** 32))
+    img = img.astype(np.int16) + noise_rng.normal(0, 18, img.shape).astype(np.int16)
+    speckle = noise_rng.random(img.shape)
+    img[speckle < 0.002] = 0
+    img[speckle > 0.998] = 255
+    img = np.clip(img, 0, 255).astype(np.uint8)
+    shift = rng.randint(-3, 3)
+    if shift:
+        img = np.roll(img, shift, axis=0)
+    scan = fitz.Pixmap(fitz.csGRAY, pix.width, pix.height, np.ascontiguousarray(img).tobytes(), False)
+    page = doc.new_page(width=PAGE_WIDTH, height=PAGE_HEIGHT)
+    page.insert_image(page.rect, pixmap=scan)
+    source.close()
+
+
+def write_document(path: str, kind: str, fields: dict, pages: int, rng: random.Random):
+    doc = fitz.open()
+    for page_no in range(pages):
+        lines = page_lines(fields, page_no, rng)
+        scanned = kind == SCANNED or (kind == MIXED and page_no % 2 == 1)
+        if scanned:
+            scanned_page(doc, lines, rng)
+        else:
+            write_text_page(doc, lines)
+    doc.save(path, garbage=3, deflate=True)
+    doc.close()
+
+
+def corrupt_document(path: str, fields: dict, rng: random.Random):
+    """Either a truncated PDF or a file that is not a PDF at all."""
+    write_document(path, DIGITAL, fields, 2, rng)
+    with open(path, "rb") as f:
+        data = f.read()
+    if rng.random() < 0.5:
+        data = data[:len(data) // 2]
+    else:
+        data = b"This is not a PDF\n" + bytes(rng.randrange(256) for _ in range(2048))
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def generate_corpus(folder: str, documents: int, seed: int = 7, mix: dict = None, max_pages: int = 4) -> dict:
+    """Write documents PDFs into folder and return the ground truth {filename: {kind, pages, fields}}."""
+    mix = mix or DEFAULT_MIX
+    rng = random.Random(seed)
+    os.makedirs(folder, exist_ok=True)
+    kinds, weights = zip(*mix.items())
+    truth = {}
+    for i in range(documents):
+        filename = f"{80000000 + i}.pdf"
+        path = os.path.join(folder, filename)
+        kind = rng.choices(kinds, weights)[0]
+        fields = random_fields(rng)
+        if kind == CORRUPT:
+            corrupt_document(path, fields, rng)
+            truth[filename] = {"kind": kind, "pages": 0, "fields": None}
+            continue
+        pages = rng.randint(2 if kind == MIXED else 1, max_pages)
+        write_document(path, kind, fields, pages, rng)
+        truth[filename] = {"kind": kind, "pages": pages, "fields": fields}
+    with open(os.path.join(folder, GROUND_TRUTH_FILENAME), "w", encoding="utf-8") as f:
+        json.dump(truth, f, indent=2)
+    return truth
+
+
+def load_ground_truth(folder: str) -> dict:
+    with open(os.path.join(folder, GROUND_TRUTH_FILENAME), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("folder")
+    parser.add_argument("--documents", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--max-pages", type=int, default=4)
+    args = parser.parse_args()
+    truth = generate_corpus(args.folder, args.documents, args.seed, max_pages=args.max_pages)
+    counts = {}
+    for item in truth.values():
+        counts[item["kind"]] = counts.get(item["kind"], 0) + 1
+    json.dump({"folder": args.folder, "documents": len(truth), "kinds": counts}, sys.stdout, indent=2)
+    print()
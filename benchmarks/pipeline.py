@@ -0,0 +1,324 @@
+"""
+Benchmark extraction and search on synthetic corpora of increasing size.
+
+    python -m benchmarks.pipeline --sizes 20,100,500 --queries 50 --output results.json
+    python -m benchmarks.pipeline --sizes 100 --ocr-backends pytesseract,tesserocr
+    python -m benchmarks.pipeline --sizes 500 --search-workers 1,2,4,8
+
+For every corpus size a fresh corpus is generated (see benchmarks.corpus) and measured in its own
+process, so peak RSS is not carried over between sizes. Reports:
+  - extraction: wall time, pages/sec, per-document latency, and the pipeline's own stage and
+    queue-wait metrics from process_folder_fast,
+  - stages: per-page latency of routing, rendering, preprocessing and OCR on a page sample,
+  - memory: peak RSS of the benchmark process and of the OCR worker processes,
+  - search: p50/p99 latency of search_claim_documents per field, cold and warm query cache, and
+    with the parallel shard scan for each --search-workers count.
+Results are JSON so runs of different versions can be compared.
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+from datetime import datetime, timezone
+
+from benchmarks.corpus import CORRUPT, generate_corpus
+from benchmarks.vin_lookup import add_ocr_noise, percentile
+
+
+def peak_rss_mb():
+    """Peak RSS of this process and of its terminated children, or None where it is not available."""
+    try:
+        import resource
+    except ImportError:
+        return None, None
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale
+    return round(own, 1), round(children, 1)
+
+
+def latency_summary(latencies):
+    if not latencies:
+        return {"count": 0}
+    return {
+        "count": len(latencies),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3),
+    }
+
+
+class DocumentTimer:
+    """Progress listener for process_folder_fast recording per-document latency and page counts."""
+
+    def __init__(self):
+        self.started = {}
+        self.latencies = []
+        self.pages = 0
+
+    def files_pending(self, filenames):
+        pass
+
+    def document_started(self, filename, page_count):
+        self.started[filename] = time.perf_counter()
+
+    def pages_done(self, filename, count=1):
+        self.pages += count
+
+    def document_done(self, filename, ok):
+        started = self.started.pop(filename, None)
+        if ok and started is not None:
+            self.latencies.append(time.perf_counter() - started)
+
+
+def metric_means(histogram):
+    """Mean milliseconds and count per label of a pipeline histogram."""
+    return {
+        ",".join(key): {"count": count, "mean_ms": round(total / count * 1000, 3)}
+        for key, (count, total) in sorted(histogram.totals().items()) if count
+    }
+
+
+def measure_extraction(input_folder, output_folder, batch_size, mode):
+    from app.services.extractor import MODE_FIELDS, complete_deferred_documents, process_folder_fast
+    from app.services.metrics import EXTRACTION_QUEUE_WAIT_SECONDS, EXTRACTION_STAGE_SECONDS
+    from app.services.scheduler import shutdown_ocr_pool
+
+    timer = DocumentTimer()
+    start = time.perf_counter()
+    processed, total, stats = process_folder_fast(input_folder, output_folder, batch_size, progress=timer, mode=mode)
+    seconds = time.perf_counter() - start
+    full_text_seconds = None
+    if mode == MODE_FIELDS:
+        # Time to searchable is `seconds`; this is what the deferred full-text pass adds on top
+        start = time.perf_counter()
+        complete_deferred_documents(input_folder, output_folder)
+        full_text_seconds = round(time.perf_counter() - start, 3)
+    # Worker processes only count towards RUSAGE_CHILDREN once they have exited
+    shutdown_ocr_pool()
+    return {
+        "mode": mode,
+        "seconds": round(seconds, 3),
+        "full_text_seconds": full_text_seconds,
+        "documents_processed": processed,
+        "documents_total": total,
+        "pages": timer.pages,
+        "pages_per_second": round(timer.pages / seconds, 2) if seconds else 0.0,
+        "document_latency": latency_summary(timer.latencies),
+        "pipeline_stages": metric_means(EXTRACTION_STAGE_SECONDS),
+        "queue_wait": metric_means(EXTRACTION_QUEUE_WAIT_SECONDS),
+        "stats": stats,
+    }
+
+
+def measure_stages(input_folder, truth, sample_pages, seed):
+    """Time each extraction stage on a sample of pages, in this process and one page at a time."""
+    import fitz
+    from app.services.extractor import (
+        ROUTE_OCR, fast_preprocess, iter_page_pixmaps, ocr_image, pixmap_to_array, route_pages
+    )
+
+    rng = random.Random(seed)
+    filenames = [f for f, item in sorted(truth.items()) if item["kind"] != CORRUPT]
+    rng.shuffle(filenames)
+    timings = {"route": [], "render": [], "preprocess": [], "ocr": []}
+    ocr_pages = 0
+    for filename in filenames:
+        if ocr_pages >= sample_pages:
+            break
+        with fitz.open(os.path.join(input_folder, filename)) as doc:
+            start = time.perf_counter()
+            _, routes = route_pages(doc)
+            timings["route"].append((time.perf_counter() - start) / max(len(doc), 1))
+            wanted = [page_no for page_no, route in enumerate(routes) if route == ROUTE_OCR]
+            pixmaps = iter_page_pixmaps(doc, page_numbers=wanted[:sample_pages - ocr_pages])
+            while True:
+                start = time.perf_counter()
+                item = next(pixmaps, None)
+                if item is None:
+                    break
+                timings["render"].append(time.perf_counter() - start)
+                _, pix = item
+                start = time.perf_counter()
+                img = fast_preprocess(pixmap_to_array(pix))
+                timings["preprocess"].append(time.perf_counter() - start)
+                start = time.perf_counter()
+                ocr_image(img)
+                timings["ocr"].append(time.perf_counter() - start)
+                ocr_pages += 1
+    return {stage: latency_summary(values) for stage, values in timings.items()}
+
+
+def search_queries(truth, queries, seed):
+    """(field, value, expected filename) triples drawn from the ground truth."""
+    rng = random.Random(seed)
+    intact = [(filename, item["fields"]) for filename, item in sorted(truth.items()) if item["fields"]]
+    picks = [rng.choice(intact) for _ in range(queries)] if intact else []
+    generated = []
+    for filename, fields in picks:
+        generated.append(("VIN", fields["VIN"], filename))
+        generated.append(("VIN (OCR noise)", add_ocr_noise(fields["VIN"], rng, confusions=1, errors=0), filename))
+        generated.append(("Contract #", fields["Contract"], filename))
+        generated.append(("Claim #", fields["Claim"], filename))
+        generated.append(("Dealer Name", fields["Dealer"], filename))
+        generated.append(("Search by Word", fields["Contract"], filename))
+    return generated
+
+
+def measure_search(input_folder, output_folder, truth, queries, seed, search_workers=()):
+    from app.Exception.NoMatchFoundException import NoMatchFoundException
+    from app.services.parallel_search import shutdown_search_pools
+    from app.services.query_cache import query_cache
+    from app.services.search import search_claim_documents
+
+    results = {}
+    # The index path cold and warm, then the parallel scan; its workers are warmed by one query first
+    modes = [("cold", 0), ("warm", 0)] + [(f"parallel_{workers}", workers) for workers in search_workers]
+    for mode, workers in modes:
+        latencies, found = {}, {}
+        queries_to_run = search_queries(truth, queries, seed)
+        if workers and queries_to_run:
+            label, value, _ = queries_to_run[0]
+            try:
+                search_claim_documents({label.split(" (")[0]: value}, input_folder, output_folder, search_workers=workers)
+            except NoMatchFoundException:
+                pass
+        for label, value, filename in queries_to_run:
+            field = label.split(" (")[0]
+            if mode == "cold":
+                query_cache.clear()
+            start = time.perf_counter()
+            try:
+                matches = search_claim_documents({field: value}, input_folder, output_folder, search_workers=workers)
+            except NoMatchFoundException:
+                matches = []
+            latencies.setdefault(label, []).append(time.perf_counter() - start)
+            found[label] = found.get(label, 0) + (filename in matches)
+        results[mode] = {
+            label: dict(latency_summary(values), recall=round(found[label] / len(values), 3))
+            for label, values in latencies.items()
+        }
+    shutdown_search_pools()
+    return results
+
+
+def run_single(documents, queries, seed, batch_size, stage_sample, workdir, mode="full", search_workers=()):
+    from app.services import extractor, scheduler
+    from app.services.ocr_engine import get_engine
+
+    workdir = workdir or tempfile.mkdtemp(prefix="claims_bench_")
+    input_folder = os.path.join(workdir, f"corpus_{documents}")
+    output_folder = os.path.join(input_folder, "Extracted_Json_Files")
+    # Always measure a cold extraction, never an incremental run over a kept corpus
+    shutil.rmtree(output_folder, ignore_errors=True)
+    start = time.perf_counter()
+    truth = generate_corpus(input_folder, documents, seed)
+    generate_seconds = time.perf_counter() - start
+
+    kinds = {}
+    for item in truth.values():
+        kinds[item["kind"]] = kinds.get(item["kind"], 0) + 1
+    result = {
+        "documents": documents,
+        "pages": sum(item["pages"] for item in truth.values()),
+        "kinds": kinds,
+        "generate_seconds": round(generate_seconds, 3),
+        "extraction": measure_extraction(input_folder, output_folder, batch_size, mode),
+        "stages": measure_stages(input_folder, truth, stage_sample, seed),
+        "search": measure_search(input_folder, output_folder, truth, queries, seed, search_workers),
+        "config": {
+            "ocr_backend": get_engine().name,
+            "dpi": extractor.DPI,
+            "adaptive_ocr": scheduler.ADAPTIVE_OCR,
+            "high_dpi": extractor.HIGH_DPI,
+            "low_confidence": extractor.LOW_CONFIDENCE,
+            "ocr_workers": scheduler.OCR_WORKERS,
+            "preprocess_workers": scheduler.PREPROCESS_WORKERS,
+            "batch_size": batch_size,
+            "search_workers": list(search_workers),
+        },
+    }
+    own, children = peak_rss_mb()
+    result["memory"] = {"peak_rss_mb": own, "peak_worker_rss_mb": children}
+    return result
+
+
+def run(
+    sizes, queries, seed, batch_size, stage_sample, workdir=None, keep=False, mode="full", backends=None, search_workers=()
+):
+    """Measure every corpus size, once per OCR backend, each in a fresh interpreter, and collect the results."""
+    workdir = workdir or tempfile.mkdtemp(prefix="claims_bench_")
+    runs = []
+    try:
+        for backend in backends or [None]:
+            env = dict(os.environ)
+            if backend:
+                # Read by app.config in the measuring process and in its OCR workers
+                env["OCR_BACKEND"] = backend
+            for documents in sizes:
+                command = [
+                    sys.executable, "-m", "benchmarks.pipeline", "--single", str(documents),
+                    "--queries", str(queries), "--seed", str(seed), "--batch-size", str(batch_size),
+                    "--stage-sample", str(stage_sample), "--workdir", workdir, "--mode", mode,
+                    "--search-workers", ",".join(str(workers) for workers in search_workers),
+                ]
+                completed = subprocess.run(command, stdout=subprocess.PIPE, check=True, env=env)
+                runs.append(json.loads(completed.stdout))
+    finally:
+        if not keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "seed": seed,
+        "runs": runs,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="20,100", help="Comma-separated corpus sizes in documents")
+    parser.add_argument("--queries", type=int, default=20, help="Documents to query per field")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--batch-size", type=int, default=5)
+    parser.add_argument("--stage-sample", type=int, default=20, help="OCR pages timed stage by stage")
+    parser.add_argument(
+        "--ocr-backends", help="Comma-separated OCR backends to compare, e.g. pytesseract,tesserocr (default: configured)"
+    )
+    parser.add_argument("--mode", default="full", choices=("full", "fields"), help="Extraction mode to measure")
+    parser.add_argument(
+        "--search-workers", default="", help="Comma-separated worker counts to measure the parallel search with, e.g. 1,2,4"
+    )
+    parser.add_argument("--workdir", help="Where corpora are generated (default: a temporary folder)")
+    parser.add_argument("--keep", action="store_true", help="Keep the generated corpora")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    parser.add_argument("--single", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    search_workers = [int(workers) for workers in args.search_workers.split(",") if workers.strip()]
+    if args.single is not None:
+        report = run_single(
+            args.single, args.queries, args.seed, args.batch_size, args.stage_sample, args.workdir, args.mode, search_workers
+        )
+    else:
+        sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+        backends = [b.strip() for b in args.ocr_backends.split(",") if b.strip()] if args.ocr_backends else None
+        report = run(
+            sizes, args.queries, args.seed, args.batch_size, args.stage_sample, args.workdir, args.keep, args.mode, backends,
+            search_workers
+        )
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
@@ -0,0 +1,112 @@
+"""
+Compare the legacy SequenceMatcher scan against VinIndex for fuzzy VIN lookups.
+
+    python -m benchmarks.vin_lookup --documents 20000 --queries 200
+
+Each query is a corpus VIN with OCR-style noise applied. Reports recall of the source document,
+average number of other documents returned, and per-query latency for both approaches, as JSON.
+"""
+import sys
+import json
+import time
+import random
+import argparse
+import statistics
+from difflib import SequenceMatcher
+
+from app.services.fields import normalize_vin_query
+from app.services.vin_index import VIN_MATCH_THRESHOLD, VinIndex
+
+VIN_CHARS = "ABCDEFGHJKLMNPRSTUVWXYZ0123456789"
+OCR_SWAPS = {"S": "5", "5": "S", "B": "8", "8": "B", "Z": "2", "2": "Z", "G": "6", "6": "G", "0": "O", "1": "I"}
+
+
+def random_vin(rng):
+    return "".join(rng.choice(VIN_CHARS) for _ in range(17))
+
+
+def add_ocr_noise(vin, rng, confusions=2, errors=1):
+    chars = list(vin)
+    swappable = [i for i, ch in enumerate(chars) if ch in OCR_SWAPS]
+    for i in rng.sample(swappable, min(confusions, len(swappable))):
+        chars[i] = OCR_SWAPS[chars[i]]
+    for i in rng.sample(range(len(chars)), errors):
+        chars[i] = rng.choice(VIN_CHARS)
+    return "".join(chars)
+
+
+def get_best_fuzzy_match(target, candidates, threshold=0.6):
+    """The per-document VIN comparison search used before VinIndex, kept here as the baseline."""
+    best_ratio = 0
+    best_candidate = None
+    for cand in candidates:
+        ratio = SequenceMatcher(None, target, cand).ratio()
+        if ratio > best_ratio:
+            best_ratio = ratio
+            best_candidate = cand
+    if best_ratio >= threshold:
+        return best_candidate
+    return None
+
+
+def legacy_scan(query, corpus):
+    return {filename for filename, vins in corpus.items()
+            if query in vins or get_best_fuzzy_match(query, vins, threshold=VIN_MATCH_THRESHOLD)}
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def summarize(name, latencies, hits, extras):
+    return {
+        "method": name,
+        "recall": hits / len(latencies),
+        "avg_other_matches": statistics.mean(extras),
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+
+def run(documents, queries, seed):
+    rng = random.Random(seed)
+    corpus = {f"{70000000 + i}.pdf": [random_vin(rng)] for i in range(documents)}
+    targets = rng.sample(sorted(corpus), queries)
+    noisy = [(filename, normalize_vin_query(add_ocr_noise(corpus[filename][0], rng))) for filename in targets]
+
+    start = time.perf_counter()
+    vin_index = VinIndex(corpus)
+    build_seconds = time.perf_counter() - start
+
+    results = []
+    for name, lookup in (
+        ("sequence_matcher_scan", lambda q: legacy_scan(q, corpus)),
+        ("vin_index", lambda q: set(vin_index.match_documents(q))),
+    ):
+        latencies, extras, hits = [], [], 0
+        for filename, query in noisy:
+            start = time.perf_counter()
+            found = lookup(query)
+            latencies.append(time.perf_counter() - start)
+            hits += filename in found
+            extras.append(len(found - {filename}))
+        results.append(summarize(name, latencies, hits, extras))
+
+    return {
+        "documents": documents,
+        "queries": queries,
+        "threshold": VIN_MATCH_THRESHOLD,
+        "index_build_seconds": build_seconds,
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--documents", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    json.dump(run(args.documents, args.queries, args.seed), sys.stdout, indent=2)
+    print()
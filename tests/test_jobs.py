@@ -0,0 +1,154 @@
+import json
+import os
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("fitz")
+pytest.importorskip("cv2")
+
+from app.services import jobs  # noqa: E402
+from app.services.jobs import (  # noqa: E402
+    CANCELLED, CANCELLING, COMPLETED, FAILED, PHASE_FULL_TEXT, QUEUED, RUNNING, ExtractionJob, JobManager
+)
+
+STATS = {
+    "new": 2, "changed": 0, "unchanged": 1, "skipped": 0, "failed": 0,
+    "escalated_pages": 0, "escalated_regions": 0, "cached_pages": 0, "blank_pages": 0,
+}
+
+
+class FakeExtraction:
+    """Stands in for process_all_pdfs; `hold` keeps it running until released or cancelled."""
+
+    def __init__(self, hold=False, error=None):
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.hold = hold
+        self.error = error
+
+    def __call__(self, folder_path, output_json_path, batch_size, progress=None, cancel_event=None, mode=None):
+        progress.files_pending(["a.pdf", "b.pdf"])
+        progress.document_started("a.pdf", 2)
+        progress.pages_done("a.pdf", 2)
+        progress.document_done("a.pdf", True)
+        self.started.set()
+        if self.hold:
+            while not self.release.is_set() and not cancel_event.is_set():
+                self.release.wait(0.01)
+        if self.error:
+            raise self.error
+        return True, output_json_path, "", 2, 3, STATS
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, "complete_deferred_documents", lambda *args, **kwargs: 0)
+    return JobManager(str(tmp_path / "jobs"))
+
+
+def wait_until_finished(job):
+    # The final status is saved right after it is set
+    for _ in range(500):
+        if not job.is_active and saved_state(job)["Status"] == job.state["Status"]:
+            return
+        time.sleep(0.01)
+    raise AssertionError(f"job still {job.state['Status']}")
+
+
+def saved_state(job):
+    with open(job.state_path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_job_runs_to_completion(manager, monkeypatch):
+    monkeypatch.setattr(jobs, "process_all_pdfs", FakeExtraction())
+    job = manager.start("in", "out", 5)
+    wait_until_finished(job)
+
+    state = saved_state(job)
+    assert state["Status"] == COMPLETED
+    assert state["Phase"] == PHASE_FULL_TEXT
+    assert state["Success"] is True
+    assert state["StartedAt"] and state["FinishedAt"]
+    assert state["Summary"].startswith("2 of 3 documents extracted")
+    assert state["Files"]["a.pdf"] == {"Status": "done", "Pages": 2, "PagesDone": 2}
+    assert state["Progress"]["FilesTotal"] == 2
+    assert state["Progress"]["FilesDone"] == 1
+    assert manager.active_job() is None
+
+
+def test_one_job_at_a_time(manager, monkeypatch):
+    extraction = FakeExtraction(hold=True)
+    monkeypatch.setattr(jobs, "process_all_pdfs", extraction)
+    job = manager.start("in", "out", 5)
+    assert extraction.started.wait(5)
+
+    assert job.state["Status"] == RUNNING
+    assert manager.start("in", "out", 5) is job
+    other, result = manager.run_inline("in", "out", 5)
+    assert other is job and result is None
+
+    extraction.release.set()
+    wait_until_finished(job)
+    assert job.state["Status"] == COMPLETED
+
+
+def test_cancel_running_job(manager, monkeypatch):
+    extraction = FakeExtraction(hold=True)
+    monkeypatch.setattr(jobs, "process_all_pdfs", extraction)
+    job = manager.start("in", "out", 5)
+    assert extraction.started.wait(5)
+
+    assert job.cancel()
+    assert job.state["Status"] in (CANCELLING, CANCELLED)
+    wait_until_finished(job)
+    assert saved_state(job)["Status"] == CANCELLED
+    assert not job.cancel()
+
+
+def test_cancel_finished_job(manager, monkeypatch):
+    monkeypatch.setattr(jobs, "process_all_pdfs", FakeExtraction())
+    job, result = manager.run_inline("in", "out", 5)
+    assert result[0] is True
+
+    # The job finished just before the cancel arrived: it stays completed
+    assert not job.cancel()
+    assert not job.cancel_event.is_set()
+    assert job.state["Status"] == COMPLETED
+    assert saved_state(job)["Status"] == COMPLETED
+
+
+def test_failed_job(manager, monkeypatch):
+    monkeypatch.setattr(jobs, "process_all_pdfs", FakeExtraction(error=RuntimeError("disk full")))
+    job = manager.start("in", "out", 5)
+    wait_until_finished(job)
+
+    state = saved_state(job)
+    assert state["Status"] == FAILED
+    assert state["Message"] == "disk full"
+
+
+def test_resume_after_restart(tmp_path, manager, monkeypatch):
+    jobs_folder = str(tmp_path / "jobs")
+    os.makedirs(jobs_folder)
+    states = {}
+    for n, status in enumerate((RUNNING, QUEUED, CANCELLING, COMPLETED)):
+        job = ExtractionJob.create(jobs_folder, "in", "out", 5)
+        job.state.update(Status=status, CreatedAt=f"2026-01-0{n + 1}T00:00:00+00:00")
+        job.save(force=True)
+        states[status] = job.job_id
+    monkeypatch.setattr(jobs, "process_all_pdfs", FakeExtraction())
+
+    manager.resume()
+    resumed = manager.get(states[QUEUED])
+    wait_until_finished(resumed)
+
+    # The newest interrupted job runs again, older ones are superseded, a pending cancel completes
+    assert resumed.state["Status"] == COMPLETED
+    assert resumed.state["Resumes"] == 1
+    assert manager.get(states[RUNNING]).state["Status"] == CANCELLED
+    assert manager.get(states[RUNNING]).state["Message"] == "Superseded by a newer job on restart"
+    assert manager.get(states[CANCELLING]).state["Status"] == CANCELLED
+    assert manager.get(states[COMPLETED]).state["Status"] == COMPLETED
@@ -0,0 +1,120 @@
+import os
+
+import pytest
+
+from app.services import manifest
+from app.services.manifest import (
+    CHANGED, NEW, RETRY, SKIPPED, STATUS_CORRUPT, STATUS_INCOMPLETE, STATUS_OK, UNCHANGED, classify,
+    load_manifest, quick_pdf_check, save_manifest
+)
+
+PDF = b"%PDF-1.4\n1 0 obj\n<<>>\nendobj\nstartxref\n0\n%%EOF\n"
+
+
+def write(path, content, mtime_ns=None):
+    path.write_bytes(content)
+    if mtime_ns is not None:
+        os.utime(path, ns=(mtime_ns, mtime_ns))
+    return str(path)
+
+
+def test_new_file(tmp_path):
+    state, entry = classify(write(tmp_path / "a.pdf", PDF), None)
+    assert state == NEW
+    assert entry["size"] == len(PDF) and len(entry["sha256"]) == 64
+
+
+def test_unchanged_file_is_not_hashed(tmp_path, monkeypatch):
+    path = write(tmp_path / "a.pdf", PDF)
+    _, entry = classify(path, None)
+    entry = dict(entry, status=STATUS_OK)
+
+    def no_hashing(path):
+        raise AssertionError("an unchanged file was hashed")
+
+    monkeypatch.setattr(manifest, "file_hash", no_hashing)
+    assert classify(path, entry) == (UNCHANGED, entry)
+
+
+def test_touched_file_with_same_content(tmp_path):
+    path = write(tmp_path / "a.pdf", PDF, mtime_ns=1_000_000_000)
+    _, entry = classify(path, None)
+    write(tmp_path / "a.pdf", PDF, mtime_ns=2_000_000_000)
+
+    state, updated = classify(path, dict(entry, status=STATUS_OK))
+    assert state == UNCHANGED
+    assert updated["mtime"] == 2_000_000_000 and updated["status"] == STATUS_OK
+
+
+def test_changed_file(tmp_path):
+    path = write(tmp_path / "a.pdf", PDF, mtime_ns=1_000_000_000)
+    _, entry = classify(path, None)
+    write(tmp_path / "a.pdf", PDF.replace(b"<<>>", b"<</A 1>>"), mtime_ns=2_000_000_000)
+
+    state, updated = classify(path, dict(entry, status=STATUS_OK))
+    assert state == CHANGED
+    assert updated["sha256"] != entry["sha256"] and "status" not in updated
+
+
+@pytest.mark.parametrize("status, expected", [(STATUS_CORRUPT, SKIPPED), (STATUS_INCOMPLETE, RETRY)])
+def test_previous_outcome_decides_unchanged_files(tmp_path, status, expected):
+    path = write(tmp_path / "a.pdf", PDF)
+    _, entry = classify(path, None)
+    assert classify(path, dict(entry, status=status))[0] == expected
+
+
+def test_manifest_round_trip(tmp_path):
+    entries = {"a.pdf": {"size": 1, "mtime": 2, "sha256": "x", "status": STATUS_OK}}
+    save_manifest(str(tmp_path), entries)
+    assert load_manifest(str(tmp_path)) == entries
+    assert load_manifest(str(tmp_path / "missing")) == {}
+
+    (tmp_path / manifest.MANIFEST_FILENAME).write_text('{"version": 0, "files": {"a.pdf": {}}}')
+    assert load_manifest(str(tmp_path)) == {}  # Another version: everything is extracted again
+
+
+def test_quick_pdf_check(tmp_path):
+    assert quick_pdf_check(write(tmp_path / "ok.pdf", PDF)) is None
+    assert quick_pdf_check(write(tmp_path / "html.pdf", b"<html></html>")) == "Missing %PDF header"
+    assert quick_pdf_check(write(tmp_path / "cut.pdf", PDF[:20])) == "Missing xref trailer"
+    assert quick_pdf_check(str(tmp_path / "missing.pdf")).startswith("Unreadable file")
+
+
+def test_incremental_extraction(tmp_path):
+    fitz = pytest.importorskip("fitz")
+    pytest.importorskip("cv2")
+    from app.services.extractor import process_folder_fast
+    from app.services.scheduler import shutdown_ocr_pool
+    from app.services.storage import open_store
+
+    folder, output = tmp_path / "pdfs", str(tmp_path / "out")
+    folder.mkdir()
+
+    def make_pdf(filename, text):
+        doc = fitz.open()
+        doc.new_page().insert_text((72, 72), text * 3)  # Enough embedded text to skip OCR
+        doc.save(str(folder / filename))
+        doc.close()
+
+    make_pdf("a.pdf", "Contract # 1000001 ")
+    make_pdf("b.pdf", "Contract # 1000002 ")
+    make_pdf("c.pdf", "Contract # 1000003 ")
+    try:
+        extracted, total, stats = process_folder_fast(str(folder), output, batch_size=2)
+        assert (extracted, total, stats[NEW]) == (3, 3, 3)
+
+        mtime_ns = os.stat(folder / "b.pdf").st_mtime_ns
+        make_pdf("b.pdf", "Contract # 2000002 ")  # Same size
+        os.utime(folder / "b.pdf", ns=(mtime_ns + 10 ** 9, mtime_ns + 10 ** 9))
+        os.remove(folder / "c.pdf")
+        make_pdf("d.pdf", "Contract # 1000004 ")
+        extracted, total, stats = process_folder_fast(str(folder), output, batch_size=2)
+    finally:
+        shutdown_ocr_pool()
+
+    assert (extracted, total) == (2, 3)
+    assert (stats[NEW], stats[CHANGED], stats[UNCHANGED]) == (1, 1, 1)
+    assert sorted(load_manifest(output)) == ["a.pdf", "b.pdf", "d.pdf"]
+    store = open_store(output)
+    assert sorted(store.filenames()) == ["a.pdf", "b.pdf", "d.pdf"]
+    assert "2000002" in store.get("b.pdf")[0]
@@ -0,0 +1,67 @@
+import pytest
+
+from app.services import metrics
+from app.services.metrics import Counter, Gauge, Histogram, Registry
+
+
+def test_counter_render():
+    requests = Counter("test_requests_total", "Requests, by outcome.", ("outcome",))
+    requests.inc(outcome="match")
+    requests.inc(2, outcome="no_match")
+    requests.inc(outcome="match")
+
+    assert requests.value(outcome="match") == 2
+    assert requests.render().splitlines() == [
+        "# HELP test_requests_total Requests, by outcome.",
+        "# TYPE test_requests_total counter",
+        'test_requests_total{outcome="match"} 2',
+        'test_requests_total{outcome="no_match"} 2',
+    ]
+
+
+def test_histogram_render():
+    seconds = Histogram("test_seconds", "Time per stage.", ("stage",), buckets=(0.1, 1.0))
+    timings = {}
+    with seconds.time(timings, "ocr", stage="ocr"):
+        pass
+    seconds.observe(0.5, stage="ocr")
+    seconds.observe(2.0, stage="ocr")
+
+    lines = seconds.render().splitlines()
+    assert lines[:2] == ["# HELP test_seconds Time per stage.", "# TYPE test_seconds histogram"]
+    # Buckets are cumulative and end with +Inf, then the sum and the count
+    assert lines[2:5] == [
+        'test_seconds_bucket{stage="ocr",le="0.1"} 1',
+        'test_seconds_bucket{stage="ocr",le="1.0"} 2',
+        'test_seconds_bucket{stage="ocr",le="+Inf"} 3',
+    ]
+    assert lines[5].startswith('test_seconds_sum{stage="ocr"} 2.5')
+    assert lines[6] == 'test_seconds_count{stage="ocr"} 3'
+    assert "ocr" in timings
+    assert seconds.totals()[("ocr",)][0] == 3
+
+
+def test_gauge_and_label_escaping():
+    gauge = Gauge("test_cache_bytes", "Cache size.", lambda: {('C:\\out "a"\n',): 10}, ("path",))
+    assert gauge.render().splitlines()[-1] == 'test_cache_bytes{path="C:\\\\out \\"a\\"\\n"} 10'
+
+
+def test_labels_are_checked():
+    requests = Counter("test_checked_total", "Checked.", ("outcome",))
+    with pytest.raises(ValueError):
+        requests.inc(result="match")
+
+
+def test_registry_render():
+    registry = Registry()
+    registry.register(Counter("test_a_total", "A."))
+    registry.register(Counter("test_b_total", "B.")).inc()
+    text = registry.render()
+    assert text.endswith("\n")
+    assert "# TYPE test_a_total counter\n# HELP test_b_total B." in text
+    assert "test_b_total 1\n" in text
+
+    # Every metric the application registers renders
+    rendered = metrics.render()
+    assert "# TYPE claims_search_seconds histogram" in rendered
+    assert "# TYPE claims_extraction_pages_total counter" in rendered
@@ -0,0 +1,77 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("cv2")
+
+from app.services.page_cache import (  # noqa: E402
+    HIT_EXACT, MISS, PAGE_CACHE_ENTRY_OVERHEAD, PageCache, exact_hash, is_blank_page, page_variant
+)
+
+
+def page(width=200, height=300, ink=()):
+    """A white grayscale page with black (top, left, bottom, right) boxes."""
+    gray = np.full((height, width), 255, dtype=np.uint8)
+    for top, left, bottom, right in ink:
+        gray[top:bottom, left:right] = 0
+    return gray
+
+
+def test_hits_and_misses(tmp_path):
+    cache = PageCache(str(tmp_path / "cache.sqlite3"))
+    variant = page_variant("full", 100, False, "tesserocr")
+    key = exact_hash(page(ink=[(10, 10, 20, 80)]), variant)
+
+    assert cache.lookup(key) == (None, MISS)
+    cache.put(key, variant, "Contract # 1234567")
+    assert cache.lookup(key) == ("Contract # 1234567", HIT_EXACT)
+    # The same pixels rendered again, e.g. the same cover sheet in another PDF
+    assert cache.lookup(exact_hash(page(ink=[(10, 10, 20, 80)]), variant))[1] == HIT_EXACT
+    # One pixel of difference is another page
+    assert cache.lookup(exact_hash(page(ink=[(10, 10, 20, 81)]), variant))[1] == MISS
+
+    stats = cache.stats()
+    assert (stats["Entries"], stats["Hits"], stats["Misses"], stats["HitRate"]) == (1, 2, 2, 0.5)
+    assert PageCache(cache.path).lookup(key)[0] == "Contract # 1234567"
+
+
+def test_variant_keys():
+    img = page(ink=[(10, 10, 20, 80)])
+    base = page_variant("full", 100, False, "tesserocr")
+    others = [
+        page_variant("fields", 100, False, "tesserocr"),
+        page_variant("full", 200, False, "tesserocr"),
+        page_variant("full", 100, True, "tesserocr"),
+        page_variant("full", 100, False, "pytesseract"),
+        page_variant("full", 100, False, "tesserocr", {"VIN": [0.1, 0.1, 0.5, 0.2]}),
+    ]
+    keys = {exact_hash(img, variant) for variant in [base] + others}
+    assert len(keys) == len(others) + 1
+    assert page_variant("full", 100, False, "tesserocr", {"A": [0, 0, 1, 1], "B": [0, 0, 1, 1]}) == page_variant(
+        "full", 100, False, "tesserocr", {"B": [0, 0, 1, 1], "A": [0, 0, 1, 1]}
+    )
+    # Same pixel count, different shape
+    assert exact_hash(page(200, 300), base) != exact_hash(page(300, 200), base)
+
+
+def test_blank_detection():
+    assert is_blank_page(page())
+    assert is_blank_page(page(ink=[(50, 50, 52, 52), (100, 100, 101, 101)]))  # Scanner speckle
+    assert not is_blank_page(page(ink=[(10, 10, 20, 80)]))  # A line of text
+    # The ink allowance scales with the page area: a mark that is text at 100 DPI is speckle at 300 DPI
+    assert not is_blank_page(page(ink=[(10, 10, 20, 20)]), dpi=100)
+    assert is_blank_page(page(ink=[(10, 10, 20, 20)]), dpi=300)
+    assert is_blank_page(page()[:, :, None])
+
+
+def test_eviction_keeps_recent_pages(tmp_path):
+    entry = PAGE_CACHE_ENTRY_OVERHEAD + 10
+    cache = PageCache(str(tmp_path / "cache.sqlite3"), max_bytes=5 * entry)
+    for n in range(5):
+        cache.put(f"k{n}", "v", "x" * 10)
+    cache.lookup("k0")  # Recently used, so kept
+    cache.put("k5", "v", "x" * 10)
+
+    assert cache.lookup("k0")[1] == HIT_EXACT
+    assert cache.lookup("k1")[1] == MISS
+    assert cache.stats()["Bytes"] <= 5 * entry
+    assert cache.stats()["Evictions"] >= 1
@@ -0,0 +1,76 @@
+import pytest
+
+from app.services.query_cache import QueryCache, normalize_criteria, query_cache
+from app.services.query_plan import compile_query
+from app.services.search import cached_match_with_index
+from app.services.search_index import add_document, connect, get_generation, remove_documents
+
+
+def test_hits_misses_and_read_only_results():
+    cache = QueryCache()
+    assert cache.get("k") is None
+    stored = cache.put("k", {"a.pdf": ("Contract # exact: 1234567",)})
+    assert cache.get("k") is stored
+    with pytest.raises(TypeError):
+        stored["b.pdf"] = ()
+    assert (cache.stats()["Hits"], cache.stats()["Misses"]) == (1, 1)
+
+
+def test_least_recently_used_is_evicted():
+    cache = QueryCache(max_entries=2)
+    cache.put("a", {"a.pdf": ()})
+    cache.put("b", {"b.pdf": ()})
+    cache.get("a")
+    cache.put("c", {"c.pdf": ()})
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.stats()["Evictions"] == 1
+
+
+def test_byte_budget_and_expiry():
+    cache = QueryCache(max_bytes=2000)
+    cache.put("big", {f"{n}.pdf": () for n in range(100)})  # Larger than the whole budget: not kept
+    assert cache.get("big") is None
+
+    expired = QueryCache(ttl_seconds=-1)
+    expired.put("k", {"a.pdf": ()})
+    assert expired.get("k") is None
+    assert expired.stats()["Expirations"] == 1
+
+
+def test_equivalent_criteria_share_a_key():
+    assert normalize_criteria({"VIN": " 1hgcm82633a004352 ", "Dealer": "ACME"}) == normalize_criteria(
+        {"Dealer": "acme", "VIN": "1HGCM82633A004352"}
+    )
+    assert normalize_criteria({"Contract": "1234567"}) != normalize_criteria({"Contract": "1234568"})
+
+
+def test_ingest_invalidates_cached_results(tmp_path):
+    folder = str(tmp_path)
+    conn = connect(folder)
+    add_document(conn, "a.pdf", ["Engine checked"])
+    conn.commit()
+    plan = compile_query({"Search by Word": "engine"}, None, {"Search by Word": "ignorecase"})
+
+    matches, cached = cached_match_with_index(plan, folder)
+    assert (sorted(matches), cached) == (["a.pdf"], False)
+    assert cached_match_with_index(plan, folder)[1]
+
+    generation = get_generation(conn)
+    add_document(conn, "b.pdf", ["engine replaced"])
+    conn.commit()
+    assert get_generation(conn) > generation
+    matches, cached = cached_match_with_index(plan, folder)
+    assert (sorted(matches), cached) == (["a.pdf", "b.pdf"], False)
+
+    remove_documents(conn, ["a.pdf"])
+    conn.commit()
+    matches, cached = cached_match_with_index(plan, folder)
+    assert (sorted(matches), cached) == (["b.pdf"], False)
+
+    # Removing a document that is not indexed changes nothing
+    remove_documents(conn, ["missing.pdf"])
+    conn.commit()
+    assert cached_match_with_index(plan, folder)[1]
+    conn.close()
+    query_cache.clear()
@@ -0,0 +1,99 @@
+import pytest
+
+from app.Exception.InvalidQueryException import InvalidQueryException
+from app.services.query_plan import compile_query, iter_matching_documents
+from app.services.search_index import add_document, connect
+
+VIN = "1HGCM82633A004352"
+
+CORPUS = {
+    # The VIN ends the document: the VIN patterns read on across line breaks
+    "a.pdf": ["Dealer: ACME MOTORS\nContract # 1234567\n", f"Front brake pads replaced\nVIN: {VIN}"],
+    "b.pdf": ["Dealer: BETA AUTO\nClaim # 7654321\n", "Engine brakes checked"],
+    "c.pdf": ["Dealer: ACME MOTORS WEST\nContract # 9999999\n", "Nothing to report"],
+}
+
+
+@pytest.fixture(scope="module")
+def index(tmp_path_factory):
+    folder = str(tmp_path_factory.mktemp("index"))
+    conn = connect(folder)
+    for filename, pages in CORPUS.items():
+        add_document(conn, filename, pages)
+    conn.commit()
+    yield conn, folder
+    conn.close()
+
+
+def index_matches(index, plan):
+    conn, folder = index
+    return set(plan.evaluate_index(conn, folder))
+
+
+def scan_matches(plan):
+    return {filename for filename, _, _ in iter_matching_documents(plan, CORPUS.items())}
+
+
+CASES = [
+    # (fields, operator, match modes, expected documents)
+    ({"Contract #": "1234567", "Claim #": "7654321"}, None, None, {"a.pdf", "b.pdf"}),
+    ({"Contract #": "1234567", "Claim #": "7654321"}, "and", None, set()),
+    ({"Dealer Name": "acme", "Search by Word": "brake"}, "and", None, {"a.pdf"}),
+    ({"Dealer Name": "acme"}, None, None, {"a.pdf", "c.pdf"}),
+    ({"Dealer Name": "acme motors"}, None, {"Dealer Name": "exact"}, {"a.pdf"}),
+    ({"Search by Word": "brake"}, None, None, {"a.pdf", "b.pdf"}),
+    ({"Search by Word": "brake"}, None, {"Search by Word": "word"}, {"a.pdf"}),
+    ({"Search by Word": "ENGINE"}, None, None, set()),
+    ({"Search by Word": "ENGINE"}, None, {"Search by Word": "ignorecase"}, {"b.pdf"}),
+    ({"Contract #": "45"}, None, {"Contract #": "contains"}, {"a.pdf"}),
+    ({"Contract #": "45"}, None, None, set()),  # Too short to be a contract number
+    ({"Contract #": "123", "Dealer Name": "beta"}, "and", None, set()),
+    ({"Contract #": "123", "Dealer Name": "beta"}, "or", None, {"b.pdf"}),
+    ({"VIN": VIN}, None, {"VIN": "exact"}, {"a.pdf"}),
+    ({"VIN": VIN[:-1] + "9"}, None, None, {"a.pdf"}),  # One misread character
+    ({"VIN": VIN[:-1] + "9"}, None, {"VIN": "exact"}, set()),
+]
+
+
+@pytest.mark.parametrize("fields, operator, modes, expected", CASES)
+def test_index_and_scan_agree(index, fields, operator, modes, expected):
+    plan = compile_query(fields, operator, modes)
+    assert index_matches(index, plan) == expected
+    assert scan_matches(plan) == expected
+
+
+def test_reasons_follow_plan_order(index):
+    plan = compile_query({"Search by Word": "brake", "Contract #": "1234567"}, "or")
+    conn, folder = index
+    reasons = plan.evaluate_index(conn, folder)
+    # With OR, text is not verified for documents a cheaper predicate already matched
+    assert reasons["a.pdf"] == ("Contract # exact: 1234567",)
+    assert reasons["b.pdf"] == ("Search by Word contains: brake",)
+    found, _ = plan.scan(CORPUS["a.pdf"])
+    assert found == ("Contract # exact: 1234567", "Search by Word contains: brake")
+    assert plan.merge_reasons(found, reasons["a.pdf"]) == found
+
+
+def test_scan_hits_carry_page_and_snippet():
+    plan = compile_query({"Search by Word": "brake", "Claim #": "7654321"})
+    reasons, hits = plan.scan(CORPUS["b.pdf"])
+    assert reasons == ("Claim # exact: 7654321", "Search by Word contains: brake")
+    fields = {field: (page_no, start, end, snippet) for field, page_no, start, end, snippet in hits}
+
+    page_no, start, end, snippet = fields["searchbyany"]
+    assert page_no == 1
+    assert CORPUS["b.pdf"][1][start:end] == "brake"
+    assert "Engine brakes checked" in snippet
+
+    page_no, start, end, _ = fields["Claim"]
+    assert page_no == 0 and CORPUS["b.pdf"][0][start:end] == "7654321"
+
+
+@pytest.mark.parametrize("operator, modes", [
+    ("xor", None),
+    (None, {"VIN": "word"}),
+    (None, {"Color": "exact"}),
+])
+def test_invalid_queries(operator, modes):
+    with pytest.raises(InvalidQueryException):
+        compile_query({"VIN": VIN}, operator, modes)
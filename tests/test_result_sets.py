@@ -0,0 +1,67 @@
+import pytest
+
+from app.Exception.InvalidQueryException import InvalidQueryException
+from app.services.result_sets import ResultSetRegistry, decode_cursor, encode_cursor
+
+FILES = [f"{n:03d}.pdf" for n in range(25)]
+
+
+def all_pages(result_set, limit):
+    pages, cursor = [], None
+    while True:
+        files, cursor = result_set.page(cursor, limit)
+        pages.append(files)
+        if cursor is None:
+            return pages
+
+
+@pytest.mark.parametrize("limit", [1, 7, 10, 25, 100])
+def test_pages_cover_every_file_once(limit):
+    result_set = ResultSetRegistry().create("/in", reversed(FILES), {})
+    pages = all_pages(result_set, limit)
+    assert [f for page in pages for f in page] == FILES
+    assert all(len(page) == limit for page in pages[:-1])
+    assert 0 < len(pages[-1]) <= limit
+
+
+def test_cursor_is_the_last_file_of_the_page():
+    result_set = ResultSetRegistry().create("/in", FILES, {})
+    files, cursor = result_set.page(limit=10)
+    assert decode_cursor(cursor) == files[-1] == "009.pdf"
+    # A cursor names a position, not a page number: any file name resumes right after it
+    assert result_set.page(encode_cursor("012.pdf"), 2)[0] == ["013.pdf", "014.pdf"]
+    assert result_set.page(encode_cursor("zzz.pdf"), 2) == ([], None)
+
+
+def test_cursor_round_trip_is_url_safe():
+    name = "claim ü/+?=.pdf"
+    cursor = encode_cursor(name)
+    assert "=" not in cursor and "/" not in cursor and "+" not in cursor
+    assert decode_cursor(cursor) == name
+
+
+@pytest.mark.parametrize("cursor", ["!!!", "a", "//8"])
+def test_invalid_cursor(cursor):
+    with pytest.raises(InvalidQueryException):
+        decode_cursor(cursor)
+
+
+@pytest.mark.parametrize("limit", [0, -1, 1001])
+def test_invalid_limit(limit):
+    result_set = ResultSetRegistry().create("/in", FILES, {})
+    with pytest.raises(InvalidQueryException):
+        result_set.page(limit=limit)
+
+
+def test_registry_bounds_and_expiry():
+    registry = ResultSetRegistry(max_entries=2)
+    first = registry.create("/in", ["a.pdf"], {})
+    second = registry.create("/in", ["b.pdf"], {})
+    third = registry.create("/in", ["c.pdf"], {})
+    assert registry.get(first.result_set_id) is None
+    assert registry.get(second.result_set_id) is second
+    assert registry.latest() is third
+
+    expired = ResultSetRegistry(ttl_seconds=-1)
+    result_set = expired.create("/in", ["a.pdf"], {})
+    assert expired.get(result_set.result_set_id) is None
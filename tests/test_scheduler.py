@@ -0,0 +1,153 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+fitz = pytest.importorskip("fitz")
+pytest.importorskip("cv2")
+
+from app.services import scheduler  # noqa: E402
+from app.services.page_cache import PageCache  # noqa: E402
+from app.services.extractor import ROUTE_OCR, ROUTE_TEXT  # noqa: E402
+
+TEXT = "Contract # 1234567 Claim # 7654321 Dealer: ACME MOTORS, VIN 1HGCM82633A004352"
+
+
+def make_pdf(path, widths, text_pages=(), ink=False):
+    """A PDF whose text-less pages differ only in width, so each page's OCR result identifies the page."""
+    doc = fitz.open()
+    for page_no, width in enumerate(widths):
+        page = doc.new_page(width=width, height=200)
+        if page_no in text_pages:
+            page.insert_text((10, 20), TEXT, fontsize=4)
+        elif ink:
+            page.draw_rect(fitz.Rect(10, 10, 60, 30), color=(0, 0, 0), fill=(0, 0, 0))
+    doc.save(str(path))
+    doc.close()
+
+
+def rendered_width(width):
+    doc = fitz.open()
+    doc.new_page(width=width, height=200)
+    pix = doc.load_page(0).get_pixmap(dpi=scheduler.DPI, colorspace=fitz.csGRAY)
+    doc.close()
+    return str(pix.w)
+
+
+@pytest.fixture
+def fake_ocr(monkeypatch):
+    """OCR in threads instead of Tesseract processes: a page's 'text' is its rendered width."""
+    pool = ThreadPoolExecutor(max_workers=4)
+    rng = random.Random(7)
+    state = {"in_flight": 0, "peak": 0, "lock": threading.Lock()}
+
+    def timed_ocr(img, adaptive=False):
+        time.sleep(rng.random() / 100)  # Finish out of order
+        with state["lock"]:
+            state["in_flight"] -= 1
+        return str(img.shape[1]), 0.0
+
+    def timed_pixmaps(pixmaps):
+        for item in pixmaps:
+            with state["lock"]:
+                state["in_flight"] += 1
+                state["peak"] = max(state["peak"], state["in_flight"])
+            yield item
+
+    monkeypatch.setattr(scheduler, "get_ocr_pool", lambda: pool)
+    monkeypatch.setattr(scheduler, "_timed_ocr", timed_ocr)
+    monkeypatch.setattr(scheduler, "_timed_pixmaps", timed_pixmaps)
+    monkeypatch.setattr(scheduler, "_engine_name", lambda: "fake")
+    yield state
+    pool.shutdown(wait=True)
+
+
+def test_pages_keep_their_order(tmp_path, fake_ocr):
+    widths = {f"{name}.pdf": [100 + 10 * i + 50 * n for i in range(6)] for n, name in enumerate("abc")}
+    for filename, page_widths in widths.items():
+        make_pdf(tmp_path / filename, page_widths, text_pages={0} if filename == "b.pdf" else ())
+
+    ocr_scheduler = scheduler.OcrScheduler(preprocess_workers=2, ocr_workers=3, adaptive=False)
+    results = {}
+    for filename, texts, routes in ocr_scheduler.run((f, str(tmp_path / f)) for f in widths):
+        assert filename not in results
+        results[filename] = texts, routes
+
+    assert set(results) == set(widths)
+    for filename, page_widths in widths.items():
+        texts, routes = results[filename]
+        expected = [rendered_width(width) for width in page_widths]
+        if filename == "b.pdf":
+            assert "1234567" in texts[0]
+            assert routes == [ROUTE_TEXT] + [ROUTE_OCR] * 5
+            assert texts[1:] == expected[1:]
+        else:
+            assert texts == expected
+            assert routes == [ROUTE_OCR] * 6
+    assert ocr_scheduler.failed_pages == {}
+
+
+def test_rendering_is_bounded_by_the_queues(tmp_path, fake_ocr):
+    filenames = []
+    for n in range(3):
+        make_pdf(tmp_path / f"{n}.pdf", [100 + i for i in range(12)])
+        filenames.append(f"{n}.pdf")
+
+    ocr_scheduler = scheduler.OcrScheduler(
+        preprocess_workers=1, ocr_workers=2, render_queue_size=1, ocr_queue_size=1, adaptive=False
+    )
+    done = [filename for filename, _, _ in ocr_scheduler.run((f, str(tmp_path / f)) for f in filenames)]
+
+    assert sorted(done) == filenames
+    # Pages rendered but not yet OCR'd: one waiting in each queue slot, one held by each preprocess
+    # and OCR thread, and one in the render thread waiting for the render queue
+    assert fake_ocr["in_flight"] == 0
+    assert fake_ocr["peak"] <= 1 + 1 + 1 + 2 + 1
+
+
+def test_unreadable_document(tmp_path, fake_ocr):
+    (tmp_path / "broken.pdf").write_bytes(b"not a pdf")
+    make_pdf(tmp_path / "ok.pdf", [120])
+
+    results = dict(
+        (filename, texts)
+        for filename, texts, _ in scheduler.OcrScheduler(adaptive=False).run(
+            [("broken.pdf", str(tmp_path / "broken.pdf")), ("ok.pdf", str(tmp_path / "ok.pdf"))]
+        )
+    )
+    assert results == {"broken.pdf": None, "ok.pdf": [rendered_width(120)]}
+
+
+def test_page_cache_is_keyed_on_the_engine(tmp_path, fake_ocr, monkeypatch):
+    make_pdf(tmp_path / "a.pdf", [120, 140], ink=True)
+    cache = PageCache(str(tmp_path / "page_cache.sqlite3"))
+
+    def run(engine):
+        monkeypatch.setattr(scheduler, "_engine_name", lambda: engine)
+        ocr_scheduler = scheduler.OcrScheduler(adaptive=False, page_cache=cache)
+        (_, texts, _), = ocr_scheduler.run([("a.pdf", str(tmp_path / "a.pdf"))])
+        return ocr_scheduler, texts
+
+    first, texts = run("tesserocr")
+    again, cached = run("tesserocr")
+    other, _ = run("pytesseract")
+
+    assert texts == [rendered_width(120), rendered_width(140)]
+    assert first.skipped == {"blank": 0, "cached": 0}
+    assert again.skipped == {"blank": 0, "cached": 2} and cached == texts
+    # Text OCR'd by one engine is not reused for another
+    assert other.skipped == {"blank": 0, "cached": 0}
+    assert ":tesserocr:" in first.variant and ":pytesseract:" in other.variant
+
+
+def test_blank_pages_skip_ocr(tmp_path, fake_ocr):
+    make_pdf(tmp_path / "a.pdf", [120, 140])
+    ocr_scheduler = scheduler.OcrScheduler(
+        adaptive=False, page_cache=PageCache(str(tmp_path / "page_cache.sqlite3"))
+    )
+    (_, texts, _), = ocr_scheduler.run([("a.pdf", str(tmp_path / "a.pdf"))])
+
+    assert texts == ["", ""]
+    assert ocr_scheduler.skipped == {"blank": 2, "cached": 0}
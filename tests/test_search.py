@@ -0,0 +1,40 @@
+import sqlite3
+
+import pytest
+
+from app.Exception.NoMatchFoundException import NoMatchFoundException
+from app.services import search
+from app.services.storage import open_store
+
+
+@pytest.fixture
+def folder(tmp_path):
+    store = open_store(str(tmp_path))
+    for i in range(6):
+        store.put(f"{i}.pdf", [f"Contract # {1000000 + i}\n", "engine checked" if i % 2 else "nothing to report"])
+    return str(tmp_path)
+
+
+@pytest.mark.parametrize("workers", [0, 2])
+def test_plan_matches_and_document_count(folder, workers):
+    plan, matches, documents = search.search_claim_matches(
+        {"Search by Word": "engine"}, "in", folder, search_workers=workers
+    )
+    assert [filename for filename, _, _ in matches] == ["1.pdf", "3.pdf", "5.pdf"]
+    assert documents == 6
+    assert [predicate.field for predicate in plan.predicates] == ["searchbyany"]
+
+
+def test_document_count_without_the_index(folder, monkeypatch):
+    def unavailable(output_json_folder):
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(search, "ensure_index", unavailable)
+    _, matches, documents = search.search_claim_matches({"Contract #": "1000004"}, "in", folder, search_workers=0)
+    assert [filename for filename, _, _ in matches] == ["4.pdf"]
+    assert documents == 6
+
+
+def test_no_match(folder):
+    with pytest.raises(NoMatchFoundException):
+        search.search_claim_matches({"Search by Word": "transmission"}, "in", folder, search_workers=0)
@@ -0,0 +1,62 @@
+from app.services.storage import DocumentStore
+
+
+def test_round_trip(tmp_path):
+    store = DocumentStore(str(tmp_path), codec="zlib")
+    pages = ["Contract # 1234567\n", "", "ünïcode ✓ text"]
+    store.put("a.pdf", pages, ["text", "ocr", "ocr"])
+    store.put("b.pdf", ["other"])
+
+    assert store.get("a.pdf") == pages
+    assert store.get_page("a.pdf", 2) == pages[2]
+    assert store.page_count("a.pdf") == 3
+    assert store.routes("a.pdf") == ["text", "ocr", "ocr"]
+    assert store.routes("b.pdf") is None
+    assert sorted(store.filenames()) == ["a.pdf", "b.pdf"]
+
+
+def test_uncompressed_codec(tmp_path):
+    store = DocumentStore(str(tmp_path), codec="none")
+    store.put("a.pdf", ["plain"])
+    assert store.get("a.pdf") == ["plain"]
+
+
+def test_replace_and_remove(tmp_path):
+    store = DocumentStore(str(tmp_path))
+    store.put("a.pdf", ["old"])
+    store.put("a.pdf", ["new"])
+    store.put("b.pdf", ["kept"])
+    store.remove(["a.pdf", "missing.pdf"])
+
+    assert "a.pdf" not in store
+    assert len(store) == 1
+    try:
+        store.get("a.pdf")
+    except KeyError:
+        pass
+    else:
+        raise AssertionError("a removed document is still readable")
+
+
+def test_reopen_and_other_writer(tmp_path):
+    writer = DocumentStore(str(tmp_path))
+    writer.put("a.pdf", ["one"])
+    reader = DocumentStore(str(tmp_path))
+    writer.put("b.pdf", ["two"])
+    writer.put("a.pdf", ["one, again"])
+
+    # A second instance picks up records appended after it opened the store
+    assert dict(reader.iter_documents()) == {"a.pdf": ["one, again"], "b.pdf": ["two"]}
+
+
+def test_shard_rollover_and_compact(tmp_path):
+    store = DocumentStore(str(tmp_path), shard_max_bytes=64)
+    for i in range(5):
+        store.put(f"{i}.pdf", [f"document {i} " * 10])
+    store.put("0.pdf", ["replaced"])
+    assert len(store.shards()) > 1
+
+    assert store.compact() > 0
+    assert store.get("0.pdf") == ["replaced"]
+    assert store.get("4.pdf") == ["document 4 " * 10]
+    assert DocumentStore(str(tmp_path)).get("3.pdf") == ["document 3 " * 10]
@@ -0,0 +1,61 @@
+import random
+
+from app.services.vin_index import (
+    CONFUSION_COST, VIN_MATCH_THRESHOLD, VinIndex, canonical, get_vin_index, ocr_distance, similarity
+)
+
+VIN = "1HGCM82633A004352"
+VIN_CHARS = "ABCDEFGHJKLMNPRSTUVWXYZ0123456789"
+
+
+def test_confusable_characters_are_cheap():
+    assert ocr_distance(VIN, VIN) == 0
+    assert ocr_distance("S5B8", "5S8B") == 4 * CONFUSION_COST
+    assert ocr_distance("O0QD", "0OD0") == 4 * CONFUSION_COST
+    assert ocr_distance("SA", "XA") == 1
+    assert canonical("5B2") == canonical("S8Z")
+
+
+def test_confusable_reads_are_candidates():
+    misread = VIN.replace("8", "B").replace("5", "S").replace("6", "G").replace("2", "Z")  # Five confusions
+    other = "JT2BG22K1W0123456"
+    index = VinIndex({"a.pdf": [VIN], "b.pdf": [other]})
+
+    assert index.search(misread) == [(VIN, similarity(misread, VIN))]
+    assert index.match_documents(misread) == {"a.pdf": similarity(misread, VIN)}
+    # Four ordinary misreads are too far off
+    assert index.search(VIN[:5] + "XYZW" + VIN[9:]) == []
+
+
+def test_filter_keeps_every_match():
+    rng = random.Random(3)
+    vins = ["".join(rng.choice(VIN_CHARS) for _ in range(17)) for _ in range(200)]
+    index = VinIndex({f"{n}.pdf": [vin] for n, vin in enumerate(vins)})
+    swaps = {"S": "5", "B": "8", "Z": "2", "G": "6", "0": "O", "1": "I"}
+    for vin in vins[:20]:
+        query = "".join(swaps.get(ch, ch) for ch in vin)
+        query = query[:8] + rng.choice(VIN_CHARS) + query[9:]
+        scores = ((v, similarity(query, v)) for v in vins)
+        expected = sorted((m for m in scores if m[1] >= VIN_MATCH_THRESHOLD), key=lambda m: (-m[1], m[0]))
+        assert index.search(query) == expected
+        assert vin in dict(expected)
+
+
+def test_best_score_per_document():
+    close, closer = VIN[:-2] + "XX", VIN[:-1] + "X"
+    index = VinIndex({"a.pdf": [close, closer], "b.pdf": [close]})
+    scores = index.match_documents(VIN)
+    assert scores == {"a.pdf": similarity(VIN, closer), "b.pdf": similarity(VIN, close)}
+
+
+def test_rebuilt_only_when_the_signature_changes():
+    loads = []
+
+    def loader():
+        loads.append(1)
+        return {"a.pdf": [VIN]}
+
+    first = get_vin_index("test-index", 1, loader)
+    assert get_vin_index("test-index", 1, loader) is first
+    assert get_vin_index("test-index", 2, loader) is not first
+    assert len(loads) == 2
@@ -0,0 +1,19 @@
+import io
+import zipfile
+
+from app.utils.zip_stream import stream_zip
+
+
+def test_streamed_archive_reads_back(tmp_path):
+    contents = {"a.pdf": b"%PDF-1.4 first", "b.pdf": bytes(range(256)) * 1000}
+    entries = []
+    for name, data in contents.items():
+        path = tmp_path / name
+        path.write_bytes(data)
+        entries.append((str(path), name))
+
+    chunks = list(stream_zip(entries, chunk_size=4096))
+    assert len(chunks) > 1
+    with zipfile.ZipFile(io.BytesIO(b"".join(chunks))) as archive:
+        assert archive.testzip() is None
+        assert {name: archive.read(name) for name in archive.namelist()} == contents